@@ -1,7 +1,7 @@
 import redis
-import json
 import logging
 from .config import Config
+from .vector_codec import encode_vector, decode_vector
 import numpy as np
 from typing import Optional
 from redis.exceptions import RedisError
@@ -19,7 +19,7 @@ class RedisCache:
                 port=Config.REDIS_PORT,
                 db=0,
                 socket_connect_timeout=5,
-                decode_responses=True  # Автоматическое декодирование ответов
+                decode_responses=False  # Векторы хранятся в бинарном виде
             )
             self.client.ping()  # Проверка подключения
         except RedisError as e:
@@ -38,8 +38,7 @@ class RedisCache:
         """
         try:
             ttl = ttl or Config.CACHE_TTL
-            serialized_vector = json.dumps(vector.tolist())
-            self.client.setex(key, ttl, serialized_vector)
+            self.client.setex(key, ttl, self._encode(vector))
             return True
         except (TypeError, redis.DataError) as e:
             logger.warning(f"Ошибка сериализации вектора для ключа {key}: {e}")
@@ -53,22 +52,23 @@ class RedisCache:
             data = self.client.get(key)
             if data:
                 try:
-                    return np.array(json.loads(data))
-                except (json.JSONDecodeError, ValueError) as e:
+                    return self._decode(data)
+                except ValueError as e:
                     logger.warning(f"Ошибка десериализации вектора для ключа {key}: {e}")
             return None
         except RedisError as e:
             logger.warning(f"Ошибка получения данных из кэша для ключа {key}: {e}")
             return None
 
-    def clear_event_cache(self, event_id: int) -> bool:
-        try:
-            key = f"event_vector:{event_id}"
-            deleted = self.client.delete(key)
-            return deleted > 0
-        except RedisError as e:
-            logger.warning(f"Ошибка очистки кэша для event_id={event_id}: {e}")
-            return False
+    @staticmethod
+    def _encode(vector: np.ndarray) -> bytes:
+        """Бинарный формат: заголовок (dim, модель) + float32/float16"""
+        return encode_vector(vector, Config.MODEL_NAME, Config.VECTOR_DTYPE)
+
+    @staticmethod
+    def _decode(data: bytes) -> Optional[np.ndarray]:
+        """Векторы другой модели считаются промахом кэша"""
+        return decode_vector(data, Config.MODEL_NAME)
 
     def clear_all(self) -> bool:
         """
@@ -99,12 +99,9 @@ class RedisCache:
             results = self.client.mget(keys)
             vectors = []
             for data in results:
-                if data:
-                    try:
-                        vectors.append(np.array(json.loads(data)))
-                    except (json.JSONDecodeError, ValueError):
-                        vectors.append(None)
-                else:
+                try:
+                    vectors.append(self._decode(data) if data else None)
+                except ValueError:
                     vectors.append(None)
             return vectors
         except RedisError as e:
@@ -1,24 +1,40 @@
 
 from .vectorizer import Vectorizer
 from .cache import RedisCache
+from .embedding_store import EmbeddingStore, event_text
 from .schemas import Cluster, Event_ML
-from typing import List, Tuple
+from typing import Dict, List, Optional, Tuple
 import numpy as np
 import logging
+import re
 from .config import Config
 
 logger = logging.getLogger(__name__)
 
+_AGE_NUMBER_RE = re.compile(r'\d+')
+
 
 class ClusterService:
 
     def __init__(self):
         self.vectorizer = Vectorizer()
         self.cache = RedisCache()
+        self.embeddings = EmbeddingStore(
+            self.cache.client,
+            Config.MODEL_NAME,
+            ttl=Config.CACHE_TTL,
+            dtype=Config.VECTOR_DTYPE
+        )
         self.cluster_vectors = {}  # {название_кластера: vector}
+        # Нормированная матрица (n_clusters, dim) и имена кластеров в том же порядке
+        self.cluster_names: List[str] = []
+        self.cluster_matrix: Optional[np.ndarray] = None
+        # Верхние границы возраста кластеров, выровненные по строкам матрицы (NaN — без ограничений)
+        self.cluster_index: Dict[str, int] = {}
+        self.cluster_max_age = np.empty(0, dtype=np.float32)
 
     def load_clusters(self, clusters: List[Cluster]):
-        """Vectorizes clusters once and caches them in Redis."""
+        """Vectorizes clusters once, caches them in Redis and builds the scoring matrix."""
         for cluster in clusters:
             try:
                 text = " ".join(cluster.интересы + cluster.предпочтения + cluster.мотивация)
@@ -28,39 +44,154 @@ class ClusterService:
             except Exception as e:
                 logger.error(f"Error vectorization clusters's {cluster.название}: {e}")
 
+        self._build_cluster_matrix(clusters)
+
     def _get_cluster_vector(self, cluster_name: str) -> np.ndarray:
+        if cluster_name in self.cluster_vectors:
+            return self.cluster_vectors[cluster_name]
         cached = self.cache.get_vector(f"cluster_vector:{cluster_name}")
         if cached is not None:
+            self.cluster_vectors[cluster_name] = cached
             return cached
-        if cluster_name in self.cluster_vectors:
-            return self.cluster_vectors[cluster_name]
         raise ValueError(f"Cluster {cluster_name} didn't download")
 
-    def _get_event_vector(self, event: dict) -> np.ndarray:
+    def _build_cluster_matrix(self, clusters: List[Cluster]) -> None:
+        """Stacks cluster vectors into the L2-normalized (n_clusters, dim) float32 matrix."""
+        names, rows, ages = [], [], []
+        for cluster in clusters:
+            try:
+                rows.append(self._get_cluster_vector(cluster.название))
+                names.append(cluster.название)
+                ages.append(self._parse_max_age(cluster.возраст))
+            except Exception as e:
+                logger.warning(f"Skipping cluster {cluster.название} due to an error: {e}")
+
+        if not rows:
+            self.cluster_names, self.cluster_matrix = [], None
+            self.cluster_index = {}
+            self.cluster_max_age = np.empty(0, dtype=np.float32)
+            return
+
+        self.cluster_names = names
+        self.cluster_matrix = self._normalize(np.vstack(rows))
+        self.cluster_index = {name: i for i, name in enumerate(names)}
+        self.cluster_max_age = np.array(ages, dtype=np.float32)
+
+    @staticmethod
+    def _parse_max_age(age_range: Optional[str]) -> float:
+        """
+        Upper bound of a cluster age range like "30–50 лет (с детьми)" — the only
+        bound the age filter uses. Returns nan when the range is missing or malformed.
         """
-        Gets the event vector from the cache or calculates it.
-        :param event: a dictionary with event data (must contain 'id', 'title', 'description', 'tags')
+        if not age_range:
+            return np.nan
+        numbers = _AGE_NUMBER_RE.findall(age_range.replace("лет", ""))
+        if len(numbers) < 2:
+            logger.warning(f"Not enough numbers in age range: {age_range}")
+            return np.nan
+        return float(numbers[1])
+
+    @staticmethod
+    def _parse_age_restriction(age_restriction: Optional[str]) -> Optional[int]:
+        """Parses an event age restriction like "18+"; other formats mean no restriction."""
+        if not age_restriction or not age_restriction.endswith("+"):
+            return None
+        try:
+            return int(age_restriction[:-1])
+        except ValueError:
+            logger.warning(f"Invalid age_restriction format: {age_restriction}")
+            return None
+
+    def _age_mask(self, age_restriction: Optional[str]) -> np.ndarray:
         """
-        event_id = event.get('id')
-        if not event_id:
-            raise ValueError("The event does not contain the required 'id' field")
+        Boolean mask over the cluster matrix rows: True where the cluster is
+        allowed for the event. Clusters without a parsed range are always allowed.
+        """
+        allowed = np.ones(len(self.cluster_names), dtype=bool)
+        min_age_event = self._parse_age_restriction(age_restriction)
+        if min_age_event is None:
+            return allowed
+        # Конфликт: минимальный возраст события > максимального возраста кластера
+        with np.errstate(invalid='ignore'):
+            allowed &= ~(min_age_event > self.cluster_max_age)
+        return allowed
 
-        cached = self.cache.get_vector(f"event_vector:{event_id}")
-        if cached is not None:
-            return cached
+    def _ensure_cluster_matrix(self, clusters: List[Cluster]) -> Tuple[List[str], np.ndarray]:
+        """
+        Returns the prebuilt cluster matrix. On a cold start (load_clusters
+        was not called in this process) it is built from the Redis cache.
+        """
+        if self.cluster_matrix is None:
+            logger.info("Cluster matrix is not built yet, loading cluster vectors from cache")
+            self._build_cluster_matrix(clusters)
+        if self.cluster_matrix is None:
+            raise ValueError("No cluster vectors available")
+        return self.cluster_names, self.cluster_matrix
+
+    @staticmethod
+    def _normalize(matrix: np.ndarray) -> np.ndarray:
+        """L2-normalizes vectors along the last axis (zero vectors stay zero)."""
+        matrix = np.asarray(matrix, dtype=np.float32)
+        norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return matrix / norms
 
+    def _get_event_vector(self, event: dict) -> np.ndarray:
+        """
+        Gets the event vector from the shared embedding store or calculates it.
+        :param event: a dictionary with event data ('title', 'description', 'tags')
+        """
         try:
-            title = event.get('title', '')
-            description = event.get('description', '')
-            tags = event.get('tags', [])
-            text = f"{title} {description} {' '.join(tags)}"
-            vector = self.vectorizer.encode([text])[0]
-            self.cache.set_vector(f"event_vector:{event_id}", vector)
-            return vector
+            return self._get_event_vectors([event])[0]
         except Exception as e:
-            logger.error(f"Event vectorization error {event_id}: {e}")
+            logger.error(f"Event vectorization error {event.get('id', 'unknown')}: {e}")
             raise
 
+    def _get_event_vectors(self, events: List[dict]) -> np.ndarray:
+        """
+        Batch version of _get_event_vector: one MGET for cached vectors,
+        the rest is encoded in Config.BATCH_SIZE chunks and cached.
+        Vectors are keyed by content hash, so the bot reuses them.
+        """
+        return self.embeddings.get_or_encode(
+            [event_text(event) for event in events],
+            lambda texts: self.vectorizer.encode(texts, batch_size=Config.BATCH_SIZE),
+            batch_size=Config.BATCH_SIZE
+        )
+
+    def get_event_vectors(self, events: List[dict]) -> np.ndarray:
+        """
+        Raw (not normalized) embeddings of events, (len(events), dim) float32.
+        Served from the shared embedding store; the sync job writes them to events.embedding.
+        """
+        return self._get_event_vectors(events)
+
+    def get_relevant_clusters_batch(
+        self,
+        events: List[dict],
+        clusters: List[Cluster]
+    ) -> List[List[Tuple[str, float]]]:
+        """
+        Batch version of get_relevant_clusters: all events are encoded together
+        and scored against the cluster matrix with a single matrix multiply.
+        Returns one result list per event, in the input order.
+        """
+        if not events:
+            return []
+
+        try:
+            names, cluster_matrix = self._ensure_cluster_matrix(clusters)
+            event_matrix = self._normalize(self._get_event_vectors(events))
+            similarities = event_matrix @ cluster_matrix.T  # (n_events, n_clusters)
+        except Exception as e:
+            logger.error(f"Error in batch cluster selection for {len(events)} events: {e}")
+            return [[] for _ in events]
+
+        return [
+            self._select_clusters(row, names, event)
+            for event, row in zip(events, similarities)
+        ]
+
     def get_relevant_clusters(
         self,
         event: dict,
@@ -71,97 +202,50 @@ class ClusterService:
         If no clusters pass filters, returns the top-1 by similarity.
         """
         try:
-            event_vec = self._get_event_vector(event)
-
-            scores = []
-            for cluster in clusters:
-                try:
-                    cluster_vec = self._get_cluster_vector(cluster.название)
-                    sim = self.vectorizer.cosine_sim(event_vec, cluster_vec)
-                    scores.append((cluster.название, sim))
-                except Exception as e:
-                    logger.warning(f"Skipping cluster {cluster.название} due to an error: {e}")
-
-            # Фильтрация по возрасту
-            age_restriction = event.get('age_restriction')  # Получаем возраст из 
-            if age_restriction:
-                scores = [
-                    (name, sim) for name, sim in scores
-                    if not self._age_conflict(name, age_restriction, clusters)
-                ]
-
-            # Сортировка по сходству (убывание)
-            sorted_scores = sorted(scores, key=lambda x: x[1], reverse=True)
-
-            # Если после фильтрации остались кластеры — применяем порог и ограничиваем TOP_K
-            if sorted_scores:
-                filtered_scores = [
-                    (name, sim) for name, sim in sorted_scores
-                    if sim > Config.SIMILARITY_THRESHOLD
-                ]
-                # Если есть кластеры выше порога — возвращаем их (до TOP_K)
-                if filtered_scores:
-                    return filtered_scores[:Config.TOP_K]
-                else:
-                    # Если все кластеры ниже порога — возвращаем топ‑1 (даже если сходство низкое)
-                    return [sorted_scores[0]]
-            else:
-                # Если все кластеры отфильтрованы по возрасту — возвращаем топ‑1 по сходству без учёта возраста
-                unfiltered_sorted = sorted(scores, key=lambda x: x[1], reverse=True)
-                return [unfiltered_sorted[0]] if unfiltered_sorted else []
+            names, cluster_matrix = self._ensure_cluster_matrix(clusters)
+            event_vec = self._normalize(self._get_event_vector(event))
+            similarities = cluster_matrix @ event_vec  # (n_clusters,)
+
+            return self._select_clusters(similarities, names, event)
 
         except Exception as e:
             event_id = event.get('id', 'unknown')
             logger.error(f"Error when selecting clusters for event_id={event_id}: {e}")
             return []
-        
 
-    def _age_conflict(
+    def _select_clusters(
         self,
-        cluster_name: str,
-        age_restriction: str,
-        clusters: List[Cluster]
-    ) -> bool:
+        similarities: np.ndarray,
+        names: List[str],
+        event: dict
+    ) -> List[Tuple[str, float]]:
         """
-        Checks if the cluster's age range conflicts with the event's age restriction.
-        Returns True if there is a conflict (event is not suitable for the cluster).
+        Applies the age filter, the similarity threshold and TOP_K to a row of
+        similarities aligned with `names`. The age mask and the threshold are
+        combined into one boolean mask; top-k is taken with argpartition.
         """
-        if not age_restriction or not cluster_name:
-            return False
-
-        # Находим кластер по имени
-        cluster = next(
-            (c for c in clusters if c.название == cluster_name),
-            None
-        )
-        if not cluster or not cluster.возраст:
-            return False
-
-        # Парсим ограничение возраста события (например, "18+")
         try:
-            if age_restriction.endswith("+"):
-                min_age_event = int(age_restriction[:-1])
-            else:
-                return False  # Если формат не "X+", считаем, что ограничений нет
-        except ValueError:
-            logger.warning(f"Invalid age_restriction format: {age_restriction}")
-            return False
+            if similarities.size == 0:
+                return []
+
+            allowed = self._age_mask(event.get('age_restriction'))
+            passing = allowed & (similarities > Config.SIMILARITY_THRESHOLD)
+
+            # Если есть кластеры выше порога — возвращаем их (до TOP_K)
+            if passing.any():
+                masked = np.where(passing, similarities, -np.inf)
+                k = min(Config.TOP_K, int(passing.sum()))
+                top = np.argpartition(-masked, k - 1)[:k]
+                top = top[np.argsort(-masked[top])]  # сортировка по сходству (убывание)
+                return [(names[i], float(similarities[i])) for i in top]
+
+            # Если все кластеры ниже порога — возвращаем топ‑1 (даже если сходство низкое);
+            # если все отфильтрованы по возрасту — топ‑1 по сходству без учёта возраста
+            candidates = similarities if not allowed.any() else np.where(allowed, similarities, -np.inf)
+            best = int(np.argmax(candidates))
+            return [(names[best], float(similarities[best]))]
 
-        # Парсим возрастной диапазон кластера (например, "30–50 лет (с детьми)")
-        try:
-            # Удаляем всё после цифр (включая пробелы и текст)
-            cleaned = cluster.возраст.replace("лет", "")
-            # Ищем числа через регулярное выражение
-            import re
-            numbers = re.findall(r'\d+', cleaned)
-            if len(numbers) < 2:
-                logger.warning(f"Not enough numbers in age range: {cluster.возраст}")
-                return False
-            min_age_cluster = int(numbers[0])
-            max_age_cluster = int(numbers[1])
-        except (ValueError, IndexError) as e:
-            logger.error(f"Error parsing cluster age range {cluster.возраст}: {e}")
-            return False
-
-        # Конфликт: минимальный возраст события > максимального возраста кластера
-        return min_age_event > max_age_cluster
\ No newline at end of file
+        except Exception as e:
+            event_id = event.get('id', 'unknown')
+            logger.error(f"Error when selecting clusters for event_id={event_id}: {e}")
+            return []
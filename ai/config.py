@@ -15,6 +15,7 @@ class Config:
 
     # Кеширование
     CACHE_TTL = config("CACHE_TTL", default=604800, cast=int)  # 7 дней
+    VECTOR_DTYPE = config("VECTOR_DTYPE", default="float32")  # float32 | float16
 
     # Параметры обработки
     BATCH_SIZE = config("BATCH_SIZE", default=32, cast=int)
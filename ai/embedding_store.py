@@ -0,0 +1,103 @@
+import hashlib
+import logging
+import unicodedata
+from typing import Callable, Dict, List, Optional, Sequence
+
+import numpy as np
+from redis.exceptions import RedisError
+
+from .vector_codec import encode_vector, decode_vector
+
+logger = logging.getLogger(__name__)
+
+
+def event_text(event: dict) -> str:
+    """Text that is embedded for an event; shared by the sync job and the bot."""
+    title = event.get('title') or ''
+    description = event.get('description') or ''
+    tags = event.get('tags') or []
+    return f"{title} {description} {' '.join(tags)}"
+
+
+def normalize_text(text: str) -> str:
+    """NFC + collapsed whitespace, so cosmetic differences map to the same key."""
+    return " ".join(unicodedata.normalize("NFC", text).split())
+
+
+class EmbeddingStore:
+    """
+    Redis-backed embedding cache shared by the sync job and the bot.
+    Keys: emb:{model_name}:{blake2b(normalized text)}; values: vector_codec binary format.
+    """
+
+    def __init__(
+        self,
+        client,
+        model_name: str,
+        ttl: Optional[int] = None,
+        dtype: str = "float32"
+    ):
+        # client — синхронный redis.Redis с decode_responses=False
+        self.client = client
+        self.model_name = model_name
+        self.ttl = ttl
+        self.dtype = dtype
+
+    def key(self, text: str) -> str:
+        digest = hashlib.blake2b(normalize_text(text).encode("utf-8"), digest_size=16).hexdigest()
+        return f"emb:{self.model_name}:{digest}"
+
+    def get_many(self, texts: Sequence[str]) -> List[Optional[np.ndarray]]:
+        """One MGET for all texts; misses and undecodable values are None."""
+        if not texts:
+            return []
+        try:
+            values = self.client.mget([self.key(t) for t in texts])
+        except RedisError as e:
+            logger.warning(f"Ошибка чтения эмбеддингов из Redis: {e}")
+            return [None] * len(texts)
+        return [decode_vector(v, self.model_name) if v else None for v in values]
+
+    def set_many(self, vectors: Dict[str, np.ndarray]) -> bool:
+        """Stores {text: vector} with one pipeline."""
+        if not vectors:
+            return True
+        try:
+            pipe = self.client.pipeline(transaction=False)
+            for text, vector in vectors.items():
+                value = encode_vector(vector, self.model_name, self.dtype)
+                if self.ttl:
+                    pipe.setex(self.key(text), self.ttl, value)
+                else:
+                    pipe.set(self.key(text), value)
+            pipe.execute()
+            return True
+        except RedisError as e:
+            logger.warning(f"Ошибка сохранения эмбеддингов в Redis: {e}")
+            return False
+
+    def get_or_encode(
+        self,
+        texts: Sequence[str],
+        encode: Callable[[List[str]], np.ndarray],
+        batch_size: int = 32
+    ) -> np.ndarray:
+        """
+        Returns a (len(texts), dim) float32 matrix. Cached vectors are read in
+        one round trip, the misses are encoded in batch_size chunks and stored.
+        """
+        vectors = self.get_many(texts)
+        missing = [i for i, vec in enumerate(vectors) if vec is None]
+
+        for start in range(0, len(missing), batch_size):
+            chunk = missing[start:start + batch_size]
+            encoded = encode([texts[i] for i in chunk])
+            fresh = {}
+            for i, vec in zip(chunk, encoded):
+                vectors[i] = np.asarray(vec, dtype=np.float32)
+                fresh[texts[i]] = vectors[i]
+            self.set_many(fresh)
+
+        if not vectors:
+            return np.empty((0, 0), dtype=np.float32)
+        return np.vstack(vectors).astype(np.float32, copy=False)
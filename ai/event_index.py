@@ -0,0 +1,98 @@
+import logging
+from typing import Callable, Dict, List, Optional, Sequence
+
+import numpy as np
+
+from .embedding_store import EmbeddingStore, event_text
+
+logger = logging.getLogger(__name__)
+
+
+class EventEmbeddingIndex:
+    """
+    In-process index of event embeddings: an L2-normalized float32 matrix plus
+    an id array, so cosine scores for any set of events are one matrix-vector product.
+
+    Vectors come from the shared EmbeddingStore (one MGET per build), the index
+    is rebuilt off the event loop and swapped in atomically.
+    """
+
+    def __init__(self, store: EmbeddingStore):
+        self.store = store
+        self._matrix = np.empty((0, 0), dtype=np.float32)
+        self._rows: Dict[int, int] = {}
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    @staticmethod
+    def _normalize(matrix: np.ndarray) -> np.ndarray:
+        norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return matrix / norms
+
+    def build(
+        self,
+        events: Sequence[dict],
+        encode: Optional[Callable[[List[str]], np.ndarray]] = None,
+        batch_size: int = 32
+    ) -> int:
+        """
+        Replaces the index with the given events (id, title, description, tags).
+        Without encode, events whose vector is not in Redis yet are skipped;
+        with it, they are encoded and stored like EmbeddingStore.get_or_encode.
+        Returns the number of indexed events.
+        """
+        texts = [event_text(ev) for ev in events]
+        if encode is not None:
+            matrix = self.store.get_or_encode(texts, encode, batch_size)
+            ids = [int(ev["id"]) for ev in events]
+        else:
+            ids, vectors = [], []
+            for ev, vec in zip(events, self.store.get_many(texts)):
+                if vec is not None:
+                    ids.append(int(ev["id"]))
+                    vectors.append(vec)
+            matrix = np.vstack(vectors) if vectors else np.empty((0, 0), dtype=np.float32)
+
+        if len(ids) and matrix.ndim == 2 and matrix.shape[0] == len(ids):
+            matrix = self._normalize(matrix.astype(np.float32, copy=False))
+        else:
+            ids, matrix = [], np.empty((0, 0), dtype=np.float32)
+
+        # Readers see either the old or the new index, never a mix
+        self._matrix, self._rows = matrix, {event_id: row for row, event_id in enumerate(ids)}
+        logger.info(f"Event index rebuilt: {len(ids)} of {len(events)} events")
+        return len(ids)
+
+    def vector(self, event_id: int) -> Optional[np.ndarray]:
+        """Normalized embedding of one event, or None if it is not in the index."""
+        matrix, rows = self._matrix, self._rows
+        row = rows.get(int(event_id))
+        return None if row is None else matrix[row]
+
+    def scores(self, query: np.ndarray, event_ids: Sequence[int]) -> np.ndarray:
+        """
+        Cosine similarity of query to each event; NaN for events not in the index.
+        """
+        matrix, rows = self._matrix, self._rows
+        result = np.full(len(event_ids), np.nan, dtype=np.float32)
+        positions, found = [], []
+        for i, event_id in enumerate(event_ids):
+            row = rows.get(int(event_id))
+            if row is not None:
+                positions.append(i)
+                found.append(row)
+        if not found:
+            return result
+
+        query = np.asarray(query, dtype=np.float32).ravel()
+        if query.shape[0] != matrix.shape[1]:
+            logger.warning(f"Query dim {query.shape[0]} does not match index dim {matrix.shape[1]}")
+            return result
+        norm = np.linalg.norm(query)
+        if norm == 0:
+            result[positions] = 0.0
+            return result
+        result[positions] = matrix[found] @ (query / norm)
+        return result
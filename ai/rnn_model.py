@@ -0,0 +1,85 @@
+import logging
+import os
+import tempfile
+from typing import Optional
+
+import numpy as np
+import torch
+import torch.nn as nn
+from torch.nn.utils.rnn import pack_padded_sequence
+
+logger = logging.getLogger(__name__)
+
+# Weight of an event embedding in a history sequence, by the user's action
+ACTION_WEIGHTS = {"like": 1.0, "confirmed": 1.0, "dislike": -0.3}
+
+
+class RNNModel(nn.Module):
+    """
+    LSTM over a user's weighted event embeddings; predicts the embedding of the next event.
+    Shared by the bot (inference) and the training worker (train_rnn_worker.py).
+    """
+
+    def __init__(self, input_size, hidden_size=64, num_layers=2):
+        super().__init__()
+        self.input_size = input_size
+        self.hidden_size = hidden_size
+        self.num_layers = num_layers
+        self.lstm = nn.LSTM(input_size, hidden_size, num_layers, batch_first=True)
+        self.fc = nn.Linear(hidden_size, input_size)
+
+    def forward(self, x, lengths: Optional[torch.Tensor] = None):
+        """
+        :param x: (batch, seq, input_size)
+        :param lengths: real sequence lengths for right-padded batches; without it
+            every row is treated as full length
+        """
+        if lengths is None:
+            out, _ = self.lstm(x)
+            return self.fc(out[:, -1, :])
+        packed = pack_padded_sequence(x, lengths.cpu(), batch_first=True, enforce_sorted=False)
+        _, (h_n, _) = self.lstm(packed)
+        # Last layer's hidden state at each row's last real step
+        return self.fc(h_n[-1])
+
+
+def predict_next(model: RNNModel, vectors: np.ndarray) -> np.ndarray:
+    """Predicted next-event embedding for one weighted history of shape (seq, input_size)."""
+    x = torch.as_tensor(np.asarray(vectors, dtype=np.float32)).unsqueeze(0)
+    with torch.no_grad():
+        return model(x).numpy().ravel()
+
+
+def save_checkpoint(model: RNNModel, path: str, **meta) -> None:
+    """Writes the weights atomically (temp file + rename), so a reader never sees a partial file."""
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    payload = {
+        "state_dict": model.state_dict(),
+        "input_size": model.input_size,
+        "hidden_size": model.hidden_size,
+        "num_layers": model.num_layers,
+        **meta
+    }
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            torch.save(payload, f)
+        os.replace(tmp_path, path)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def load_checkpoint(path: str) -> RNNModel:
+    """Builds an RNNModel from a checkpoint written by save_checkpoint, in eval mode on CPU."""
+    payload = torch.load(path, map_location="cpu")
+    model = RNNModel(
+        input_size=payload["input_size"],
+        hidden_size=payload["hidden_size"],
+        num_layers=payload["num_layers"]
+    )
+    model.load_state_dict(payload["state_dict"])
+    model.eval()
+    return model
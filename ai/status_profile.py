@@ -0,0 +1,77 @@
+import json
+import logging
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+class CategoryCatalogue:
+    """
+    Fixed order of status_ml categories: the cluster names from clusters.json.
+    A user profile is a float32 array over this order (users.status_vec, real[]).
+    New clusters must be appended to the end of clusters.json, so stored
+    profiles stay valid; shorter stored vectors are padded with zeros.
+    """
+
+    def __init__(self, names: Sequence[str]):
+        self.names: List[str] = list(names)
+        self.index: Dict[str, int] = {name: i for i, name in enumerate(self.names)}
+
+    @classmethod
+    def from_file(cls, path: str) -> "CategoryCatalogue":
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        return cls([item["название"] for item in data])
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def to_vector(self, status_ml) -> np.ndarray:
+        """
+        Dense vector from a status_ml list [{"category", "score"}, ...] (or its JSON string).
+        Categories missing from the catalogue are dropped.
+        """
+        if isinstance(status_ml, str):
+            try:
+                status_ml = json.loads(status_ml)
+            except ValueError:
+                status_ml = []
+        vector = np.zeros(len(self.names), dtype=np.float32)
+        for cluster in status_ml or []:
+            if not isinstance(cluster, dict):
+                continue
+            col = self.index.get(cluster.get("category"))
+            if col is not None:
+                vector[col] += float(cluster.get("score") or 0.0)
+        return vector
+
+    def from_stored(self, stored: Optional[Sequence[float]]) -> Optional[np.ndarray]:
+        """Profile read from users.status_vec; None if the column is not filled yet."""
+        if stored is None:
+            return None
+        vector = np.asarray(stored, dtype=np.float32)
+        if vector.shape[0] < len(self.names):
+            vector = np.pad(vector, (0, len(self.names) - vector.shape[0]))
+        elif vector.shape[0] > len(self.names):
+            logger.warning(f"Stored profile has {vector.shape[0]} categories, catalogue has {len(self.names)}")
+            vector = vector[:len(self.names)]
+        return vector
+
+    def profile(self, stored: Optional[Sequence[float]], legacy_status_ml) -> np.ndarray:
+        """Compatibility reader: users.status_vec if present, otherwise the JSONB status_ml."""
+        vector = self.from_stored(stored)
+        return vector if vector is not None else self.to_vector(legacy_status_ml)
+
+    def to_status_list(self, vector: np.ndarray) -> List[Dict]:
+        """Back to the status_ml list format (non-zero categories only), e.g. for logs."""
+        return [
+            {"category": self.names[i], "score": float(vector[i])}
+            for i in np.flatnonzero(vector)
+        ]
+
+
+def update_profile(profile: np.ndarray, event_vector: np.ndarray, weight: float) -> np.ndarray:
+    """Clipped vector add: the dense form of MLService.update_user_status_ml."""
+    return np.clip(profile + event_vector * weight, 0.0, 1.0).astype(np.float32, copy=False)
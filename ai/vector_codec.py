@@ -0,0 +1,79 @@
+import json
+import struct
+import zlib
+import logging
+from typing import Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Формат: MAGIC | version | dtype | dim | model tag | raw little-endian payload
+MAGIC = b"EV"
+VERSION = 1
+_HEADER = struct.Struct("<2sBBII")
+
+_DTYPES = {
+    0: np.dtype("<f4"),
+    1: np.dtype("<f2"),
+}
+_DTYPE_CODES = {dtype: code for code, dtype in _DTYPES.items()}
+
+
+def model_tag(model_name: str) -> int:
+    """Short model version stamp stored in the header (crc32 of the model name)."""
+    return zlib.crc32(model_name.encode("utf-8"))
+
+
+def encode_vector(vector: np.ndarray, model_name: str, dtype: str = "float32") -> bytes:
+    """
+    Serializes a 1-D vector into the binary cache format.
+    :param dtype: "float32" (default) or "float16" for half the size
+    """
+    np_dtype = np.dtype(dtype).newbyteorder("<")
+    if np_dtype not in _DTYPE_CODES:
+        raise TypeError(f"Unsupported vector dtype: {dtype}")
+    payload = np.ascontiguousarray(vector, dtype=np_dtype).ravel()
+    header = _HEADER.pack(MAGIC, VERSION, _DTYPE_CODES[np_dtype], payload.size, model_tag(model_name))
+    return header + payload.tobytes()
+
+
+def to_pgvector(vector: np.ndarray) -> str:
+    """Text literal of a 1-D vector for a pgvector column ('[0.1,0.2,...]')."""
+    values = np.asarray(vector, dtype=np.float32).ravel()
+    return "[" + ",".join(repr(float(v)) for v in values) + "]"
+
+
+def decode_vector(data: bytes, model_name: Optional[str] = None) -> Optional[np.ndarray]:
+    """
+    Deserializes a cached vector into float32.
+    Returns None if the value is corrupted or was written by another model.
+    Legacy values (JSON list or headerless float32 bytes) are still readable.
+    """
+    if not data:
+        return None
+    if isinstance(data, str):
+        data = data.encode("utf-8")
+
+    if data[:len(MAGIC)] == MAGIC and len(data) >= _HEADER.size:
+        _, version, dtype_code, dim, tag = _HEADER.unpack_from(data)
+        dtype = _DTYPES.get(dtype_code)
+        if version != VERSION or dtype is None:
+            logger.warning(f"Unknown vector format: version={version}, dtype={dtype_code}")
+            return None
+        if len(data) != _HEADER.size + dim * dtype.itemsize:
+            logger.warning(f"Vector payload size mismatch: dim={dim}, bytes={len(data)}")
+            return None
+        if model_name is not None and tag != model_tag(model_name):
+            return None
+        return np.frombuffer(data, dtype=dtype, offset=_HEADER.size).astype(np.float32)
+
+    # Старые значения: JSON от RedisCache или сырые float32 от бота
+    if data[:1] == b"[":
+        try:
+            return np.asarray(json.loads(data), dtype=np.float32)
+        except ValueError:
+            return None
+    if len(data) % 4 == 0:
+        return np.frombuffer(data, dtype=np.float32)
+    return None
@@ -0,0 +1,135 @@
+"""
+Бенчмарк исключения уже оценённых событий из кандидатов рекомендаций.
+
+Сравнивает три варианта одного и того же запроса к upcoming_events_<city>:
+  not_in     — старый: t.id NOT IN (%s, %s, ...) по одному параметру на событие;
+  any_array  — NOT (t.id = ANY(%s::bigint[])) с одним параметром-массивом;
+  anti_join  — NOT EXISTS по user_event_actions (как в боте сейчас).
+
+Синтетический пользователь с --actions действиями создаётся внутри транзакции,
+которая в конце откатывается, — данные в БД не остаются.
+
+Запуск:
+    POSTGRES_URI=postgresql://... python benchmarks/candidate_exclusion.py --city msk --actions 1500
+"""
+import argparse
+import os
+import statistics
+import time
+
+import psycopg
+
+CANDIDATE_SQL = """
+    SELECT t.id, t.title, t.start_datetime, t.favorites_count
+    FROM upcoming_events_{city} t
+    WHERE t.start_datetime >= %s
+    AND t.start_datetime <= %s
+    {exclusion}
+    ORDER BY t.priority, t.favorites_count DESC, t.start_datetime ASC
+    LIMIT %s
+"""
+
+ANTI_JOIN = """
+    AND NOT EXISTS (
+        SELECT 1
+        FROM user_event_actions a
+        WHERE a.user_id = %s
+        AND a.event_id = t.id
+    )
+    AND NOT (t.id = ANY(%s::bigint[]))"""
+
+
+def seed_user(conn, city: str, user_id: int, actions: int) -> list:
+    """Создаёт действия синтетического пользователя: реальные кандидаты + вымышленные ID."""
+    rows = conn.execute(
+        f"SELECT id FROM upcoming_events_{city} ORDER BY priority, favorites_count DESC LIMIT %s",
+        (actions // 2,)
+    ).fetchall()
+    event_ids = [r[0] for r in rows]
+    # Добиваем до нужного объёма ID, которых нет среди кандидатов
+    next_fake = -1
+    while len(event_ids) < actions:
+        event_ids.append(next_fake)
+        next_fake -= 1
+
+    with conn.cursor() as cur:
+        cur.executemany(
+            """
+            INSERT INTO user_event_actions (user_id, event_id, action, timestamp)
+            VALUES (%s, %s, %s, NOW())
+            ON CONFLICT DO NOTHING
+            """,
+            [(user_id, event_id, "dislike" if i % 3 else "like") for i, event_id in enumerate(event_ids)]
+        )
+    conn.execute("ANALYZE user_event_actions")
+    return event_ids
+
+
+def variants(city: str, user_id: int, event_ids: list, window: tuple, limit: int) -> dict:
+    now_ts, future_ts = window
+    not_in = "AND t.id NOT IN ({})".format(", ".join(["%s"] * len(event_ids)))
+    return {
+        "not_in": (
+            CANDIDATE_SQL.format(city=city, exclusion=not_in),
+            (now_ts, future_ts, *event_ids, limit)
+        ),
+        "any_array": (
+            CANDIDATE_SQL.format(city=city, exclusion="AND NOT (t.id = ANY(%s::bigint[]))"),
+            (now_ts, future_ts, event_ids, limit)
+        ),
+        "anti_join": (
+            CANDIDATE_SQL.format(city=city, exclusion=ANTI_JOIN),
+            (now_ts, future_ts, user_id, [], limit)
+        ),
+    }
+
+
+def measure(conn, query: str, params: tuple, runs: int, prepare: bool) -> list:
+    timings = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        conn.execute(query, params, prepare=prepare).fetchall()
+        timings.append((time.perf_counter() - started) * 1000)
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--dsn", default=os.getenv("POSTGRES_URI"))
+    parser.add_argument("--city", default="msk", choices=("msk", "spb"))
+    parser.add_argument("--actions", type=int, default=1500, help="число действий синтетического пользователя")
+    parser.add_argument("--runs", type=int, default=50)
+    parser.add_argument("--limit", type=int, default=50)
+    parser.add_argument("--user-id", type=int, default=-424242)
+    parser.add_argument("--explain", action="store_true", help="вывести EXPLAIN ANALYZE для каждого варианта")
+    args = parser.parse_args()
+
+    if not args.dsn:
+        parser.error("нужен --dsn или POSTGRES_URI")
+
+    now_ts = int(time.time())
+    window = (now_ts, now_ts + 45 * 24 * 3600)
+
+    with psycopg.connect(args.dsn) as conn:
+        try:
+            event_ids = seed_user(conn, args.city, args.user_id, args.actions)
+            print(f"Пользователь {args.user_id}: {len(event_ids)} действий, город {args.city}, запусков {args.runs}\n")
+            print(f"{'вариант':<12}{'prepare':<9}{'median, мс':>12}{'p95, мс':>10}{'строк':>8}")
+
+            for name, (query, params) in variants(args.city, args.user_id, event_ids, window, args.limit).items():
+                rows = len(conn.execute(query, params).fetchall())
+                for prepare in (False, True):
+                    timings = sorted(measure(conn, query, params, args.runs, prepare))
+                    p95 = timings[min(len(timings) - 1, int(len(timings) * 0.95))]
+                    print(f"{name:<12}{str(prepare):<9}{statistics.median(timings):>12.2f}{p95:>10.2f}{rows:>8}")
+
+                if args.explain:
+                    plan = conn.execute(f"EXPLAIN (ANALYZE, BUFFERS) {query}", params).fetchall()
+                    print("\n".join(r[0] for r in plan) + "\n")
+        finally:
+            # Синтетические действия не сохраняем
+            conn.rollback()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,156 @@
+"""
+Проверка, что обученный чекпоинт RNN меняет ранжирование рекомендаций.
+
+История пользователя собирается так же, как в боте (MLService.recommend_scored):
+последние --seq-len действий, векторы событий из events.embedding с весами
+ACTION_WEIGHTS. Кандидаты — события upcoming_events_<city> с эмбеддингом, уже
+оценённые пользователем исключаются. Кандидаты ранжируются по косинусу с
+предсказанием двух моделей:
+  initial    — необученная RNNModel (torch.manual_seed(0)), как у бота до первой
+               загрузки чекпоинта;
+  checkpoint — веса из RNN_CHECKPOINT_PATH (train_rnn_worker.py).
+
+Выводится доля пользователей, у которых изменился top-K, и среднее пересечение top-K.
+Код выхода 1 — чекпоинт не изменил ранжирование ни у одного пользователя.
+
+Запуск:
+    POSTGRES_URI=postgresql://... python benchmarks/rnn_ranking.py --city msk --users 200
+"""
+import argparse
+import os
+import sys
+
+import numpy as np
+import psycopg
+import torch
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ai.rnn_model import ACTION_WEIGHTS, RNNModel, load_checkpoint, predict_next
+
+HISTORY_SQL = """
+    SELECT h.user_id, h.event_id, h.action
+    FROM (
+        SELECT user_id, event_id, action, timestamp,
+               ROW_NUMBER() OVER (PARTITION BY user_id ORDER BY timestamp DESC) AS rn
+        FROM user_event_actions
+        WHERE action = ANY(%s)
+        AND user_id IN (
+            SELECT user_id
+            FROM user_event_actions
+            WHERE action = ANY(%s)
+            GROUP BY user_id
+            HAVING COUNT(*) >= %s
+            ORDER BY MAX(timestamp) DESC
+            LIMIT %s
+        )
+    ) h
+    WHERE h.rn <= %s
+    ORDER BY h.user_id, h.timestamp
+"""
+
+CANDIDATES_SQL = """
+    SELECT u.id, e.embedding::real[]
+    FROM upcoming_events_{city} u
+    JOIN events e ON e.city = %s AND e.id = u.id
+    WHERE e.embedding IS NOT NULL
+"""
+
+EMBEDDINGS_SQL = """
+    SELECT DISTINCT ON (id) id, embedding::real[]
+    FROM events
+    WHERE id = ANY(%s) AND embedding IS NOT NULL
+"""
+
+
+def load_histories(conn, users: int, seq_len: int) -> dict:
+    """{user_id: [(event_id, action), ...]} в хронологическом порядке, пользователи с историей для RNN."""
+    actions = list(ACTION_WEIGHTS)
+    histories = {}
+    rows = conn.execute(HISTORY_SQL, (actions, actions, seq_len // 2, users, seq_len)).fetchall()
+    for user_id, event_id, action in rows:
+        histories.setdefault(user_id, []).append((event_id, action))
+    return histories
+
+
+def top_k(model: RNNModel, history: np.ndarray, candidates: np.ndarray, k: int) -> np.ndarray:
+    """Индексы top-k кандидатов по косинусу с предсказанием модели (как MLService._candidate_scores)."""
+    pred = predict_next(model, history)
+    norm = np.linalg.norm(pred)
+    scores = candidates @ (pred / norm if norm else pred)
+    return np.argsort(-scores, kind="stable")[:k]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--dsn", default=os.getenv("POSTGRES_URI"))
+    parser.add_argument("--city", default="msk", choices=("msk", "spb"))
+    parser.add_argument("--checkpoint", default=os.getenv("RNN_CHECKPOINT_PATH", "/app/data/rnn.pt"))
+    parser.add_argument("--users", type=int, default=200, help="сколько недавно активных пользователей проверить")
+    parser.add_argument("--seq-len", type=int, default=15, help="как Config.RNN_SEQ_LEN у бота")
+    parser.add_argument("--top", type=int, default=12, help="как Config.RECOMMEND_COUNT у бота")
+    args = parser.parse_args()
+
+    if not args.dsn:
+        parser.error("нужен --dsn или POSTGRES_URI")
+    if not os.path.exists(args.checkpoint):
+        parser.error(f"чекпоинт {args.checkpoint} не найден — сначала запустите train_rnn_worker.py")
+
+    trained = load_checkpoint(args.checkpoint)
+    torch.manual_seed(0)
+    initial = RNNModel(input_size=trained.input_size)
+    initial.eval()
+
+    with psycopg.connect(args.dsn) as conn:
+        histories = load_histories(conn, args.users, args.seq_len)
+        event_ids = sorted({event_id for history in histories.values() for event_id, _ in history})
+        embeddings = {
+            event_id: np.asarray(vector, dtype=np.float32)
+            for event_id, vector in conn.execute(EMBEDDINGS_SQL, (event_ids,)).fetchall()
+        }
+        rows = conn.execute(CANDIDATES_SQL.format(city=args.city), (args.city,)).fetchall()
+
+    if not rows:
+        print(f"Нет кандидатов с эмбеддингом в upcoming_events_{args.city}")
+        return 1
+    candidate_ids = np.array([r[0] for r in rows])
+    candidates = np.vstack([np.asarray(r[1], dtype=np.float32) for r in rows])
+    norms = np.linalg.norm(candidates, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    candidates = candidates / norms
+
+    checked, changed, overlaps = 0, 0, []
+    for user_id, history in histories.items():
+        vectors = [
+            embeddings[event_id] * ACTION_WEIGHTS[action]
+            for event_id, action in history
+            if event_id in embeddings
+        ]
+        if len(vectors) < 2:
+            continue
+        sequence = np.vstack(vectors[-(args.seq_len - 1):])
+
+        # Оценённые события бот не показывает — их нет и в сравнении
+        seen = np.isin(candidate_ids, [event_id for event_id, _ in history])
+        pool = candidates[~seen]
+        if not len(pool):
+            continue
+
+        before = top_k(initial, sequence, pool, args.top)
+        after = top_k(trained, sequence, pool, args.top)
+        checked += 1
+        changed += int(not np.array_equal(before, after))
+        overlaps.append(len(np.intersect1d(before, after)) / len(before))
+
+    if not checked:
+        print("Нет пользователей с историей для RNN")
+        return 1
+
+    print(f"Чекпоинт: {args.checkpoint}, город {args.city}, кандидатов {len(candidate_ids)}")
+    print(f"Пользователей: {checked}, top-{args.top} изменился у {changed} ({changed / checked:.0%})")
+    print(f"Среднее пересечение top-{args.top} с необученной моделью: {np.mean(overlaps):.2f}")
+    return 0 if changed else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -31,7 +31,26 @@ class Config:
     # Обязательные параметры
     TELEGRAM_TOKEN: str = env("TELEGRAM_TOKEN", default="").strip()
     DB_DSN: str = env("POSTGRES_URI", default="").strip()
+    # Слой БД бота: async (psycopg 3) | threaded (Database_Users в пуле потоков)
+    DB_BACKEND: str = env("DB_BACKEND", default="async").strip()
+    # Размеры пула соединений (для threaded — ещё и число потоков)
+    DB_POOL_MIN_SIZE: int = env("DB_POOL_MIN_SIZE", default=2, cast=int)
+    DB_POOL_MAX_SIZE: int = env("DB_POOL_MAX_SIZE", default=10, cast=int)
+    DB_PREPARE_THRESHOLD: int = env("DB_PREPARE_THRESHOLD", default=1, cast=int)
+    # Период пересчёта материализованных кандидатов upcoming_events_<city>, минуты
+    UPCOMING_REFRESH_MINUTES: int = env("UPCOMING_REFRESH_MINUTES", default=15, cast=int)
+    # TTL готового списка рекомендаций пользователя в Redis, секунды
+    REC_CACHE_TTL: int = env("REC_CACHE_TTL", default=1800, cast=int)
+    # FSM рекомендаций хранит только id и индекс; карточки — в LRU процесса и Redis event_card:{id}
+    FSM_EVENT_IDS_ONLY: bool = env("FSM_EVENT_IDS_ONLY", default=True, cast=bool)
+    EVENT_CARD_TTL: int = env("EVENT_CARD_TTL", default=21600, cast=int)
+    EVENT_CARD_LRU_SIZE: int = env("EVENT_CARD_LRU_SIZE", default=5000, cast=int)
+    # Чекпоинт RNN от train_rnn_worker.py и период проверки его обновления, минуты
+    RNN_CHECKPOINT_PATH: str = env("RNN_CHECKPOINT_PATH", default="/app/data/rnn.pt").strip()
+    RNN_RELOAD_MINUTES: int = env("RNN_RELOAD_MINUTES", default=10, cast=int)
     ADMIN_IDS: int = env("ADMIN_IDS")
+    # Токен для GET /db_stats (заголовок X-Admin-Token); пустой — маршрут не регистрируется
+    DB_STATS_TOKEN: str = env("DB_STATS_TOKEN", default="").strip()
     # Опциональные параметры с дефолтами
     REDIS_HOST: str = env("REDIS_HOST", default="localhost").strip()
     REDIS_PORT: int = env("REDIS_PORT", default=6379, cast=int)
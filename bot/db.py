@@ -1,5 +1,7 @@
 import random
 import psycopg2
+from psycopg2.extras import RealDictCursor
+from psycopg2.pool import ThreadedConnectionPool
 import json
 from config import Config
 from typing import List, Optional, Dict, Any
@@ -10,6 +12,8 @@ import time
 import pytz  # Для явного указания часового пояса
 from ml import MLService
 import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
 # Настраиваем логгер
 logging.basicConfig(
     level=logging.INFO,
@@ -20,16 +24,227 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# История действий пользователей (user_event_actions)
+MAX_HISTORY = 100
+HISTORY_ACTIONS = ("like", "dislike", "confirmed")
+
+ADD_ACTION_SQL = """
+    INSERT INTO user_event_actions (user_id, event_id, action, timestamp)
+    VALUES (%s, %s, %s, NOW())
+    ON CONFLICT (user_id, event_id, action) DO UPDATE SET timestamp = EXCLUDED.timestamp
+"""
+
+# Последнее действие по каждому событию, затем последние N по времени
+# (индекс idx_user_event_actions_recent по (user_id, timestamp DESC))
+RECENT_ACTIONS_SQL = """
+    SELECT event_id, action, timestamp
+    FROM (
+        SELECT DISTINCT ON (event_id) event_id, action, timestamp
+        FROM user_event_actions
+        WHERE user_id = %s
+        ORDER BY event_id, timestamp DESC
+    ) latest
+    ORDER BY timestamp DESC
+    LIMIT %s
+"""
+
+
+# Исключение кандидатов, с которыми пользователь уже взаимодействовал: anti-join по
+# user_event_actions (PK user_id, event_id, action) плюс дополнительные ID одним массивом.
+# Текст запроса не зависит от длины истории, поэтому план кешируется и готовится.
+# Параметры: user_id (NULL — без anti-join), список ID.
+EXCLUDE_SEEN_SQL = """
+            AND NOT EXISTS (
+                SELECT 1
+                FROM user_event_actions a
+                WHERE a.user_id = %s
+                AND a.event_id = t.id
+            )
+            AND NOT (t.id = ANY(%s::bigint[]))"""
+
+
+# Вектор интересов пользователя для поиска похожих событий: переданный явно
+# или средний эмбеддинг лайкнутых событий. Параметры: вектор ('[...]' или NULL), user_id.
+USER_PROFILE_SQL = """(
+                COALESCE(%s::vector, (
+                    SELECT AVG(le.embedding)
+                    FROM user_event_actions la
+                    JOIN events le ON le.id = la.event_id
+                    WHERE la.user_id = %s
+                    AND la.action = 'like'
+                ))
+            )"""
+
+# Эмбеддинги событий по id — те же, на которых учится train_rnn_worker.py.
+# Событие лежит в партиции каждого своего города, вектор у копий один. Параметры: список id.
+EVENT_EMBEDDINGS_SQL = """
+    SELECT DISTINCT ON (id) id, embedding::real[]
+    FROM events
+    WHERE id = ANY(%s) AND embedding IS NOT NULL
+"""
+
+
+def similar_events_query(table_name: str) -> str:
+    """
+    Персональные кандидаты одним запросом по всему каталогу города: окно дат и
+    исключение просмотренных + ORDER BY embedding <=> вектор пользователя (HNSW по events.embedding).
+    Параметры: город, now_ts, future_ts, параметры EXCLUDE_SEEN_SQL,
+    дважды параметры USER_PROFILE_SQL, limit.
+    """
+    return f"""
+        SELECT
+            t.id,
+            t.title,
+            t.description,
+            t.start_datetime,
+            t.event_url,
+            t.status_ml,
+            t.favorites_count,
+            t.address,
+            t.place_title,
+            t.tags,
+            t.place_site_url
+        FROM events e
+        JOIN upcoming_events_{table_name} t ON t.id = e.id
+        WHERE e.city = %s
+        AND e.embedding IS NOT NULL
+        AND t.start_datetime >= %s
+        AND t.start_datetime <= %s{EXCLUDE_SEEN_SQL}
+        AND {USER_PROFILE_SQL} IS NOT NULL
+        ORDER BY e.embedding <=> {USER_PROFILE_SQL}
+        LIMIT %s
+    """
+
+
+def precomputed_query(table_name: str) -> str:
+    """
+    Готовые рекомендации ночного расчёта (user_recommendations) с карточками из
+    upcoming_events_<city>; прошедшие и уже оценённые после расчёта события отсекаются.
+    Параметры: user_id, город, now_ts, затем параметры EXCLUDE_SEEN_SQL и limit.
+    """
+    return f"""
+        SELECT
+            t.id,
+            t.title,
+            t.description,
+            t.start_datetime,
+            t.event_url,
+            t.status_ml,
+            t.favorites_count,
+            t.address,
+            t.place_title,
+            t.tags,
+            t.place_site_url,
+            r.score
+        FROM user_recommendations r
+        JOIN upcoming_events_{table_name} t ON t.id = r.event_id
+        WHERE r.user_id = %s
+        AND r.city = %s
+        AND t.start_datetime >= %s{EXCLUDE_SEEN_SQL}
+        ORDER BY r.rank
+        LIMIT %s
+    """
+
+
+def candidate_row(r) -> Dict[str, Any]:
+    """Строка upcoming_events_<city> → кандидат с данными места (place_data)."""
+    # places.title NOT NULL: пустое название значит, что у события нет места
+    place_data = None
+    if r[8] is not None:
+        place_data = {
+            "title": r[8] or "",
+            "address": r[7] or "",
+            "site_url": r[10] or ""
+        }
+    return {
+        "id": r[0],
+        "title": r[1],
+        "description": r[2],
+        "start_datetime": int(r[3]) if r[3] is not None else None,
+        "event_url": r[4],
+        "status_ml": r[5],
+        "likes": r[6] if r[6] is not None else 0,
+        "address": r[7] if r[7] is not None else "",
+        "place_title": r[8] if r[8] is not None else "",
+        "tags": r[9] or [],
+        "place_data": place_data
+    }
+
+
+def history_entry(row) -> Dict[str, Any]:
+    """Строка user_event_actions → элемент event_history."""
+    return {
+        "event_id": row[0],
+        "rating": row[1],
+        "timestamp": int(row[2].timestamp()) if row[2] is not None else 0
+    }
+
+
+# Кластеры по умолчанию для мероприятий, добавленных пользователями
+DEFAULT_ADDED_EVENT_STATUS_ML = [
+    {
+        "score": 0.9,
+        "category": "Nostalgia‑поколение",
+        "description": ""
+    },
+    {
+        "score": 0.9,
+        "category": "Романтики‑эстеты",
+        "description": ""
+    },
+    {
+        "score": 0.9,
+        "category": "Поклонники стендапа",
+        "description": ""
+    },
+    {
+        "score": 0.9,
+        "category": "Ценители оперного и вокального искусства",
+        "description": ""
+    },
+    {
+        "score": 0.9,
+        "category": "Ночные искатели приключений",
+        "description": ""
+    },
+    {
+        "score": 0.9,
+        "category": "Джаз‑адепты",
+        "description": ""
+    },
+    {
+        "score": 0.9,
+        "category": "Рок‑энтузиасты",
+        "description": ""
+    },
+    {
+        "score": 0.9,
+        "category": "Любители гастрономического театра",
+        "description": ""
+    },
+    {
+        "score": 0.9,
+        "category": "Фанаты мюзиклов и Бродвея",
+        "description": ""
+    },
+    {
+        "score": 0.9,
+        "category": "Ностальгирующие романтики",
+        "description": ""
+    }
+]
+
 
 class Database_Users:
-    def __init__(self):
-        self.conn = psycopg2.connect(Config.DB_DSN)
-        self.ml_service = MLService()
+    def __init__(self, conn=None, ml_service: Optional[MLService] = None):
+        # conn передаёт ThreadedDatabase_Users (соединение из пула на время вызова)
+        self.conn = conn if conn is not None else psycopg2.connect(Config.DB_DSN)
+        self.ml_service = ml_service if ml_service is not None else MLService()
 
     def get_user(self, user_id: int):
         with self.conn.cursor() as cur:
             cur.execute(
-                "SELECT id, city, status_ml, event_history FROM users WHERE id = %s",
+                "SELECT id, city, status_ml, status_vec FROM users WHERE id = %s",
                 (user_id,)
             )
             row = cur.fetchone()
@@ -41,8 +256,28 @@ class Database_Users:
             "id": row[0],
             "city": row[1],
             "status_ml": row[2] if row[2] is not None else [],  # Возвращает строку или None → []
-            "event_history": row[3] if row[3] is not None else []  # То же самое
+            "status_vec": row[3],  # профиль по каталогу кластеров (real[]) или None до первого лайка
+            "event_history": self.get_event_history(user_id)  # из user_event_actions
         }
+
+    def create_user(self, user_id: int, name: str, city: Optional[int] = None) -> bool:
+        """Регистрирует пользователя; повторная регистрация ничего не меняет."""
+        try:
+            with self.conn.cursor() as cur:
+                cur.execute(
+                    """
+                    INSERT INTO users (id, name, city) VALUES (%s, %s, %s)
+                    ON CONFLICT (id) DO NOTHING
+                    """,
+                    (user_id, name, city)
+                )
+                created = cur.rowcount > 0
+            self.conn.commit()
+            return created
+        except Exception as e:
+            logger.error(f"[DB] Ошибка регистрации пользователя {user_id}: {e}")
+            self.conn.rollback()
+            return False
     
     def update_user_status_ml(
         self, 
@@ -110,9 +345,29 @@ class Database_Users:
             self.conn.rollback()
             return False
 
+    def update_user_status_vec(self, user_id: int, status_vec: List[float]) -> bool:
+        """Записывает плотный профиль пользователя users.status_vec (порядок — каталог кластеров)."""
+        try:
+            with self.conn.cursor() as cur:
+                cur.execute(
+                    "UPDATE users SET status_vec = %s::real[] WHERE id = %s",
+                    (status_vec, user_id)
+                )
+                if cur.rowcount == 0:
+                    logger.warning(f"Пользователь с ID {user_id} не найден в БД")
+                    self.conn.rollback()
+                    return False
+            self.conn.commit()
+            return True
+        except Exception as e:
+            logger.exception(f"Ошибка при обновлении status_vec для user_id={user_id}: {e}")
+            self.conn.rollback()
+            return False
+
     def add_event_to_history(self, user_id: int, event_id: int, rating: str) -> bool:
         """
-        Добавляет событие в историю пользователя с ограничением по размеру.
+        Записывает действие пользователя с событием одной строкой в user_event_actions.
+        Повторное действие обновляет только время (идемпотентно, без гонок).
         Возвращает True при успехе, False при ошибке.
         """
         # Валидация входных данных
@@ -120,62 +375,31 @@ class Database_Users:
             logging.error(f"Некорректные ID: user_id={user_id}, event_id={event_id}")
             return False
 
-        if rating not in ["like", "dislike", "confirmed"]:
+        if rating not in HISTORY_ACTIONS:
             logging.error(f"Недопустимый рейтинг: {rating}")
             return False
 
         try:
-            # Получаем текущую историю (отдельная транзакция)
-            user = self.get_user(user_id)
-            if not user:
-                logging.error(f"Пользователь не найден: {user_id}")
-                return False
-
-            history = user.get("event_history", [])
-            
-            # Удаляем дубликаты (если событие уже есть в истории)
-            history = [
-                item for item in history 
-                if item["event_id"] != event_id
-            ]
-            
-            # Добавляем новое событие
-            new_entry = {
-                "event_id": event_id,
-                "rating": rating,
-                "timestamp": int(datetime.now().timestamp())  # Важно: время добавления
-            }
-            history.append(new_entry)
-
-            # Ограничиваем размер истории
-            MAX_HISTORY = 100  # Лучше вынести в конфиг
-            history = history[-MAX_HISTORY:]
-
-            # Обновляем БД
             with self.conn.cursor() as cur:
-                cur.execute(
-                    """
-                    UPDATE users 
-                    SET event_history = %s
-                    WHERE id = %s
-                    AND event_history IS DISTINCT FROM %s  -- Оптимизация: не обновлять, если данные не изменились
-                    """,
-                    (json.dumps(history, ensure_ascii=False), user_id, json.dumps(history))
-                )
-                
-                # Проверяем, была ли запись обновлена
-                if cur.rowcount == 0:
-                    logging.warning(f"История не обновлена (возможно, дубликат): user_id={user_id}, event_id={event_id}")
-                    return False
-
+                cur.execute(ADD_ACTION_SQL, (user_id, event_id, rating))
             self.conn.commit()
             return True
 
         except Exception as e:
             logging.exception(f"Ошибка при добавлении в историю: user_id={user_id}, event_id={event_id}, ошибка={e}")
-            # Не коммитим транзакцию при ошибке
+            self.conn.rollback()
             return False
 
+    def get_event_history(self, user_id: int, limit: int = MAX_HISTORY) -> List[Dict[str, Any]]:
+        """
+        Последние limit действий пользователя (по одному на событие, последнее по времени),
+        в хронологическом порядке — в формате бывшего users.event_history.
+        """
+        with self.conn.cursor() as cur:
+            cur.execute(RECENT_ACTIONS_SQL, (user_id, limit))
+            rows = cur.fetchall()
+        return [history_entry(r) for r in reversed(rows)]
+
 
     # def get_recommended_events(self, table_name: str, limit: int = 10) -> list:
     #     with self.conn.cursor() as cur:
@@ -201,7 +425,8 @@ class Database_Users:
         limit: int = 50,
         months_ahead: float = 1.5,
         use_local_time: bool = False,
-        exclude_event_ids: set = None
+        exclude_event_ids: set = None,
+        user_id: Optional[int] = None
     ) -> list:
 
         # 1. Определяем текущее время
@@ -217,72 +442,97 @@ class Database_Users:
         now_ts = int(now.timestamp())
         future_limit_ts = int(future_limit.timestamp())
 
-        # 3. Подготовка условия исключения событий
-        exclude_ids_tuple = tuple(exclude_event_ids) if exclude_event_ids else ()
-        exclude_clause = ""
-        if exclude_ids_tuple:
-            exclude_clause = f" AND t.id NOT IN ({', '.join(['%s'] * len(exclude_ids_tuple))})"
+        # 3. Исключения: anti-join по истории user_id и один массив exclude_event_ids
+        exclude_ids = list(exclude_event_ids or ())
 
-        # 4. Единый запрос с приоритетной сортировкой
+        # 4. Единый запрос к материализованным кандидатам upcoming_events_<city>:
+        # сортировка совпадает с индексом (priority, favorites_count DESC, start_datetime)
         query = f"""
             SELECT
                 t.id,
                 t.title,
                 t.description,
-                min_dates.start_datetime,
+                t.start_datetime,
                 t.event_url,
                 t.status_ml,
                 t.favorites_count,
-                p.address,
-                p.title AS place_title
-            FROM {table_name} t
-            JOIN (
-                SELECT
-                    event_id,
-                    MIN(start_timestamp) AS start_datetime
-                FROM event_dates_{table_name}
-                WHERE start_timestamp >= %s
-                AND start_timestamp <= %s
-                GROUP BY event_id
-            ) min_dates ON t.id = min_dates.event_id
-            LEFT JOIN places p ON t.place_id = p.id
-            WHERE TRUE {exclude_clause}
+                t.address,
+                t.place_title,
+                t.tags,
+                t.place_site_url
+            FROM upcoming_events_{table_name} t
+            WHERE t.start_datetime >= %s
+            AND t.start_datetime <= %s{EXCLUDE_SEEN_SQL}
             ORDER BY
-                CASE
-                    WHEN 'добавленное' = ANY(t.tags) THEN 1  -- высший приоритет
-                    WHEN 'интересное' = ANY(t.tags) THEN 2  -- средний приоритет
-                    ELSE 3  -- низкий приоритет
-                END,
+                t.priority,                  -- 'добавленное', 'интересное', остальные
                 t.favorites_count DESC,      -- далее по числу лайков
-                min_dates.start_datetime ASC -- затем по времени начала
+                t.start_datetime ASC         -- затем по времени начала
             LIMIT %s
         """
 
         # 5. Выполняем запрос
         with self.conn.cursor() as cur:
-            params = [now_ts, future_limit_ts]
-            if exclude_ids_tuple:
-                params.extend(exclude_ids_tuple)
-            params.append(limit)
+            params = [now_ts, future_limit_ts, user_id, exclude_ids, limit]
             cur.execute(query, params)
             rows = cur.fetchall()
             logger.info(f"Retrieved {len(rows)} recommended events")
 
         # 6. Формируем итоговый список
-        return [
-            {
-                "id": r[0],
-                "title": r[1],
-                "description": r[2],
-                "start_datetime": int(r[3]) if r[3] is not None else None,
-                "event_url": r[4],
-                "status_ml": r[5],
-                "likes": r[6] if r[6] is not None else 0,
-                "address": r[7] if r[7] is not None else "",
-                "place_title": r[8] if r[8] is not None else ""
-            }
-            for r in rows
-        ]
+        return [candidate_row(r) for r in rows]
+
+    def get_similar_events(
+        self,
+        table_name: str,
+        user_id: int,
+        user_vector: Optional[str] = None,
+        limit: int = 50,
+        months_ahead: float = 1.5,
+        exclude_event_ids: set = None
+    ) -> list:
+        """
+        Кандидаты, ближайшие к вектору пользователя (pgvector), в том же формате, что get_recommended_events.
+        user_vector — литерал '[...]' (ai.vector_codec.to_pgvector); без него — средний эмбеддинг лайков.
+        Пустой список — нет ни вектора, ни лайков с эмбеддингами.
+        """
+        if table_name not in {"msk", "spb"}:
+            logger.error(f"[DB] Запрещённая таблица: {table_name}")
+            return []
+        now = datetime.utcnow().replace(tzinfo=pytz.utc)
+        now_ts = int(now.timestamp())
+        future_limit_ts = int((now + timedelta(days=int(months_ahead * 30))).timestamp())
+        try:
+            with self.conn.cursor() as cur:
+                cur.execute(
+                    similar_events_query(table_name),
+                    (
+                        table_name, now_ts, future_limit_ts,
+                        user_id, list(exclude_event_ids or ()),
+                        user_vector, user_id,
+                        user_vector, user_id,
+                        limit
+                    )
+                )
+                rows = cur.fetchall()
+            return [candidate_row(r) for r in rows]
+        except Exception as e:
+            self.conn.rollback()
+            logger.error(f"[DB] Ошибка поиска похожих событий для {user_id}: {e}")
+            return []
+
+    def get_event_embeddings(self, event_ids: List[int]) -> Dict[int, List[float]]:
+        """Эмбеддинги событий из events.embedding: {event_id: [...]}; события без вектора пропускаются."""
+        if not event_ids:
+            return {}
+        try:
+            with self.conn.cursor() as cur:
+                cur.execute(EVENT_EMBEDDINGS_SQL, (list(event_ids),))
+                rows = cur.fetchall()
+            return {r[0]: r[1] for r in rows}
+        except Exception as e:
+            self.conn.rollback()
+            logger.error(f"[DB] Ошибка чтения эмбеддингов событий: {e}")
+            return {}
+
     # --- Реферальная система ---
 
     def save_referral_code(self, user_id: int, code: str) -> bool:
@@ -388,30 +638,14 @@ class Database_Users:
                 cur.execute("""
                     SELECT
                         uce.user_id,
-                        e.event_id,
+                        e.id,
                         e.title,
                         e.start_datetime,
                         e.event_url,
                         e.city
                     FROM user_confirmed_events uce
-                    JOIN (
-                        -- Объединяем события из msk и spb
-                        SELECT 
-                            id AS event_id,
-                            title,
-                            start_datetime,
-                            event_url,
-                            'msk' AS city
-                        FROM msk
-                        UNION ALL
-                        SELECT
-                            id AS event_id,
-                            title,
-                            start_datetime,
-                            event_url,
-                            'spb' AS city
-                        FROM spb
-                    ) e ON uce.event_id = e.event_id
+                    -- Все города в одной секционированной таблице events
+                    JOIN events e ON uce.event_id = e.id
                     WHERE e.start_datetime BETWEEN %s AND %s
                     AND uce.reminder_sent = FALSE
                     ORDER BY e.start_datetime
@@ -470,35 +704,29 @@ class Database_Users:
             return False
         
     
-    def get_event_by_id(self, event_id: int, table_name: str) -> Optional[dict]:
+    def get_event_by_id(self, event_id: int, table_name: Optional[str] = None) -> Optional[dict]:
         """
-        Возвращает данные мероприятия по ID из указанной таблицы.
+        Возвращает данные мероприятия по ID.
         
         :param event_id: ID мероприятия
-        :param table_name: Название таблицы (должно быть проверено заранее)
+        :param table_name: Город ('msk', 'spb'); если не указан — поиск по всем городам
         :return: Словарь с данными мероприятия или None
         """
-        # Список разрешённых таблиц (защита от SQL‑инъекций)
-        ALLOWED_TABLES = {"msk", "spb"}
-        
-        if table_name not in ALLOWED_TABLES:
-            logger.error(f"[DB] Запрещённая таблица: {table_name}")
-            return None
-
         try:
             with self.conn.cursor() as cur:
-                # Используем параметризованный запрос только для значений, а не для имён таблиц
-                query = f"""
+                # Город — значение ключа секционирования, а не имя таблицы
+                query = """
                     SELECT 
                         id,
                         title,
                         description,
                         start_datetime,
                         event_url
-                    FROM {table_name}
-                    WHERE id = %s
+                    FROM events
+                    WHERE id = %s AND (%s::text IS NULL OR city = %s)
+                    LIMIT 1
                 """
-                cur.execute(query, (event_id,))
+                cur.execute(query, (event_id, table_name, table_name))
                 row = cur.fetchone()
 
                 if not row:
@@ -513,22 +741,23 @@ class Database_Users:
                     "event_url": row[4] or ""
                 }
         except Exception as e:
-            logger.error(f"[DB] Ошибка получения мероприятия {event_id} из таблицы {table_name}: {e}")
+            logger.error(f"[DB] Ошибка получения мероприятия {event_id} (город {table_name}): {e}")
             return None
         
-    def increment_event_likes(self, event_id: int, table_name: str) -> bool:
+    def increment_event_likes(self, event_id: int, table_name: Optional[str] = None) -> bool:
         """
         Увеличивает счётчик likes у события на 1.
+        Если город не указан, событие ищется по всем городам одним запросом.
         Возвращает True, если обновление прошло успешно.
         """
         try:
             with self.conn.cursor() as cur:
                 cur.execute(
-                    f"UPDATE {table_name} SET likes = likes + 1 WHERE id = %s",
-                    (event_id,)
+                    "UPDATE events SET likes = likes + 1 WHERE id = %s AND (%s::text IS NULL OR city = %s)",
+                    (event_id, table_name, table_name)
                 )
                 if cur.rowcount == 0:
-                    logger.warning(f"Событие {event_id} не найдено в таблице {table_name}")
+                    logger.warning(f"Событие {event_id} не найдено (город {table_name})")
                     return False
             self.conn.commit()
             logger.info(f"Событие {event_id}: лайк добавлен (+1)")
@@ -546,61 +775,60 @@ class Database_Users:
 
 
     def get_friends(self, user_id: int) -> List[Dict]:
-        with self.conn.cursor() as cur:
-            cur.execute(
-                """
-                SELECT f.friend_id, u.name
-                FROM friends f
-                JOIN users u ON f.friend_id = u.id
-                WHERE f.user_id = %s
-                ORDER BY u.name
-                """,
-                (user_id,)
-            )
-            rows = cur.fetchall()
-        
-        # Отладка: проверим, что rows — это список кортежей
-        print("Raw rows from DB:", rows)  # например: [(123, 'Иван'), (456, None)]
-        
-        result = [
-            {"id": row[0], "name": row[1] or f"Друг {row[0]}"}
-            for row in rows
-        ]
-        
-        # Отладка: проверим итоговый результат
-        print("Result list:", result)
-        
-        return result
+        """Возвращает друзей пользователя: [{"id": ..., "name": ...}]."""
+        try:
+            with self.conn.cursor() as cur:
+                cur.execute(
+                    """
+                    SELECT f.friend_id, u.name
+                    FROM friends f
+                    JOIN users u ON f.friend_id = u.id
+                    WHERE f.user_id = %s
+                    ORDER BY u.name
+                    """,
+                    (user_id,)
+                )
+                rows = cur.fetchall()
+            return [{"id": row[0], "name": row[1] or f"Друг {row[0]}"} for row in rows]
+        except Exception as e:
+            logger.error(f"Ошибка при получении друзей для {user_id}: {e}")
+            self.conn.rollback()
+            return []
     
-    def remove_friend(self, user_id: int, friend_id: int) -> bool:
-        """Удаляет друга из списка."""
+    def add_friend(self, user_id: int, friend_id: int) -> bool:
+        """Добавляет дружбу в обе стороны."""
         try:
             with self.conn.cursor() as cur:
                 cur.execute(
-                    "DELETE FROM friends WHERE user_id = %s AND friend_id = %s",
-                    (user_id, friend_id)
+                    """
+                    INSERT INTO friends (user_id, friend_id)
+                    VALUES (%s, %s), (%s, %s)
+                    ON CONFLICT (user_id, friend_id) DO NOTHING
+                    """,
+                    (user_id, friend_id, friend_id, user_id)
                 )
             self.conn.commit()
-            logger.info(f"Друг {friend_id} удалён для пользователя {user_id}")
             return True
         except Exception as e:
-            logger.error(f"Ошибка при удалении друга {friend_id} для {user_id}: {e}")
+            logger.error(f"Ошибка при добавлении друга {friend_id} для {user_id}: {e}")
             self.conn.rollback()
             return False
 
-    def get_friends(self, user_id: int) -> List[int]:
-        """Возвращает список ID друзей пользователя."""
+    def remove_friend(self, user_id: int, friend_id: int) -> bool:
+        """Удаляет друга из списка."""
         try:
             with self.conn.cursor() as cur:
                 cur.execute(
-                    "SELECT friend_id FROM friends WHERE user_id = %s ORDER BY added_at DESC",
-                    (user_id,)
+                    "DELETE FROM friends WHERE user_id = %s AND friend_id = %s",
+                    (user_id, friend_id)
                 )
-                rows = cur.fetchall()
-            return [row[0] for row in rows]
+            self.conn.commit()
+            logger.info(f"Друг {friend_id} удалён для пользователя {user_id}")
+            return True
         except Exception as e:
-            logger.error(f"Ошибка при получении друзей для {user_id}: {e}")
-            return []
+            logger.error(f"Ошибка при удалении друга {friend_id} для {user_id}: {e}")
+            self.conn.rollback()
+            return False
 
     def are_friends(self, user_id: int, friend_id: int) -> bool:
         """Проверяет, являются ли пользователи друзьями."""
@@ -624,17 +852,13 @@ class Database_Users:
             with self.conn.cursor() as cur:
                 cur.execute("""
                     SELECT
-                        e.event_id,
+                        e.id,
                         e.title,
                         e.start_datetime,
                         e.event_url,
-                        t.city
+                        e.city
                     FROM user_confirmed_events uce
-                    JOIN (
-                        SELECT id, title, start_datetime, event_url, 'msk' AS city FROM msk
-                        UNION ALL
-                        SELECT id, title, start_datetime, event_url, 'spb' AS city FROM spb
-                    ) e ON uce.event_id = e.event_id
+                    JOIN events e ON uce.event_id = e.id
                     WHERE uce.user_id = %s
                     AND uce.confirmed_at IS NOT NULL
                     ORDER BY e.start_datetime
@@ -667,7 +891,8 @@ class Database_Users:
 
     def get_invitation_by_token(self, token: str) -> dict | None:
         """Получает приглашение по токену."""
-        with self.conn.cursor() as cur:
+        # RealDictCursor — строка со столбцами по именам, как dict_row в AsyncDatabase_Users
+        with self.conn.cursor(cursor_factory=RealDictCursor) as cur:
             cur.execute(
                 "SELECT * FROM invitations WHERE token = %s",
                 (token,)
@@ -724,17 +949,13 @@ class Database_Users:
             with self.conn.cursor() as cur:
                 cur.execute("""
                     SELECT
-                        e.event_id,
+                        e.id,
                         e.title,
                         e.start_datetime,
                         e.event_url,
-                        t.city
+                        e.city
                     FROM user_confirmed_events uce
-                    JOIN (
-                        SELECT id, title, start_datetime, event_url, 'msk' AS city FROM msk
-                        UNION ALL
-                        SELECT id, title, start_datetime, event_url, 'spb' AS city FROM spb
-                    ) e ON uce.event_id = e.event_id
+                    JOIN events e ON uce.event_id = e.id
                     WHERE uce.user_id = %s
                     AND uce.confirmed_at IS NOT NULL
                     AND e.start_datetime > %s  -- Только будущие события
@@ -837,59 +1058,7 @@ class Database_Users:
             return False
 
 
-        status_ml =[
-                {
-                    "score": 0.9,
-                    "category": "Nostalgia‑поколение",
-                    "description": ""
-                },
-                {
-                    "score": 0.9,
-                    "category": "Романтики‑эстеты",
-                    "description": ""
-                },
-                {
-                    "score": 0.9,
-                    "category": "Поклонники стендапа",
-                    "description": ""
-                },
-                {
-                    "score": 0.9,
-                    "category": "Ценители оперного и вокального искусства",
-                    "description": ""
-                },
-                {
-                    "score": 0.9,
-                    "category": "Ночные искатели приключений",
-                    "description": ""
-                },
-                {
-                    "score": 0.9,
-                    "category": "Джаз‑адепты",
-                    "description": ""
-                },
-                {
-                    "score": 0.9,
-                    "category": "Рок‑энтузиасты",
-                    "description": ""
-                },
-                {
-                    "score": 0.9,
-                    "category": "Любители гастрономического театра",
-                    "description": ""
-                },
-                {
-                    "score": 0.9,
-                    "category": "Фанаты мюзиклов и Бродвея",
-                    "description": ""
-                },
-                {
-                    "score": 0.9,
-                    "category": "Ностальгирующие романтики",
-                    "description": ""
-                }
-            
-            ]
+        status_ml = DEFAULT_ADDED_EVENT_STATUS_ML
 
         max_attempts = 100
         candidate_id = None
@@ -899,8 +1068,9 @@ class Database_Users:
             candidate_id = random.randint(1_000_000, 9_999_999)
             try:
                 with self.conn.cursor() as cur:
+                    # id уникален для всех городов: проверяем всю таблицу events
                     cur.execute(
-                        f"SELECT 1 FROM {table_name} WHERE id = %s",
+                        "SELECT 1 FROM events WHERE id = %s",
                         (candidate_id,)
                     )
                     if not cur.fetchone():
@@ -916,17 +1086,18 @@ class Database_Users:
         try:
             with self.conn.cursor() as cur:
                 # Основной запрос (с полем status_ml)
-                query_main = f"""
-                    INSERT INTO {table_name} (
-                        id, title, description, event_url, added_by, tags, status_ml
+                query_main = """
+                    INSERT INTO events (
+                        city, id, title, description, event_url, added_by, tags, status_ml
                     ) VALUES (
-                        %s, %s, %s, %s, %s, %s, %s
+                        %s, %s, %s, %s, %s, %s, %s, %s
                     )
                 """
                 tags_list = ['добавленное']
                 cur.execute(
                     query_main,
                     (
+                        table_name,
                         candidate_id,
                         title,
                         description,
@@ -938,14 +1109,14 @@ class Database_Users:
                 )
 
                 # Вставка в таблицу дат
-                query_dates = f"""
-                    INSERT INTO event_dates_{table_name} (
-                        event_id, start_timestamp, end_timestamp
+                query_dates = """
+                    INSERT INTO event_dates (
+                        city, event_id, start_timestamp, end_timestamp
                     ) VALUES (
-                        %s, %s, %s
+                        %s, %s, %s, %s
                     )
                 """
-                cur.execute(query_dates, (candidate_id, start_datetime, start_datetime))
+                cur.execute(query_dates, (table_name, candidate_id, start_datetime, start_datetime))
 
             self.conn.commit()
             logger.info(f"Мероприятие '{title}' добавлено с ID={candidate_id}")
@@ -957,9 +1128,10 @@ class Database_Users:
                     "id": candidate_id,
                     "title": title,
                     "description": description,
+                    "tags": tags_list,
                     "status_ml": status_ml
                 }
-                self.ml_service.encode_text(f"{title} {description}")
+                self.ml_service.get_event_vector(new_event)
                 logger.info(f"ML-обработка события ID={candidate_id} завершена")
             except Exception as ml_e:
                 logger.error(f"[ML] Ошибка при обработке события ID={candidate_id}: {ml_e}")
@@ -979,7 +1151,8 @@ class Database_Users:
         limit: int = 12,
         months_ahead: float = 1.5,
         use_local_time: bool = False,
-        exclude_event_ids: set = None
+        exclude_event_ids: set = None,
+        user_id: Optional[int] = None
     ) -> list:
         """
         Возвращает мероприятия: сначала с тегом 'добавленное', затем с тегом 'интересное'.
@@ -1000,11 +1173,8 @@ class Database_Users:
         now_ts = int(now.timestamp())
         future_limit_ts = int(future_limit.timestamp())
 
-        # 3. Подготовка условия исключения событий
-        exclude_ids_tuple = tuple(exclude_event_ids) if exclude_event_ids else ()
-        exclude_clause = ""
-        if exclude_ids_tuple:
-            exclude_clause = f" AND t.id NOT IN ({', '.join(['%s'] * len(exclude_ids_tuple))})"
+        # 3. Исключения: anti-join по истории user_id и один массив exclude_event_ids
+        exclude_ids = list(exclude_event_ids or ())
 
         # 4. Запрос для событий с тегом 'добавленное'
         query_added = f"""
@@ -1012,27 +1182,21 @@ class Database_Users:
                 t.id,
                 t.title,
                 t.description,
-                min_dates.start_datetime,
+                t.start_datetime,
                 t.event_url,
                 t.status_ml,
                 t.favorites_count,
-                p.address,
-                p.title AS place_title
-            FROM {table_name} t
-            JOIN (
-                SELECT
-                    event_id,
-                    MIN(start_timestamp) AS start_datetime
-                FROM event_dates_{table_name}
-                WHERE start_timestamp >= %s
-                AND start_timestamp <= %s
-                GROUP BY event_id
-            ) min_dates ON t.id = min_dates.event_id
-            LEFT JOIN places p ON t.place_id = p.id
-            WHERE 'добавленное' = ANY(t.tags) {exclude_clause}
+                t.address,
+                t.place_title,
+                t.tags,
+                t.place_site_url
+            FROM upcoming_events_{table_name} t
+            WHERE t.start_datetime >= %s
+            AND t.start_datetime <= %s
+            AND t.priority = 1{EXCLUDE_SEEN_SQL}
             ORDER BY
                 t.favorites_count DESC,
-                min_dates.start_datetime ASC
+                t.start_datetime ASC
             LIMIT %s
         """
 
@@ -1042,27 +1206,21 @@ class Database_Users:
                 t.id,
                 t.title,
                 t.description,
-                min_dates.start_datetime,
+                t.start_datetime,
                 t.event_url,
                 t.status_ml,
                 t.favorites_count,
-                p.address,
-                p.title AS place_title
-            FROM {table_name} t
-            JOIN (
-                SELECT
-                    event_id,
-                    MIN(start_timestamp) AS start_datetime
-                FROM event_dates_{table_name}
-                WHERE start_timestamp >= %s
-                AND start_timestamp <= %s
-                GROUP BY event_id
-            ) min_dates ON t.id = min_dates.event_id
-            LEFT JOIN places p ON t.place_id = p.id
-            WHERE 'интересное' = ANY(t.tags) {exclude_clause}
+                t.address,
+                t.place_title,
+                t.tags,
+                t.place_site_url
+            FROM upcoming_events_{table_name} t
+            WHERE t.start_datetime >= %s
+            AND t.start_datetime <= %s
+            AND t.priority = 2{EXCLUDE_SEEN_SQL}
             ORDER BY
                 t.favorites_count DESC,
-                min_dates.start_datetime ASC
+                t.start_datetime ASC
             LIMIT %s
         """
 
@@ -1070,10 +1228,7 @@ class Database_Users:
 
         # 6. Выполняем запрос для 'добавленное'
         with self.conn.cursor() as cur:
-            params_added = [now_ts, future_limit_ts]
-            if exclude_ids_tuple:
-                params_added.extend(exclude_ids_tuple)
-            params_added.append(limit)  # Лимит на первую группу (можно скорректировать)
+            params_added = [now_ts, future_limit_ts, user_id, exclude_ids, limit]
 
             cur.execute(query_added, params_added)
             rows_added = cur.fetchall()
@@ -1087,27 +1242,176 @@ class Database_Users:
             remaining = limit - len(all_rows)
             if remaining > 0:
                 with self.conn.cursor() as cur:
-                    params_interesting = [now_ts, future_limit_ts]
-                    if exclude_ids_tuple:
-                        params_interesting.extend(exclude_ids_tuple)
-                    params_interesting.append(remaining)
+                    params_interesting = [now_ts, future_limit_ts, user_id, exclude_ids, remaining]
 
                     cur.execute(query_interesting, params_interesting)
                     rows_interesting = cur.fetchall()
                     all_rows.extend(rows_interesting)
 
         # 8. Формируем итоговый список
-        return [
-            {
-                "id": r[0],
-                "title": r[1],
-                "description": r[2],
-                "start_datetime": int(r[3]) if r[3] is not None else None,
-                "event_url": r[4],
-                "status_ml": r[5],
-                "likes": r[6] if r[6] is not None else 0,
-                "address": r[7] if r[7] is not None else "",
-                "place_title": r[8] if r[8] is not None else ""
+        return [candidate_row(r) for r in all_rows]
+
+    def get_precomputed_recommendations(self, table_name: str, user_id: int, limit: int) -> list:
+        """
+        Ночной top-N пользователя для города: [(кандидат, score), ...] в порядке rank.
+        Пустой список — расчёта для пользователя нет, бот считает онлайн.
+        """
+        if table_name not in {"msk", "spb"}:
+            logger.error(f"[DB] Запрещённая таблица: {table_name}")
+            return []
+        now_ts = int(datetime.now(timezone.utc).timestamp())
+        try:
+            with self.conn.cursor() as cur:
+                cur.execute(
+                    precomputed_query(table_name),
+                    (user_id, table_name, now_ts, user_id, [], limit)
+                )
+                rows = cur.fetchall()
+            return [(candidate_row(r), float(r[11])) for r in rows]
+        except Exception as e:
+            self.conn.rollback()
+            logger.error(f"[DB] Ошибка чтения готовых рекомендаций {user_id}: {e}")
+            return []
+
+    def get_upcoming_event_texts(self, table_name: str) -> list:
+        """Тексты всех кандидатов upcoming_events_<city> для индекса эмбеддингов бота."""
+        if table_name not in {"msk", "spb"}:
+            logger.error(f"[DB] Запрещённая таблица: {table_name}")
+            return []
+        try:
+            with self.conn.cursor() as cur:
+                cur.execute(f"SELECT id, title, description, tags FROM upcoming_events_{table_name}")
+                rows = cur.fetchall()
+            return [
+                {"id": r[0], "title": r[1] or "", "description": r[2] or "", "tags": r[3] or []}
+                for r in rows
+            ]
+        except Exception as e:
+            self.conn.rollback()
+            logger.error(f"[DB] Ошибка чтения кандидатов {table_name} для индекса: {e}")
+            return []
+
+    def refresh_upcoming_events(self, table_name: str) -> bool:
+        """Пересчитывает upcoming_events_<city>; читатели не блокируются (CONCURRENTLY)."""
+        if table_name not in {"msk", "spb"}:
+            logger.error(f"[DB] Запрещённая таблица: {table_name}")
+            return False
+        try:
+            with self.conn.cursor() as cur:
+                cur.execute(f"REFRESH MATERIALIZED VIEW CONCURRENTLY upcoming_events_{table_name}")
+            self.conn.commit()
+            return True
+        except Exception as e:
+            self.conn.rollback()
+            logger.error(f"[DB] Ошибка обновления upcoming_events_{table_name}: {e}")
+            return False
+
+
+class ThreadedDatabase_Users:
+    """
+    Режим совместимости: каждый метод Database_Users выполняется в ограниченном
+    ThreadPoolExecutor на соединении из ThreadedConnectionPool и возвращает
+    корутину, поэтому обработчики делают `await db.get_user(...)` и не блокируют
+    цикл событий aiogram. Размер пула соединений равен числу потоков, так что
+    поток никогда не ждёт соединение — вся очередь видна в stats().
+    """
+
+    def __init__(self, dsn: str = None, ml_service: Optional[MLService] = None, max_workers: int = None):
+        self.max_workers = max_workers or Config.DB_POOL_MAX_SIZE
+        self.pool = ThreadedConnectionPool(
+            min(Config.DB_POOL_MIN_SIZE, self.max_workers),
+            self.max_workers,
+            dsn or Config.DB_DSN
+        )
+        self.executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="db")
+        self.ml_service = ml_service if ml_service is not None else MLService()
+
+        # Метрики насыщения пула
+        self._lock = threading.Lock()
+        self._queued = 0
+        self._in_flight = 0
+        self._peak_in_flight = 0
+        self._peak_queued = 0
+        self._calls = 0
+        self._errors = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+        self._busy_total = 0.0
+        self._started_at = time.monotonic()
+
+    async def open(self):
+        """Пул создаётся в конструкторе; метод нужен для совместимости с AsyncDatabase_Users."""
+        logger.info(f"[DB] Потоковый пул открыт: workers={self.max_workers}")
+
+    async def close(self):
+        await asyncio.get_running_loop().run_in_executor(None, self.executor.shutdown, True)
+        self.pool.closeall()
+        logger.info("[DB] Потоковый пул закрыт")
+
+    def __getattr__(self, name: str):
+        method = getattr(Database_Users, name, None)
+        if name.startswith("_") or not callable(method):
+            raise AttributeError(name)
+
+        async def call(*args, **kwargs):
+            return await self._run(name, args, kwargs)
+
+        call.__name__ = name
+        call.__doc__ = method.__doc__
+        return call
+
+    async def _run(self, name: str, args: tuple, kwargs: dict):
+        submitted = time.monotonic()
+        with self._lock:
+            self._queued += 1
+            self._peak_queued = max(self._peak_queued, self._queued)
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, self._call, name, args, kwargs, submitted)
+
+    def _call(self, name: str, args: tuple, kwargs: dict, submitted: float):
+        started = time.monotonic()
+        wait = started - submitted
+        with self._lock:
+            self._queued -= 1
+            self._in_flight += 1
+            self._peak_in_flight = max(self._peak_in_flight, self._in_flight)
+            self._wait_total += wait
+            self._wait_max = max(self._wait_max, wait)
+
+        conn = self.pool.getconn()
+        broken = False
+        try:
+            return getattr(Database_Users(conn=conn, ml_service=self.ml_service), name)(*args, **kwargs)
+        except Exception:
+            with self._lock:
+                self._errors += 1
+            raise
+        finally:
+            # Закрываем незавершённую транзакцию (чтения, ошибки), чтобы не вернуть её в пул
+            try:
+                conn.rollback()
+            except psycopg2.Error:
+                broken = True
+            self.pool.putconn(conn, close=broken or conn.closed)
+            with self._lock:
+                self._in_flight -= 1
+                self._calls += 1
+                self._busy_total += time.monotonic() - started
+
+    def stats(self) -> Dict[str, Any]:
+        """Метрики насыщения: очередь, занятые потоки, ожидание и загрузка пула."""
+        with self._lock:
+            elapsed = max(time.monotonic() - self._started_at, 1e-9)
+            return {
+                "backend": "threaded",
+                "workers": self.max_workers,
+                "in_flight": self._in_flight,
+                "queued": self._queued,
+                "peak_in_flight": self._peak_in_flight,
+                "peak_queued": self._peak_queued,
+                "calls": self._calls,
+                "errors": self._errors,
+                "avg_wait_ms": round(1000 * self._wait_total / self._calls, 2) if self._calls else 0.0,
+                "max_wait_ms": round(1000 * self._wait_max, 2),
+                "utilization": round(self._busy_total / (elapsed * self.max_workers), 4),
             }
-            for r in all_rows
-        ]
\ No newline at end of file
@@ -0,0 +1,832 @@
+import asyncio
+import json
+import logging
+import random
+from datetime import datetime, timezone, timedelta
+from typing import List, Optional, Dict, Any, Sequence
+
+import pytz
+from psycopg.rows import dict_row
+from psycopg_pool import AsyncConnectionPool
+
+from config import Config
+from db import (
+    DEFAULT_ADDED_EVENT_STATUS_ML,
+    MAX_HISTORY,
+    HISTORY_ACTIONS,
+    ADD_ACTION_SQL,
+    RECENT_ACTIONS_SQL,
+    EXCLUDE_SEEN_SQL,
+    EVENT_EMBEDDINGS_SQL,
+    candidate_row,
+    precomputed_query,
+    similar_events_query,
+    history_entry,
+    ThreadedDatabase_Users
+)
+
+logger = logging.getLogger(__name__)
+
+ALLOWED_TABLES = ("msk", "spb")
+
+
+class AsyncDatabase_Users:
+    """
+    Асинхронный слой доступа к данным бота поверх psycopg 3.
+
+    Повторяет интерфейс Database_Users, но каждый метод — корутина, которая
+    берёт соединение из пула только на время своего запроса. Ошибка в одном
+    обработчике откатывает только его транзакцию и не портит соединение для
+    остальных. Часто повторяющиеся запросы автоматически готовятся на сервере
+    (prepare_threshold), поэтому SQL намеренно не зависит от числа параметров.
+    """
+
+    def __init__(self, dsn: str = None, ml_service=None):
+        self.pool = AsyncConnectionPool(
+            conninfo=dsn or Config.DB_DSN,
+            min_size=Config.DB_POOL_MIN_SIZE,
+            max_size=Config.DB_POOL_MAX_SIZE,
+            kwargs={"prepare_threshold": Config.DB_PREPARE_THRESHOLD},
+            open=False
+        )
+        self.ml_service = ml_service
+
+    async def open(self):
+        await self.pool.open(wait=True)
+        logger.info(
+            f"[DB] Пул соединений открыт: min={Config.DB_POOL_MIN_SIZE}, max={Config.DB_POOL_MAX_SIZE}"
+        )
+
+    async def close(self):
+        await self.pool.close()
+        logger.info("[DB] Пул соединений закрыт")
+
+    def stats(self) -> Dict[str, Any]:
+        """Метрики насыщения пула (размер, занятые соединения, очередь ожидания)."""
+        return {"backend": "async", **self.pool.get_stats()}
+
+    # --- Вспомогательные методы ---
+
+    async def _fetchone(self, query: str, params: Sequence = ()) -> Optional[tuple]:
+        async with self.pool.connection() as conn:
+            cur = await conn.execute(query, params)
+            return await cur.fetchone()
+
+    async def _fetchall(self, query: str, params: Sequence = ()) -> List[tuple]:
+        async with self.pool.connection() as conn:
+            cur = await conn.execute(query, params)
+            return await cur.fetchall()
+
+    async def _execute(self, query: str, params: Sequence = ()) -> int:
+        """Выполняет запрос в отдельной транзакции, возвращает rowcount."""
+        async with self.pool.connection() as conn:
+            cur = await conn.execute(query, params)
+            return cur.rowcount
+
+    # --- Пользователи ---
+
+    async def get_user(self, user_id: int):
+        async with self.pool.connection() as conn:
+            cur = await conn.execute(
+                "SELECT id, city, status_ml, status_vec FROM users WHERE id = %s",
+                (user_id,)
+            )
+            row = await cur.fetchone()
+            if row is None:
+                return None
+            cur = await conn.execute(RECENT_ACTIONS_SQL, (user_id, MAX_HISTORY))
+            history = await cur.fetchall()
+
+        return {
+            "id": row[0],
+            "city": row[1],
+            "status_ml": row[2] if row[2] is not None else [],
+            "status_vec": row[3],  # профиль по каталогу кластеров (real[]) или None до первого лайка
+            "event_history": [history_entry(r) for r in reversed(history)]
+        }
+
+    async def get_event_history(self, user_id: int, limit: int = MAX_HISTORY) -> List[Dict[str, Any]]:
+        """Последние limit действий пользователя в хронологическом порядке."""
+        rows = await self._fetchall(RECENT_ACTIONS_SQL, (user_id, limit))
+        return [history_entry(r) for r in reversed(rows)]
+
+    async def create_user(self, user_id: int, name: str, city: Optional[int] = None) -> bool:
+        """Регистрирует пользователя; повторная регистрация ничего не меняет."""
+        try:
+            rowcount = await self._execute(
+                """
+                INSERT INTO users (id, name, city) VALUES (%s, %s, %s)
+                ON CONFLICT (id) DO NOTHING
+                """,
+                (user_id, name, city)
+            )
+            return rowcount > 0
+        except Exception as e:
+            logger.error(f"[DB] Ошибка регистрации пользователя {user_id}: {e}")
+            return False
+
+    async def update_user_status_ml(
+        self,
+        user_id: int,
+        status_ml: Optional[List[Dict[str, Any]]]
+    ) -> bool:
+        """
+        Обновляет status_ml пользователя в БД.
+        status_ml — JSON-строка или список словарей [{"category": ..., "score": ...}].
+        """
+        if not status_ml:
+            logger.warning(f"Пустой status_ml передан для user_id={user_id}. Операция продолжена.")
+
+        try:
+            payload = status_ml if isinstance(status_ml, str) else json.dumps(status_ml or [], ensure_ascii=False)
+            rowcount = await self._execute(
+                "UPDATE users SET status_ml = %s::jsonb WHERE id = %s",
+                (payload, user_id)
+            )
+            if rowcount == 0:
+                logger.warning(f"Пользователь с ID {user_id} не найден в БД")
+                return False
+            logger.info(f"status_ml успешно обновлён для user_id={user_id}")
+            return True
+        except (TypeError, ValueError) as e:
+            logger.error(f"Ошибка сериализации JSON для user_id={user_id}: {e}")
+            return False
+        except Exception as e:
+            logger.exception(f"Неожиданная ошибка при обновлении status_ml для user_id={user_id}: {e}")
+            return False
+
+    async def update_user_status_vec(self, user_id: int, status_vec: List[float]) -> bool:
+        """Записывает плотный профиль пользователя users.status_vec (порядок — каталог кластеров)."""
+        try:
+            rowcount = await self._execute(
+                "UPDATE users SET status_vec = %s::real[] WHERE id = %s",
+                (status_vec, user_id)
+            )
+            if rowcount == 0:
+                logger.warning(f"Пользователь с ID {user_id} не найден в БД")
+                return False
+            return True
+        except Exception as e:
+            logger.exception(f"Ошибка при обновлении status_vec для user_id={user_id}: {e}")
+            return False
+
+    async def add_event_to_history(self, user_id: int, event_id: int, rating: str) -> bool:
+        """Записывает действие пользователя одной строкой в user_event_actions."""
+        if not isinstance(user_id, int) or not isinstance(event_id, int):
+            logger.error(f"Некорректные ID: user_id={user_id}, event_id={event_id}")
+            return False
+
+        if rating not in HISTORY_ACTIONS:
+            logger.error(f"Недопустимый рейтинг: {rating}")
+            return False
+
+        try:
+            await self._execute(ADD_ACTION_SQL, (user_id, event_id, rating))
+            return True
+        except Exception as e:
+            logger.exception(f"Ошибка при добавлении в историю: user_id={user_id}, event_id={event_id}, ошибка={e}")
+            return False
+
+    # --- Рекомендации ---
+
+    @staticmethod
+    def _time_window(months_ahead: float, use_local_time: bool) -> tuple:
+        if use_local_time:
+            now = datetime.now(pytz.timezone('Europe/Moscow'))
+        else:
+            now = datetime.utcnow().replace(tzinfo=pytz.utc)
+        future_limit = now + timedelta(days=int(months_ahead * 30))
+        return int(now.timestamp()), int(future_limit.timestamp())
+
+    @staticmethod
+    def _candidate_query(table_name: str, where: str, order_by: str) -> str:
+        # upcoming_events_<city> — материализованные кандидаты (ближайший старт, место, приоритет);
+        # ORDER BY совпадает с индексом (priority, favorites_count DESC, start_datetime);
+        # исключения — EXCLUDE_SEEN_SQL, текст запроса не зависит от истории пользователя
+        return f"""
+            SELECT
+                t.id,
+                t.title,
+                t.description,
+                t.start_datetime,
+                t.event_url,
+                t.status_ml,
+                t.favorites_count,
+                t.address,
+                t.place_title,
+                t.tags,
+                t.place_site_url
+            FROM upcoming_events_{table_name} t
+            WHERE t.start_datetime >= %s
+            AND t.start_datetime <= %s
+            AND {where}{EXCLUDE_SEEN_SQL}
+            ORDER BY {order_by}
+            LIMIT %s
+        """
+
+    async def get_recommended_events(
+        self,
+        table_name: str,
+        limit: int = 50,
+        months_ahead: float = 1.5,
+        use_local_time: bool = False,
+        exclude_event_ids: set = None,
+        user_id: Optional[int] = None
+    ) -> list:
+        """
+        Кандидаты для ML-рекомендаций.
+        user_id — исключить всё, с чем пользователь уже взаимодействовал (anti-join);
+        exclude_event_ids — дополнительные ID, передаются одним массивом.
+        """
+        if table_name not in ALLOWED_TABLES:
+            logger.error(f"[DB] Запрещённая таблица: {table_name}")
+            return []
+
+        now_ts, future_limit_ts = self._time_window(months_ahead, use_local_time)
+        query = self._candidate_query(
+            table_name,
+            where="TRUE",
+            order_by="""
+                t.priority,                  -- 'добавленное', 'интересное', остальные
+                t.favorites_count DESC,      -- далее по числу лайков
+                t.start_datetime ASC         -- затем по времени начала
+            """
+        )
+        rows = await self._fetchall(
+            query, (now_ts, future_limit_ts, user_id, list(exclude_event_ids or ()), limit)
+        )
+        logger.info(f"Retrieved {len(rows)} recommended events")
+        return [candidate_row(r) for r in rows]
+
+    async def get_similar_events(
+        self,
+        table_name: str,
+        user_id: int,
+        user_vector: Optional[str] = None,
+        limit: int = 50,
+        months_ahead: float = 1.5,
+        exclude_event_ids: set = None
+    ) -> list:
+        """
+        Кандидаты, ближайшие к вектору пользователя (pgvector), в том же формате, что get_recommended_events.
+        user_vector — литерал '[...]' (ai.vector_codec.to_pgvector); без него — средний эмбеддинг лайков.
+        Пустой список — нет ни вектора, ни лайков с эмбеддингами.
+        """
+        if table_name not in ALLOWED_TABLES:
+            logger.error(f"[DB] Запрещённая таблица: {table_name}")
+            return []
+
+        now_ts, future_limit_ts = self._time_window(months_ahead, False)
+        try:
+            rows = await self._fetchall(
+                similar_events_query(table_name),
+                (
+                    table_name, now_ts, future_limit_ts,
+                    user_id, list(exclude_event_ids or ()),
+                    user_vector, user_id,
+                    user_vector, user_id,
+                    limit
+                )
+            )
+        except Exception as e:
+            logger.error(f"[DB] Ошибка поиска похожих событий для {user_id}: {e}")
+            return []
+        logger.info(f"Retrieved {len(rows)} similar events")
+        return [candidate_row(r) for r in rows]
+
+    async def get_event_embeddings(self, event_ids: List[int]) -> Dict[int, List[float]]:
+        """Эмбеддинги событий из events.embedding: {event_id: [...]}; события без вектора пропускаются."""
+        if not event_ids:
+            return {}
+        try:
+            rows = await self._fetchall(EVENT_EMBEDDINGS_SQL, (list(event_ids),))
+        except Exception as e:
+            logger.error(f"[DB] Ошибка чтения эмбеддингов событий: {e}")
+            return {}
+        return {r[0]: r[1] for r in rows}
+
+    async def get_recommended_interest(
+        self,
+        table_name: str,
+        limit: int = 12,
+        months_ahead: float = 1.5,
+        use_local_time: bool = False,
+        exclude_event_ids: set = None,
+        user_id: Optional[int] = None
+    ) -> list:
+        """
+        Возвращает мероприятия: сначала с тегом 'добавленное', затем с тегом 'интересное'.
+        Сортировка внутри групп: по likes (DESC), затем по времени начала (ASC).
+        Общий лимит — limit. Исключения — как в get_recommended_events.
+        """
+        if table_name not in ALLOWED_TABLES:
+            logger.error(f"[DB] Запрещённая таблица: {table_name}")
+            return []
+
+        now_ts, future_limit_ts = self._time_window(months_ahead, use_local_time)
+        exclude = list(exclude_event_ids or ())
+        order_by = "t.favorites_count DESC, t.start_datetime ASC"
+
+        async with self.pool.connection() as conn:
+            cur = await conn.execute(
+                self._candidate_query(table_name, "t.priority = 1", order_by),
+                (now_ts, future_limit_ts, user_id, exclude, limit)
+            )
+            all_rows = await cur.fetchall()
+
+            remaining = limit - len(all_rows)
+            if remaining > 0:
+                cur = await conn.execute(
+                    self._candidate_query(table_name, "t.priority = 2", order_by),
+                    (now_ts, future_limit_ts, user_id, exclude, remaining)
+                )
+                all_rows.extend(await cur.fetchall())
+
+        return [candidate_row(r) for r in all_rows[:limit]]
+
+    async def get_precomputed_recommendations(self, table_name: str, user_id: int, limit: int) -> list:
+        """
+        Ночной top-N пользователя для города: [(кандидат, score), ...] в порядке rank.
+        Пустой список — расчёта для пользователя нет, бот считает онлайн.
+        """
+        if table_name not in ALLOWED_TABLES:
+            logger.error(f"[DB] Запрещённая таблица: {table_name}")
+            return []
+        now_ts = int(datetime.now(timezone.utc).timestamp())
+        try:
+            rows = await self._fetchall(
+                precomputed_query(table_name),
+                (user_id, table_name, now_ts, user_id, [], limit)
+            )
+            return [(candidate_row(r), float(r[11])) for r in rows]
+        except Exception as e:
+            logger.error(f"[DB] Ошибка чтения готовых рекомендаций {user_id}: {e}")
+            return []
+
+    async def get_upcoming_event_texts(self, table_name: str) -> list:
+        """Тексты всех кандидатов upcoming_events_<city> для индекса эмбеддингов бота."""
+        if table_name not in ALLOWED_TABLES:
+            logger.error(f"[DB] Запрещённая таблица: {table_name}")
+            return []
+        try:
+            rows = await self._fetchall(f"SELECT id, title, description, tags FROM upcoming_events_{table_name}")
+            return [
+                {"id": r[0], "title": r[1] or "", "description": r[2] or "", "tags": r[3] or []}
+                for r in rows
+            ]
+        except Exception as e:
+            logger.error(f"[DB] Ошибка чтения кандидатов {table_name} для индекса: {e}")
+            return []
+
+    async def refresh_upcoming_events(self, table_name: str) -> bool:
+        """Пересчитывает upcoming_events_<city>; читатели не блокируются (CONCURRENTLY)."""
+        if table_name not in ALLOWED_TABLES:
+            logger.error(f"[DB] Запрещённая таблица: {table_name}")
+            return False
+        try:
+            async with self.pool.connection() as conn:
+                # Служебную команду не готовим: она выполняется раз в несколько минут
+                await conn.execute(
+                    f"REFRESH MATERIALIZED VIEW CONCURRENTLY upcoming_events_{table_name}",
+                    prepare=False
+                )
+            return True
+        except Exception as e:
+            logger.error(f"[DB] Ошибка обновления upcoming_events_{table_name}: {e}")
+            return False
+
+    # --- Реферальная система ---
+
+    async def save_referral_code(self, user_id: int, code: str) -> bool:
+        """Сохраняет реферальный код пользователя, если его ещё нет."""
+        try:
+            rowcount = await self._execute(
+                """
+                UPDATE users
+                SET referral_code = %s
+                WHERE id = %s AND referral_code IS NULL
+                """,
+                (code, user_id)
+            )
+            if rowcount > 0:
+                logger.info(f"Реферальный код {code} сохранён для пользователя {user_id}")
+                return True
+            logger.info(f"У пользователя {user_id} уже есть реферальный код")
+            return False
+        except Exception as e:
+            logger.error(f"Ошибка при сохранении реферального кода для {user_id}: {e}")
+            return False
+
+    async def get_user_by_referral_code(self, code: str) -> Optional[int]:
+        """Возвращает ID пользователя по реферальном коду."""
+        try:
+            row = await self._fetchone("SELECT id FROM users WHERE referral_code = %s", (code,))
+            return row[0] if row else None
+        except Exception as e:
+            logger.error(f"Ошибка при поиске пользователя по коду {code}: {e}")
+            return None
+
+    async def is_already_referred(self, user_id: int, referrer_id: int) -> bool:
+        """Проверяет, был ли пользователь уже приглашён этим реферером."""
+        try:
+            row = await self._fetchone(
+                "SELECT 1 FROM referrals WHERE referred_id = %s AND referrer_id = %s",
+                (user_id, referrer_id)
+            )
+            return row is not None
+        except Exception as e:
+            logger.error(f"Ошибка при проверке реферального статуса {user_id}: {e}")
+            return False
+
+    async def add_referral(self, user_id: int, referrer_id: int, code: str) -> bool:
+        """Добавляет запись о реферале и устанавливает дружбу (одна транзакция)."""
+        try:
+            async with self.pool.connection() as conn:
+                await conn.execute(
+                    """
+                    INSERT INTO referrals (referrer_id, referred_id, referral_code, is_friend)
+                    VALUES (%s, %s, %s, TRUE)
+                    ON CONFLICT (referrer_id, referred_id) DO NOTHING
+                    """,
+                    (referrer_id, user_id, code)
+                )
+                await conn.execute(
+                    """
+                    INSERT INTO friends (user_id, friend_id)
+                    VALUES (%s, %s), (%s, %s)
+                    ON CONFLICT (user_id, friend_id) DO NOTHING
+                    """,
+                    (referrer_id, user_id, user_id, referrer_id)
+                )
+            logger.info(f"Реферальный переход: {referrer_id} → {user_id} (код {code}). Дружба установлена.")
+            return True
+        except Exception as e:
+            logger.error(f"Ошибка при добавлении реферала {user_id}: {e}")
+            return False
+
+    # --- Подтверждённые мероприятия и напоминания ---
+
+    async def get_upcoming_confirmed(self, days_ahead: int = 1) -> list:
+        try:
+            now = datetime.now(timezone.utc)
+            start_ts = int((now + timedelta(days=days_ahead - 0.1)).timestamp())
+            end_ts = int((now + timedelta(days=days_ahead + 0.1)).timestamp())
+
+            rows = await self._fetchall(
+                """
+                SELECT
+                    uce.user_id,
+                    e.id,
+                    e.title,
+                    e.start_datetime,
+                    e.event_url,
+                    e.city
+                FROM user_confirmed_events uce
+                JOIN events e ON uce.event_id = e.id
+                WHERE e.start_datetime BETWEEN %s AND %s
+                AND uce.reminder_sent = FALSE
+                ORDER BY e.start_datetime
+                """,
+                (start_ts, end_ts)
+            )
+            return [
+                {
+                    "user_id": r[0],
+                    "event_id": r[1],
+                    "title": r[2],
+                    "start_datetime": r[3],
+                    "event_url": r[4],
+                    "city": r[5]
+                }
+                for r in rows
+            ]
+        except Exception as e:
+            logger.error(f"[DB] Ошибка при получении подтверждённых мероприятий: {e}")
+            return []
+
+    async def confirm_event(self, user_id: int, event_id: int) -> bool:
+        try:
+            await self._execute(
+                """
+                INSERT INTO user_confirmed_events (user_id, event_id, confirmed_at, reminder_sent)
+                VALUES (%s, %s, %s, FALSE)
+                ON CONFLICT (user_id, event_id) DO NOTHING
+                """,
+                (user_id, event_id, datetime.now(timezone.utc))
+            )
+            return True
+        except Exception as e:
+            logger.error(f"[DB] Ошибка подтверждения мероприятия {event_id} для {user_id}: {e}")
+            return False
+
+    async def mark_reminder_sent(self, user_id: int, event_id: int) -> bool:
+        """Помечает, что напоминание для пользователя и мероприятия уже отправлено."""
+        try:
+            rowcount = await self._execute(
+                """
+                UPDATE user_confirmed_events
+                SET reminder_sent = TRUE
+                WHERE user_id = %s AND event_id = %s
+                """,
+                (user_id, event_id)
+            )
+            return rowcount > 0
+        except Exception as e:
+            logger.error(f"[DB] Ошибка отметки отправленного напоминания: {e}")
+            return False
+
+    # --- Мероприятия ---
+
+    async def get_event_by_id(self, event_id: int, table_name: Optional[str] = None) -> Optional[dict]:
+        """
+        Возвращает данные мероприятия по ID.
+        Если table_name (город) не указан, мероприятие ищется во всех городах одним запросом.
+        """
+        try:
+            row = await self._fetchone(
+                """
+                SELECT id, title, description, start_datetime, event_url
+                FROM events
+                WHERE id = %s AND (%s::text IS NULL OR city = %s)
+                LIMIT 1
+                """,
+                (event_id, table_name, table_name)
+            )
+            if not row:
+                return None
+            return {
+                "id": row[0],
+                "title": row[1] or "",
+                "description": row[2] or "",
+                "start_datetime": row[3],
+                "event_url": row[4] or ""
+            }
+        except Exception as e:
+            logger.error(f"[DB] Ошибка получения мероприятия {event_id} (город {table_name}): {e}")
+            return None
+
+    async def increment_event_likes(self, event_id: int, table_name: Optional[str] = None) -> bool:
+        """Увеличивает счётчик likes у события на 1; без города — поиск по всем городам."""
+        try:
+            rowcount = await self._execute(
+                "UPDATE events SET likes = likes + 1 WHERE id = %s AND (%s::text IS NULL OR city = %s)",
+                (event_id, table_name, table_name)
+            )
+            if rowcount == 0:
+                logger.warning(f"Событие {event_id} не найдено (город {table_name})")
+                return False
+            logger.info(f"Событие {event_id}: лайк добавлен (+1)")
+            return True
+        except Exception as e:
+            logger.error(f"Ошибка при увеличении likes для event_id={event_id}: {e}")
+            return False
+
+    async def get_place_by_event_id(self, event_id: int, table_name: str) -> Optional[dict]:
+        """Возвращает данные места (название, адрес, сайт) по event_id."""
+        if table_name not in ALLOWED_TABLES:
+            logger.error(f"[DB] Запрещённая таблица: {table_name}")
+            return None
+        try:
+            row = await self._fetchone(
+                f"""
+                SELECT p.title, p.address, p.site_url
+                FROM {table_name} t
+                JOIN places p ON p.id = t.place_id
+                WHERE t.id = %s
+                """,
+                (event_id,)
+            )
+            if not row:
+                return None
+            return {
+                "title": row[0] or "",
+                "address": row[1] or "",
+                "site_url": row[2] or ""
+            }
+        except Exception as e:
+            logger.error(f"[DB] Ошибка получения места для event_id={event_id} из таблицы {table_name}: {e}")
+            return None
+
+    async def add_event(
+        self,
+        table_name: str,
+        title: str,
+        description: str,
+        start_datetime: int,
+        event_url: str,
+        added_by: int,
+        status_ml: List[Dict] = None
+    ) -> bool:
+        """Добавляет пользовательское мероприятие (после модерации)."""
+        if table_name not in ALLOWED_TABLES:
+            logger.error(f"[DB] Запрещённая таблица: {table_name}")
+            return False
+
+        status_ml = DEFAULT_ADDED_EVENT_STATUS_ML
+        tags_list = ['добавленное']
+
+        try:
+            async with self.pool.connection() as conn:
+                # Генерация уникального ID
+                for _ in range(100):
+                    candidate_id = random.randint(1_000_000, 9_999_999)
+                    # id уникален для всех городов: проверяем всю таблицу events
+                    cur = await conn.execute("SELECT 1 FROM events WHERE id = %s", (candidate_id,))
+                    if not await cur.fetchone():
+                        break
+                else:
+                    logger.error("[DB] Не удалось сгенерировать уникальный ID после 100 попыток")
+                    return False
+
+                await conn.execute(
+                    """
+                    INSERT INTO events (
+                        city, id, title, description, event_url, added_by, tags, status_ml
+                    ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s::jsonb)
+                    """,
+                    (table_name, candidate_id, title, description, event_url, added_by, tags_list, json.dumps(status_ml))
+                )
+                await conn.execute(
+                    """
+                    INSERT INTO event_dates (city, event_id, start_timestamp, end_timestamp)
+                    VALUES (%s, %s, %s, %s)
+                    """,
+                    (table_name, candidate_id, start_datetime, start_datetime)
+                )
+            logger.info(f"Мероприятие '{title}' добавлено с ID={candidate_id}")
+        except Exception as e:
+            logger.error(f"[DB] Ошибка при добавлении мероприятия: {e}")
+            return False
+
+        # ML-обработка: вектор считается в потоке, чтобы не блокировать цикл событий
+        if self.ml_service is not None and self.ml_service.is_ready:
+            new_event = {
+                "id": candidate_id,
+                "title": title,
+                "description": description,
+                "tags": tags_list,
+                "status_ml": status_ml
+            }
+            try:
+                await asyncio.to_thread(self.ml_service.get_event_vector, new_event)
+                logger.info(f"ML-обработка события ID={candidate_id} завершена")
+            except Exception as ml_e:
+                logger.error(f"[ML] Ошибка при обработке события ID={candidate_id}: {ml_e}")
+
+        return True
+
+    # --- Друзья ---
+
+    async def add_friend(self, user_id: int, friend_id: int) -> bool:
+        """Добавляет дружбу в обе стороны."""
+        try:
+            await self._execute(
+                """
+                INSERT INTO friends (user_id, friend_id)
+                VALUES (%s, %s), (%s, %s)
+                ON CONFLICT (user_id, friend_id) DO NOTHING
+                """,
+                (user_id, friend_id, friend_id, user_id)
+            )
+            return True
+        except Exception as e:
+            logger.error(f"Ошибка при добавлении друга {friend_id} для {user_id}: {e}")
+            return False
+
+    async def get_friends(self, user_id: int) -> List[Dict]:
+        """Возвращает друзей пользователя: [{"id": ..., "name": ...}]."""
+        try:
+            rows = await self._fetchall(
+                """
+                SELECT f.friend_id, u.name
+                FROM friends f
+                JOIN users u ON f.friend_id = u.id
+                WHERE f.user_id = %s
+                ORDER BY u.name
+                """,
+                (user_id,)
+            )
+            return [{"id": r[0], "name": r[1] or f"Друг {r[0]}"} for r in rows]
+        except Exception as e:
+            logger.error(f"Ошибка при получении друзей для {user_id}: {e}")
+            return []
+
+    async def remove_friend(self, user_id: int, friend_id: int) -> bool:
+        """Удаляет друга из списка."""
+        try:
+            await self._execute(
+                "DELETE FROM friends WHERE user_id = %s AND friend_id = %s",
+                (user_id, friend_id)
+            )
+            logger.info(f"Друг {friend_id} удалён для пользователя {user_id}")
+            return True
+        except Exception as e:
+            logger.error(f"Ошибка при удалении друга {friend_id} для {user_id}: {e}")
+            return False
+
+    async def are_friends(self, user_id: int, friend_id: int) -> bool:
+        """Проверяет, являются ли пользователи друзьями."""
+        try:
+            row = await self._fetchone(
+                "SELECT 1 FROM friends WHERE user_id = %s AND friend_id = %s",
+                (user_id, friend_id)
+            )
+            return row is not None
+        except Exception as e:
+            logger.error(f"Ошибка при проверке дружбы между {user_id} и {friend_id}: {e}")
+            return False
+
+    async def _confirmed_events(self, user_id: int, after_ts: Optional[int]) -> List[Dict]:
+        rows = await self._fetchall(
+            """
+            SELECT e.id, e.title, e.start_datetime, e.event_url, e.city
+            FROM user_confirmed_events uce
+            JOIN events e ON uce.event_id = e.id
+            WHERE uce.user_id = %s
+            AND uce.confirmed_at IS NOT NULL
+            AND (%s::bigint IS NULL OR e.start_datetime > %s::bigint)
+            ORDER BY e.start_datetime
+            """,
+            (user_id, after_ts, after_ts)
+        )
+        return [
+            {
+                "event_id": r[0],
+                "title": r[1],
+                "start_datetime": r[2],
+                "event_url": r[3],
+                "city": r[4]
+            }
+            for r in rows
+        ]
+
+    async def get_confirmed_events_for_user(self, user_id: int) -> List[Dict]:
+        """Возвращает список подтверждённых мероприятий пользователя."""
+        try:
+            return await self._confirmed_events(user_id, None)
+        except Exception as e:
+            logger.error(f"[DB] Ошибка при получении подтверждённых событий для {user_id}: {e}")
+            return []
+
+    async def get_confirmed_future_events(self, user_id: int) -> List[Dict]:
+        """Возвращает подтверждённые и ещё не прошедшие мероприятия пользователя."""
+        try:
+            return await self._confirmed_events(user_id, int(datetime.now(timezone.utc).timestamp()))
+        except Exception as e:
+            logger.error(f"[DB] Ошибка при получении будущих подтверждённых событий для {user_id}: {e}")
+            return []
+
+    # --- Приглашения ---
+
+    async def save_invitation(self, event_id: int, sender_id: int, receiver_id: int, token: str, status: str):
+        """Сохраняет приглашение в БД."""
+        await self._execute(
+            "INSERT INTO invitations (event_id, sender_id, receiver_id, token, status, created_at) "
+            "VALUES (%s, %s, %s, %s, %s, NOW())",
+            (event_id, sender_id, receiver_id, token, status)
+        )
+
+    async def get_invitation_by_token(self, token: str) -> dict | None:
+        """Получает приглашение по токену."""
+        async with self.pool.connection() as conn:
+            async with conn.cursor(row_factory=dict_row) as cur:
+                await cur.execute("SELECT * FROM invitations WHERE token = %s", (token,))
+                return await cur.fetchone()
+
+    async def update_invitation_status(self, token: str, status: str):
+        """Обновляет статус приглашения."""
+        await self._execute(
+            "UPDATE invitations SET status = %s, updated_at = NOW() WHERE token = %s",
+            (status, token)
+        )
+
+    async def get_all_users_except(self, excluded_user_id: int) -> list[dict]:
+        """Возвращает список всех пользователей, кроме указанного по ID."""
+        try:
+            async with self.pool.connection() as conn:
+                async with conn.cursor(row_factory=dict_row) as cur:
+                    await cur.execute(
+                        """
+                        SELECT id, name, city, created_at
+                        FROM users
+                        WHERE id != %s
+                        ORDER BY name
+                        """,
+                        (excluded_user_id,)
+                    )
+                    return await cur.fetchall()
+        except Exception as e:
+            logger.error(f"[ERROR] get_all_users_except: {e}")
+            return []
+
+
+def create_database(ml_service=None):
+    """
+    Выбирает слой доступа к данным по Config.DB_BACKEND:
+    "async" — AsyncDatabase_Users (psycopg 3), "threaded" — Database_Users в пуле потоков.
+    """
+    if Config.DB_BACKEND == "threaded":
+        return ThreadedDatabase_Users(ml_service=ml_service)
+    if Config.DB_BACKEND != "async":
+        raise ValueError(f"Неизвестный DB_BACKEND: {Config.DB_BACKEND}")
+    return AsyncDatabase_Users(ml_service=ml_service)
@@ -0,0 +1,78 @@
+import json
+import logging
+from collections import OrderedDict
+from typing import Iterable, List, Optional
+
+from redis.exceptions import RedisError
+
+logger = logging.getLogger(__name__)
+
+
+class EventCardCache:
+    """
+    Карточки событий для показа рекомендаций, чтобы в FSM хранились только id и индекс.
+
+    Два уровня:
+      - LRU в процессе бота (OrderedDict, до maxsize карточек) — без сети;
+      - Redis event_card:{id} (JSON с TTL) — общий для процессов и переживает рестарт.
+    Карточка — кандидат в формате candidate_row (с place_data и status_ml).
+    """
+
+    def __init__(self, client, ttl: int, maxsize: int):
+        # client — redis.asyncio.Redis с decode_responses=True
+        self.client = client
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._lru: "OrderedDict[int, dict]" = OrderedDict()
+
+    @staticmethod
+    def _key(event_id: int) -> str:
+        return f"event_card:{event_id}"
+
+    def _remember(self, event: dict) -> None:
+        event_id = int(event["id"])
+        self._lru[event_id] = event
+        self._lru.move_to_end(event_id)
+        while len(self._lru) > self.maxsize:
+            self._lru.popitem(last=False)
+
+    async def put_many(self, events: Iterable[dict]) -> List[int]:
+        """Кладёт карточки в оба уровня, возвращает их id в исходном порядке."""
+        ids = []
+        try:
+            pipe = self.client.pipeline(transaction=False)
+            for event in events:
+                self._remember(event)
+                ids.append(int(event["id"]))
+                pipe.set(
+                    self._key(event["id"]),
+                    json.dumps(event, ensure_ascii=False, default=str),
+                    ex=self.ttl
+                )
+            await pipe.execute()
+        except RedisError as e:
+            # Карточки остались в LRU этого процесса — показ продолжится
+            logger.warning(f"[event_cards] Ошибка записи карточек в Redis: {e}")
+        return ids
+
+    async def get(self, event_id: int) -> Optional[dict]:
+        """Карточка из LRU, затем из Redis; None — карточка вытеснена и истекла."""
+        event_id = int(event_id)
+        event = self._lru.get(event_id)
+        if event is not None:
+            self._lru.move_to_end(event_id)
+            return event
+
+        try:
+            raw = await self.client.get(self._key(event_id))
+        except RedisError as e:
+            logger.warning(f"[event_cards] Ошибка чтения карточки {event_id}: {e}")
+            return None
+        if not raw:
+            return None
+        try:
+            event = json.loads(raw)
+        except ValueError:
+            return None
+        self._remember(event)
+        return event
@@ -4,7 +4,7 @@ from logging.handlers import RotatingFileHandler
 from aiogram import Bot, Dispatcher, F, types
 from aiogram.filters import Command
 from config import CONFIG
-from db import Database_Users
+from db_async import create_database
 from ml import MLService
 from new import (
     start,
@@ -30,6 +30,7 @@ from new import (
     AddEventStates
 )
 import ssl
+import hmac
 from aiohttp import web
 
 # Импортируем планировщик
@@ -84,8 +85,9 @@ async def on_startup(app: web.Application):
     """Действия при запуске сервера."""
     try:
         # Инициализация сервисов (без загрузки модели)
-        bot.db = Database_Users()
         bot.ml = MLService()  # Создаём экземпляр без загрузки модели
+        bot.db = create_database(ml_service=bot.ml)
+        await bot.db.open()
 
         # Установка вебхука
         webhook_url = f"http://{CONFIG.WEBHOOK_HOST}:{CONFIG.WEBHOOK_PORT}{CONFIG.WEBHOOK_PATH}"
@@ -116,6 +118,9 @@ async def on_shutdown(app: web.Application):
             scheduler.shutdown()
             logger.info("Планировщик остановлен")
 
+        if getattr(bot, "db", None) is not None:
+            await bot.db.close()
+
         logger.info("Бот остановлен.")
 
     except Exception as e:
@@ -137,12 +142,24 @@ async def handle_webhook(request: web.Request):
 async def health_handler(request: web.Request):
     return web.Response(text="OK", status=200)
 
+async def db_stats_handler(request: web.Request):
+    """Метрики насыщения пула БД для подбора DB_POOL_MAX_SIZE (только с X-Admin-Token)."""
+    token = request.headers.get("X-Admin-Token", "")
+    if not hmac.compare_digest(token.encode(), CONFIG.DB_STATS_TOKEN.encode()):
+        return web.Response(status=403)
+    return web.json_response(bot.db.stats())
+
 def setup_routes():
     """Настройка маршрутов сервера."""
     path = CONFIG.WEBHOOK_PATH.lstrip("/")
     app.router.add_post(f"/{path}", handle_webhook)
     app.router.add_get("/health", health_handler)  # Добавляем healthcheck
-    logger.info(f"Маршруты настроены: POST /{path}, GET /health")
+    routes = [f"POST /{path}", "GET /health"]
+    # Порт вебхука публичный: статистику пула отдаём только при заданном токене
+    if CONFIG.DB_STATS_TOKEN:
+        app.router.add_get("/db_stats", db_stats_handler)
+        routes.append("GET /db_stats")
+    logger.info(f"Маршруты настроены: {', '.join(routes)}")
 
 
 async def main():
@@ -6,7 +6,7 @@ from aiogram import Bot, Dispatcher, F, types
 from aiogram.filters import Command, StateFilter
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
 from config import CONFIG
-from db import Database_Users
+from db_async import create_database
 from ml import MLService
 from scheduled import setup_scheduler, scheduler
 
@@ -86,8 +86,9 @@ async def main():
     dp = Dispatcher()
 
     # Прикрепление зависимостей к боту (без инициализации ML-модели)
-    bot.db = Database_Users()
     bot.ml = MLService()  # Создаём экземпляр без загрузки модели
+    bot.db = create_database(ml_service=bot.ml)
+    await bot.db.open()
 
     try:
         # Запуск планировщика
@@ -187,7 +188,8 @@ async def main():
             scheduler.shutdown()
             logger.info("Планировщик остановлен")
 
-        # Закрытие сессий бота
+        # Закрытие пула соединений и сессий бота
+        await bot.db.close()
         await bot.session.close()
         logger.info("Бот остановлен.")
 
@@ -1,5 +1,3 @@
-import torch
-import torch.nn as nn
 import numpy as np
 from sentence_transformers import SentenceTransformer
 from redis import Redis
@@ -8,19 +6,16 @@ from config import Config
 import os
 import logging
 from datetime import datetime
+import sys
 
+# Корень проекта в sys.path — общее хранилище эмбеддингов лежит в ai/
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(1, project_root)
 
-
-class RNNModel(nn.Module):
-    def __init__(self, input_size, hidden_size=64, num_layers=2):
-        super().__init__()
-        self.lstm = nn.LSTM(input_size, hidden_size, num_layers, batch_first=True)
-        self.fc = nn.Linear(hidden_size, input_size)
-
-
-    def forward(self, x):
-        out, _ = self.lstm(x)
-        return self.fc(out[:, -1, :])
+from ai.embedding_store import EmbeddingStore, event_text
+from ai.event_index import EventEmbeddingIndex
+from ai.status_profile import CategoryCatalogue, update_profile
+from ai.rnn_model import ACTION_WEIGHTS, RNNModel, load_checkpoint, predict_next
 
 
 cache_dir = '/app/.cache/huggingface'
@@ -30,10 +25,21 @@ class MLService:
     def __init__(self):
         self.model = None
         self.redis = Redis(host=Config.REDIS_HOST, port=Config.REDIS_PORT)
+        self.embeddings = EmbeddingStore(self.redis, Config.MODEL_NAME, ttl=Config.CACHE_TTL)
+        # Нормированные векторы кандидатов в памяти процесса (пересобирается планировщиком)
+        self.index = EventEmbeddingIndex(self.embeddings)
+        # Только инференс: веса обучает train_rnn_worker.py, бот подхватывает их в reload_rnn
         self.rnn = RNNModel(input_size=384)
-        self.optimizer = torch.optim.Adam(self.rnn.parameters(), lr=0.001)
-        self.criterion = nn.MSELoss()        
         self._is_ready = False
+        # mtime загруженного чекпоинта train_rnn_worker.py (0 — веса не загружались)
+        self._rnn_mtime = 0.0
+        # Фиксированный порядок кластеров: профиль users.status_vec (real[]) и векторы status_ml событий
+        try:
+            self.catalogue = CategoryCatalogue.from_file(Config.СLUSTERS_PATH)
+        except Exception as e:
+            # Без каталога лайки обновляют профиль по-старому, в JSONB status_ml
+            logging.error(f"Каталог кластеров {Config.СLUSTERS_PATH} не загружен: {e}")
+            self.catalogue = None
 
 
     async def initialize(self):
@@ -50,104 +56,140 @@ class MLService:
             logging.error(f"Ошибка загрузки модели MLService: {e}", exc_info=True)
             raise
 
+    def reload_rnn(self) -> bool:
+        """
+        Подхватывает веса RNN из Config.RNN_CHECKPOINT_PATH, если файл новее загруженного.
+        Модель собирается целиком и подменяется одним присваиванием — запросы не видят полузагруженных весов.
+        Вызывается из планировщика в потоке, не в цикле событий.
+        """
+        try:
+            mtime = os.path.getmtime(Config.RNN_CHECKPOINT_PATH)
+        except OSError:
+            return False
+        if mtime <= self._rnn_mtime:
+            return False
+        try:
+            model = load_checkpoint(Config.RNN_CHECKPOINT_PATH)
+        except Exception as e:
+            logging.error(f"Не удалось загрузить чекпоинт RNN {Config.RNN_CHECKPOINT_PATH}: {e}", exc_info=True)
+            return False
+        self.rnn = model
+        self._rnn_mtime = mtime
+        logging.info(f"Веса RNN обновлены из {Config.RNN_CHECKPOINT_PATH}")
+        return True
+
     @property
     def is_ready(self) -> bool:
         return self._is_ready
     
-    def _cache_key(self, text: str) -> str:
-        return f'vec:{hash(text) % 1000000}'
+    def _encode_batch(self, texts: list) -> np.ndarray:
+        return self.model.encode(texts, batch_size=Config.BATCH_SIZE)
 
     def encode_text(self, text: str) -> np.ndarray:
-        key = self._cache_key(text)
-        cached = self.redis.get(key)
-        if cached:
-            return np.frombuffer(cached, dtype=np.float32)
-        vector = self.model.encode([text], batch_size=Config.BATCH_SIZE)[0]
-        self.redis.set(key, vector.tobytes())
-        return vector
+        return self.embeddings.get_or_encode([text], self._encode_batch, Config.BATCH_SIZE)[0]
 
     def get_event_vector(self, event: dict) -> np.ndarray:
-        text = f"{event['title']} {event['description']}"
-        return self.encode_text(text)
-
+        return self.encode_text(event_text(event))
 
-    def train_rnn(self, user_history: list, events: list):
-        vectors = []
-        for item in user_history[-Config.RNN_SEQ_LEN:]:
-            event = next((e for e in events if e["id"] == item["event_id"]), None)
-            if event:
-                vec = self.get_event_vector(event)
-                weight = 1.0 if item["rating"] == "like" else -0.3
-                vectors.append(vec * weight)
+    def get_event_vectors(self, events: list) -> np.ndarray:
+        """Векторы событий одним MGET; промахи кодируются батчами (в т.ч. посчитанные синком)"""
+        return self.embeddings.get_or_encode(
+            [event_text(ev) for ev in events], self._encode_batch, Config.BATCH_SIZE
+        )
 
-        if len(vectors) < 2:
-            return
-        X = np.array(vectors[:-1]).reshape(1, -1, 384)
-        y = np.array(vectors[-1]).reshape(1, -1)
-        X_tensor = torch.tensor(X, dtype=torch.float32)
-        y_tensor = torch.tensor(y, dtype=torch.float32)
-        self.optimizer.zero_grad()
-        output = self.rnn(X_tensor)
-        loss = self.criterion(output, y_tensor)
-        loss.backward()
-        self.optimizer.step()
-
-    def recommend(self, user_history: list, candidates: list) -> list:
+    def rebuild_index(self, events: list) -> int:
+        """Пересобирает индекс эмбеддингов; до загрузки модели — только векторы, уже лежащие в Redis"""
+        encode = self._encode_batch if self._is_ready else None
+        return self.index.build(events, encode, Config.BATCH_SIZE)
+
+    def _candidate_scores(self, query: np.ndarray, candidates: list) -> np.ndarray:
+        """Косинусное сходство со всеми кандидатами: одно умножение по индексу, промахи — через Redis/модель"""
+        scores = self.index.scores(query, [ev["id"] for ev in candidates])
+        missing = np.flatnonzero(np.isnan(scores))
+        if len(missing):
+            vectors = self.get_event_vectors([candidates[i] for i in missing])
+            norms = np.linalg.norm(vectors, axis=1) * np.linalg.norm(query)
+            norms[norms == 0] = 1.0
+            scores[missing] = (vectors @ query) / norms
+        return scores
+
+    @staticmethod
+    def rnn_history_ids(user: dict) -> list:
+        """
+        id событий истории, векторы которых нужны RNN (последние RNN_SEQ_LEN действий);
+        пустой список — истории мало и recommend_scored уйдёт в status_ml.
+        """
+        user_history = user.get("event_history") or []
+        if len(user_history) < Config.RNN_SEQ_LEN // 2:
+            return []
+        return [item["event_id"] for item in user_history[-Config.RNN_SEQ_LEN:]]
+
+    def _history_vector(self, event_id: int, history_vectors: dict):
+        """Вектор события истории: events.embedding, иначе строка индекса (событие ещё среди кандидатов)"""
+        vector = history_vectors.get(event_id)
+        if vector is not None:
+            return np.asarray(vector, dtype=np.float32)
+        return self.index.vector(event_id)
+
+    def recommend(self, user: dict, candidates: list, history_vectors: dict = None) -> list:
+        return [ev for ev, _ in self.recommend_scored(user, candidates, history_vectors)]
+
+    def recommend_scored(self, user: dict, candidates: list, history_vectors: dict = None) -> list:
+        """
+        Как recommend, но возвращает пары (событие, score) — для кеша рекомендаций.
+        history_vectors — {event_id: эмбеддинг} для rnn_history_ids(user) (db.get_event_embeddings):
+        оценённых событий среди кандидатов нет, их отсекает anti-join по user_event_actions.
+        """
+        user_history = user.get("event_history") or []
         if len(user_history) < Config.RNN_SEQ_LEN // 2:
-            return self._recommend_by_status_ml(user_history, candidates)
+            return self._recommend_by_status_ml(user, candidates)
         last_vecs = []
         for item in user_history[-Config.RNN_SEQ_LEN:]:
-            event = next((e for e in candidates if e["id"] == item["event_id"]), None)
-            if event:
-                last_vecs.append(self.get_event_vector(event))
+            vector = self._history_vector(item["event_id"], history_vectors or {})
+            if vector is not None:
+                # Вес действия — как в окнах train_rnn_worker.py
+                last_vecs.append(vector * ACTION_WEIGHTS.get(item["rating"], 1.0))
         if len(last_vecs) < 2:
-            return self._recommend_by_status_ml(user_history, candidates)
-        X = np.array(last_vecs[:-1]).reshape(1, -1, 384)
-        X_tensor = torch.tensor(X, dtype=torch.float32)
-        pred_vec = self.rnn(X_tensor).detach().numpy().flatten()
-        scores = []
-        for ev in candidates:
-            ev_vec = self.get_event_vector(ev)
-                # Косинусное сходство
-            cos_sim = np.dot(pred_vec, ev_vec) / (np.linalg.norm(pred_vec) * np.linalg.norm(ev_vec))
-            scores.append((ev, cos_sim))
-            
-            # Сортируем по убыванию сходства
-        sorted_scores = sorted(scores, key=lambda x: x[1], reverse=True)
-        return [item[0] for item in sorted_scores[:Config.RECOMMEND_COUNT]]
-
-
-    def _recommend_by_status_ml(self, user_history: list, candidates: list) -> list:
-        """Базовая рекомендация через сравнение status_ml"""
-        if not user_history:
-            return candidates[:Config.RECOMMEND_COUNT]
-        
-        # Собираем все кластеры из истории с весами
-        user_clusters = {}
-        for item in user_history:
-            if item["rating"] == "like":
-                event = next((e for e in candidates if e["id"] == item["event_id"]), None)
-                if event:
-                    for cluster in event["status_ml"]:
-                        cat = cluster["category"]
-                        score = cluster["score"]
-                        if cat in user_clusters:
-                            user_clusters[cat] += score * 0.3
-                        else:
-                            user_clusters[cat] = score * 0.3
-        
-        # Оцениваем кандидаты
-        scores = []
-        for ev in candidates:
-            total_score = 0
-            for cluster in ev["status_ml"]:
-                if cluster["category"] in user_clusters:
-                    total_score += cluster["score"] * user_clusters[cluster["category"]]
-            scores.append((ev, total_score))
-        
-        sorted_scores = sorted(scores, key=lambda x: x[1], reverse=True)
-        return [item[0] for item in sorted_scores[:Config.RECOMMEND_COUNT]]
+            return self._recommend_by_status_ml(user, candidates)
+        if not candidates:
+            return []
+        # Вход — последние RNN_SEQ_LEN - 1 событий, модель предсказывает следующее
+        pred_vec = predict_next(self.rnn, np.vstack(last_vecs[-(Config.RNN_SEQ_LEN - 1):]))
+        scores = self._candidate_scores(pred_vec, candidates)
+
+        # Сортируем по убыванию сходства (stable — при равенстве порядок кандидатов из SQL)
+        order = np.argsort(-scores, kind="stable")[:Config.RECOMMEND_COUNT]
+        return [(candidates[i], float(scores[i])) for i in order]
+
+
+    def _recommend_by_status_ml(self, user: dict, candidates: list) -> list:
+        """
+        Базовая рекомендация через сравнение status_ml: [(событие, score), ...].
+        Интересы пользователя — накопленный по лайкам профиль (user_profile): лайкнутых
+        событий среди кандидатов нет, их отсекает anti-join по user_event_actions.
+        """
+        if not candidates:
+            return []
+        if self.catalogue is None:
+            # Без каталога профиль не построить — порядок кандидатов из SQL
+            return [(ev, 0.0) for ev in candidates[:Config.RECOMMEND_COUNT]]
+
+        # Оцениваем кандидаты одним умножением: score события × вес категории пользователя
+        event_matrix = np.vstack([self.catalogue.to_vector(ev.get("status_ml")) for ev in candidates])
+        scores = event_matrix @ self.user_profile(user)
+
+        # stable — при равных оценках сохраняется порядок кандидатов из SQL
+        order = np.argsort(-scores, kind="stable")[:Config.RECOMMEND_COUNT]
+        return [(candidates[i], float(scores[i])) for i in order]
     
+    def user_profile(self, user: dict) -> np.ndarray:
+        """Профиль пользователя по каталогу: status_vec, а до первой записи — из JSONB status_ml"""
+        return self.catalogue.profile(user.get("status_vec"), user.get("status_ml"))
+
+    def update_user_profile(self, user: dict, event_status, weight: float) -> np.ndarray:
+        """Плотная версия update_user_status_ml: профиль + вектор события × weight с обрезкой в [0, 1]"""
+        return update_profile(self.user_profile(user), self.catalogue.to_vector(event_status), weight)
+
     def update_user_status_ml(self, user_status: list, event_status: list, weight: float) -> list:
         # Логируем исходное состояние
         logging.info(
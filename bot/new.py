@@ -13,8 +13,11 @@ import hashlib
 import logging
 from datetime import datetime
 import pytz
+import numpy as np
 import redis.asyncio as redis
 from config import Config
+from rec_cache import RecommendationCache
+from event_cards import EventCardCache
 import time
 from pydantic import BaseModel
 from typing import List, Dict, Optional, Tuple
@@ -134,30 +137,25 @@ async def start(message: Message, state: FSMContext):
         referral_code = args[1][4:]
         logger.info(f"[start] Обнаружен реферальный код: {referral_code}")
         try:
-            referrer_id = db.get_user_by_referral_code(referral_code)
+            referrer_id = await db.get_user_by_referral_code(referral_code)
             if referrer_id and referrer_id != user_id:
                 # Всегда пытаемся добавить дружбу
                 try:
-                    db.add_friend(user_id, referrer_id)
+                    await db.add_friend(user_id, referrer_id)
                     logger.info(f"[start] Друг добавлен: {user_id} ↔ {referrer_id}")
                 except Exception as e:
                     logger.error(f"[start] Ошибка при добавлении в друзья: {e}")
 
                 # Если пользователь ещё не в БД — добавляем
-                if not db.get_user(user_id):
+                if not await db.get_user(user_id):
                     full_name = f"{message.from_user.first_name} {message.from_user.last_name}" \
                         if message.from_user.last_name else message.from_user.first_name
-                    with db.conn.cursor() as cur:
-                        cur.execute(
-                            "INSERT INTO users (id, name) VALUES (%s, %s)",
-                            (user_id, full_name)
-                        )
-                    db.conn.commit()
+                    await db.create_user(user_id, full_name)
                     logger.info(f"[start] Пользователь {user_id} добавлен в БД с именем {full_name}")
 
                 # Добавляем реферральную запись
-                if not db.is_already_referred(user_id, referrer_id):
-                    success = db.add_referral(user_id, referrer_id, referral_code)
+                if not await db.is_already_referred(user_id, referrer_id):
+                    success = await db.add_referral(user_id, referrer_id, referral_code)
                     if success:
                         await message.answer(
                             f"🎉 Вы, {full_name}, присоединились по реферальной ссылке от {referrer_id}!\n"
@@ -180,7 +178,7 @@ async def start(message: Message, state: FSMContext):
 
     # Проверка наличия пользователя в БД
     try:
-        user = db.get_user(user_id)
+        user = await db.get_user(user_id)
         if user:
             await show_main_menu(message)
             logger.info(f"[start] Пользователь {user_id} найден в БД, показано главное меню.")
@@ -217,7 +215,7 @@ async def handle_city_selection(message: Message):
     db = message.bot.db
     user_id = message.from_user.id
 
-    if db.get_user(user_id):  # Если пользователь уже есть — сразу меню
+    if await db.get_user(user_id):  # Если пользователь уже есть — сразу меню
         await show_main_menu(message)
         logger.info(f"[handle_city_selection] Пользователь {user_id} уже в БД, показано главное меню.")
         return
@@ -238,13 +236,10 @@ async def handle_city_selection(message: Message):
     )
 
     try:
-        with db.conn.cursor() as cur:
-            cur.execute(
-                "INSERT INTO users (id, name, city) VALUES (%s, %s, %s)",
-                (user_id, full_name, city_id)
-            )
-        db.conn.commit()
+        if not await db.create_user(user_id, full_name, city_id):
+            raise RuntimeError("пользователь не создан")
         logger.info(f"Пользователь {user_id} добавлен в БД с городом {city_id}, имя: {full_name}")
+        await rec_cache.invalidate(user_id)
         await show_main_menu(message)
     except Exception as e:
         logger.error(f"Ошибка регистрации {user_id}: {e}")
@@ -273,69 +268,80 @@ async def show_main_menu(message: Message):
 
 
 # --- РЕКОМЕНДАЦИИ ---
-async def recommend_main_interest(message: Message, bot, state: FSMContext):
-    logger.info(f"[recommend] Запуск рекомендации для user_id={message.from_user.id}")
-    db = bot.db
-    user_id = message.from_user.id
+def _search_tables(user: dict) -> List[str]:
+    """Таблицы (города) для поиска кандидатов по городу пользователя."""
+    city = user.get("city")
+    return ["msk"] if city == 1 else ["spb"] if city == 2 else ["msk", "spb"]
 
-    try:
-        user = db.get_user(user_id)
-        if not user:
-            await message.answer("Сначала напишите /start")
-            logger.warning(f"[recommend] Пользователь {user_id} не найден в БД.")
-            return
 
-        # События, с которыми пользователь взаимодействовал
-        interacted = {
-            action["event_id"] for action in user.get("event_history", [])
-        }
-        logger.debug(f"[recommend] События, с которыми взаимодействовал пользователь: {interacted}")
+async def _save_recommendations(state: FSMContext, events: List[dict]) -> None:
+    """
+    Кладёт список рекомендаций в FSM.
+    При FSM_EVENT_IDS_ONLY в состоянии только id и индекс, карточки — в event_cards;
+    иначе — полные события, как раньше.
+    """
+    if Config.FSM_EVENT_IDS_ONLY:
+        ids = await event_cards.put_many(events)
+        await state.update_data(recommended_ids=ids, recommended_events=None, current_index=0)
+    else:
+        await state.update_data(recommended_events=events, recommended_ids=None, current_index=0)
 
-        # Определяем таблицы для поиска
-        city = user.get("city")
-        tables = ["msk"] if city == 1 else ["spb"] if city == 2 else ["msk", "spb"]
-        logger.info(f"[recommend] Таблицы для поиска: {tables}, город пользователя: {city}")
 
+def _recommended_count(data: dict) -> int:
+    """Длина текущего списка рекомендаций в любом из режимов FSM."""
+    ids = data.get("recommended_ids")
+    if ids is not None:
+        return len(ids)
+    return len(data.get("recommended_events") or [])
 
-        # Собираем кандидатов из всех таблиц
-        all_candidates = []
-        for table in tables:
-            candidates = db.get_recommended_interest(
-                table_name=table,
-                limit=12,
-                exclude_event_ids=interacted
-            )
-            all_candidates.extend(candidates)
-            logger.debug(f"[recommend] Найдено {len(candidates)} кандидатов из таблицы {table}")
 
+async def _recommended_event(data: dict, event_id: int) -> Optional[dict]:
+    """Событие из текущего списка рекомендаций по id."""
+    if data.get("recommended_ids") is not None:
+        return await event_cards.get(event_id)
+    recommended = data.get("recommended_events") or []
+    return next((e for e in recommended if str(e["id"]) == str(event_id)), None)
 
 
+async def recommend_main_interest(message: Message, bot, state: FSMContext):
+    logger.info(f"[recommend] Запуск рекомендации для user_id={message.from_user.id}")
+    db = bot.db
+    user_id = message.from_user.id
+
+    try:
+        # Повторный запрос в пределах TTL — один round trip в Redis, без Postgres
+        all_candidates, generation = await rec_cache.lookup(user_id, "interest")
+        if all_candidates is not None:
+            logger.info(f"[recommend] Список из кеша для {user_id}: {len(all_candidates)} событий")
+        else:
+            user = await db.get_user(user_id)
+            if not user:
+                await message.answer("Сначала напишите /start")
+                logger.warning(f"[recommend] Пользователь {user_id} не найден в БД.")
+                return
 
-        # === ПОЛУЧАЕМ ДАННЫЕ МЕСТ ДЛЯ ВСЕХ РЕКОМЕНДОВАННЫХ СОБЫТИЙ ===
-        enhanced_recommended = []
-        for event in all_candidates:
-            event_id = event["id"]
-            place_data = None
+            # Определяем таблицы для поиска
+            tables = _search_tables(user)
+            logger.info(f"[recommend] Таблицы для поиска: {tables}, город пользователя: {user.get('city')}")
 
-            # Определяем, из какой таблицы брать place_id (можно уточнить логику)
-            # Здесь берём первую подходящую таблицу из tables
+            # Собираем кандидатов из всех таблиц
+            all_candidates = []
             for table in tables:
-                try:
-                    place_data = db.get_place_by_event_id(event_id, table)
-                    if place_data:
-                        break  # Нашли — выходим из цикла
-                except Exception as e:
-                    logger.warning(f"[recommend] Не удалось получить место для event_id={event_id} из таблицы {table}: {e}")
+                # Уже оценённые события отсекаются в БД anti-join'ом по user_event_actions
+                candidates = await db.get_recommended_interest(
+                    table_name=table,
+                    limit=12,
+                    user_id=user_id
+                )
+                all_candidates.extend(candidates)
+                logger.debug(f"[recommend] Найдено {len(candidates)} кандидатов из таблицы {table}")
 
-            # Добавляем place_data к событию
-            enhanced_event = {**event, "place_data": place_data}
-            enhanced_recommended.append(enhanced_event)
+            if all_candidates:
+                # Порядок задаёт SQL (тег, популярность, старт) — собственного score нет
+                await rec_cache.store(user_id, "interest", [(ev, None) for ev in all_candidates], generation)
 
-        # Сохраняем в state: уже с прикреплёнными данными места
-        await state.update_data(
-            recommended_events=enhanced_recommended,
-            current_index=0
-        )
+        # Данные места (title, address, site_url) уже пришли в place_data вместе с кандидатами
+        await _save_recommendations(state, all_candidates)
 
         await show_event(message, state)
         logger.info(f"[recommend] Данные сохранены в FSM, запущено отображение событий для {user_id}")
@@ -353,39 +359,57 @@ async def recommend(message: Message, bot, state: FSMContext):
     user_id = message.from_user.id
 
     try:
-        user = db.get_user(user_id)
-        if not user:
-            await message.answer("Сначала напишите /start")
-            logger.warning(f"[recommend] Пользователь {user_id} не найден в БД.")
-            return
-
-        # События, с которыми пользователь взаимодействовал
-        interacted = {
-            action["event_id"] for action in user.get("event_history", [])
-        }
-        logger.debug(f"[recommend] События, с которыми взаимодействовал пользователь: {interacted}")
-
-        # Определяем таблицы для поиска
-        city = user.get("city")
-        tables = ["msk"] if city == 1 else ["spb"] if city == 2 else ["msk", "spb"]
-        logger.info(f"[recommend] Таблицы для поиска: {tables}, город пользователя: {city}")
-
-
-        # Собираем кандидатов из всех таблиц
-        all_candidates = []
-        for table in tables:
-            candidates = db.get_recommended_events(
-                table_name=table,
-                limit=50,
-                exclude_event_ids=interacted
-            )
-            all_candidates.extend(candidates)
-            logger.debug(f"[recommend] Найдено {len(candidates)} кандидатов из таблицы {table}")
+        # Повторный запрос в пределах TTL — один round trip в Redis, без Postgres и ML
+        recommended, generation = await rec_cache.lookup(user_id, "ml")
+        if recommended is not None:
+            logger.info(f"[recommend] Список из кеша для {user_id}: {len(recommended)} событий")
+        else:
+            user = await db.get_user(user_id)
+            if not user:
+                await message.answer("Сначала напишите /start")
+                logger.warning(f"[recommend] Пользователь {user_id} не найден в БД.")
+                return
 
+            # Определяем таблицы для поиска
+            tables = _search_tables(user)
+            logger.info(f"[recommend] Таблицы для поиска: {tables}, город пользователя: {user.get('city')}")
 
-        # ML‑рекомендация
-        recommended = ml.recommend(user.get("event_history", []), all_candidates)
-        logger.info(f"[recommend] Рекомендовано: {len(recommended)} событий")
+            # Сначала готовый ночной список (recommendations_batch.py) — без расчёта модели
+            scored = []
+            for table in tables:
+                scored.extend(await db.get_precomputed_recommendations(table, user_id, Config.RECOMMEND_COUNT))
+            if scored:
+                scored = sorted(scored, key=lambda item: item[1], reverse=True)[:Config.RECOMMEND_COUNT]
+                logger.info(f"[recommend] Готовый ночной список для {user_id}: {len(scored)} событий")
+            else:
+                # Запасной путь: онлайн-расчёт по кандидатам из всех таблиц.
+                # Сначала ближайшие к лайкам пользователя по всему каталогу (pgvector),
+                # без лайков — популярные из upcoming_events_<city>
+                all_candidates = []
+                for table in tables:
+                    # Уже оценённые события отсекаются в БД anti-join'ом по user_event_actions
+                    candidates = await db.get_similar_events(
+                        table_name=table,
+                        user_id=user_id,
+                        limit=50
+                    )
+                    if not candidates:
+                        candidates = await db.get_recommended_events(
+                            table_name=table,
+                            limit=50,
+                            user_id=user_id
+                        )
+                    all_candidates.extend(candidates)
+                    logger.debug(f"[recommend] Найдено {len(candidates)} кандидатов из таблицы {table}")
+
+                # ML‑рекомендация: векторы истории для RNN — по id событий из events.embedding
+                history_ids = ml.rnn_history_ids(user)
+                history_vectors = await db.get_event_embeddings(history_ids) if history_ids else {}
+                scored = ml.recommend_scored(user, all_candidates, history_vectors)
+            recommended = [ev for ev, _ in scored]
+            logger.info(f"[recommend] Рекомендовано: {len(recommended)} событий")
+            if scored:
+                await rec_cache.store(user_id, "ml", scored, generation)
 
         if not recommended:
             await message.answer(
@@ -395,31 +419,8 @@ async def recommend(message: Message, bot, state: FSMContext):
             logger.info(f"[recommend] Нет рекомендаций для user_id={user_id}")
             return
 
-        # === ПОЛУЧАЕМ ДАННЫЕ МЕСТ ДЛЯ ВСЕХ РЕКОМЕНДОВАННЫХ СОБЫТИЙ ===
-        enhanced_recommended = []
-        for event in recommended:
-            event_id = event["id"]
-            place_data = None
-
-            # Определяем, из какой таблицы брать place_id (можно уточнить логику)
-            # Здесь берём первую подходящую таблицу из tables
-            for table in tables:
-                try:
-                    place_data = db.get_place_by_event_id(event_id, table)
-                    if place_data:
-                        break  # Нашли — выходим из цикла
-                except Exception as e:
-                    logger.warning(f"[recommend] Не удалось получить место для event_id={event_id} из таблицы {table}: {e}")
-
-            # Добавляем place_data к событию
-            enhanced_event = {**event, "place_data": place_data}
-            enhanced_recommended.append(enhanced_event)
-
-        # Сохраняем в state: уже с прикреплёнными данными места
-        await state.update_data(
-            recommended_events=enhanced_recommended,
-            current_index=0
-        )
+        # Данные места (title, address, site_url) уже пришли в place_data вместе с кандидатами
+        await _save_recommendations(state, recommended)
 
         await show_event(message, state)
         logger.info(f"[recommend] Данные сохранены в FSM, запущено отображение событий для {user_id}")
@@ -445,10 +446,9 @@ async def show_event(
         return
 
     data = await state.get_data()
-    recommended: list[dict] = data.get("recommended_events", [])
     current_index: int = data.get("current_index", 0)
 
-    if current_index >= len(recommended):
+    if current_index >= _recommended_count(data):
         msg = "Больше нет рекомендаций."
         if isinstance(message_or_callback, CallbackQuery):
             await message_or_callback.message.answer(msg)
@@ -457,7 +457,18 @@ async def show_event(
         logger.info("[show_event] Все рекомендации показаны.")
         return
 
-    event = recommended[current_index]
+    recommended_ids = data.get("recommended_ids")
+    if recommended_ids is not None:
+        event_id = recommended_ids[current_index]
+        event = await event_cards.get(event_id)
+        if event is None:
+            # Карточка вытеснена из LRU и истекла в Redis — пропускаем событие
+            logger.warning(f"[show_event] Нет карточки события {event_id}, переход к следующему")
+            await state.update_data(current_index=current_index + 1)
+            await show_event(message_or_callback, state, attempt)
+            return
+    else:
+        event = data["recommended_events"][current_index]
     event_id = event["id"]
 
     # Берём place_data прямо из события (уже загружено в recommend)
@@ -536,7 +547,7 @@ async def button_handler(callback: CallbackQuery, bot, state: FSMContext):
     db = bot.db
     ml = bot.ml
 
-    user = db.get_user(user_id)
+    user = await db.get_user(user_id)
     if not user:
         await callback.answer("Ошибка: пользователь не найден.")
         await callback.message.edit_reply_markup(None)
@@ -547,14 +558,23 @@ async def button_handler(callback: CallbackQuery, bot, state: FSMContext):
         if data.startswith("like_"):
             event_id = int(data.split("_")[1])
             logger.info(f"[button_handler] Пользователь {user_id} поставил лайк событию {event_id}")
-            db.add_event_to_history(user_id, event_id, "like")
-            db.increment_event_likes(event_id, 'spb')
-            db.increment_event_likes(event_id, 'msk')
+            await db.add_event_to_history(user_id, event_id, "like")
+            await db.increment_event_likes(event_id)
 
             data_state = await state.get_data()
-            recommended = data_state.get("recommended_events", [])
-            event = next((e for e in recommended if str(e["id"]) == str(event_id)), None)
-            if event:
+            event = await _recommended_event(data_state, event_id)
+            if event and ml.catalogue is not None:
+                try:
+                    # Профиль — массив по каталогу кластеров: сложение векторов с обрезкой, без JSON
+                    new_profile = ml.update_user_profile(user, event["status_ml"], weight=0.3)
+                    logger.info(
+                        f"Пользователь {user_id} обновил статус после лайка события {event_id}. "
+                        f"Ненулевых категорий: {int(np.count_nonzero(new_profile))}"
+                    )
+                    await db.update_user_status_vec(user_id, new_profile.tolist())
+                except Exception as e:
+                    logger.error(f"Ошибка при обновлении статуса ML для {user_id}: {e}", exc_info=True)
+            elif event:
                 user_status = ensure_list_of_dicts(user["status_ml"], default=[])
                 event_status = ensure_list_of_dicts(event["status_ml"], default=[])
                 try:
@@ -563,10 +583,12 @@ async def button_handler(callback: CallbackQuery, bot, state: FSMContext):
                         f"Пользователь {user_id} обновил статус после лайка события {event_id}. "
                         f"Категории: {[c['category'] for c in new_status_ml]}"
                     )
-                    db.update_user_status_ml(user_id, serialize_for_db(new_status_ml))
+                    await db.update_user_status_ml(user_id, serialize_for_db(new_status_ml))
                 except Exception as e:
                     logger.error(f"Ошибка при обновлении статуса ML для {user_id}: {e}", exc_info=True)
 
+            # Лайк меняет историю и status_ml — сохранённые списки больше не актуальны
+            await rec_cache.invalidate(user_id)
 
             await callback.answer("Учтем в рекомендациях 😊")
             await next_event(callback, state)
@@ -576,7 +598,8 @@ async def button_handler(callback: CallbackQuery, bot, state: FSMContext):
         elif data.startswith("dislike_"):
             event_id = int(data.split("_")[1])
             logger.info(f"[button_handler] Пользователь {user_id} поставил дизлайк событию {event_id}")
-            db.add_event_to_history(user_id, event_id, "dislike")
+            await db.add_event_to_history(user_id, event_id, "dislike")
+            await rec_cache.invalidate(user_id)
             await callback.answer("Продолжаем формировать рекомендации. 😐")
             await next_event(callback, state)
             logger.info(f"[button_handler] Переход к следующему событию после дизлайка для {user_id}")
@@ -633,15 +656,15 @@ async def button_handler(callback: CallbackQuery, bot, state: FSMContext):
                     raise ValueError("Некорректный ID события")
                 event_id = int(event_id_str)
 
-                success = db.confirm_event(user_id, event_id)
+                success = await db.confirm_event(user_id, event_id)
                 if success:
+                    await rec_cache.invalidate(user_id)
                     await callback.answer("Вы подтвердили участие! 😊")
                     # Переход к следующему событию
                     data_state = await state.get_data()
                     new_index = data_state.get("current_index", 0) + 1
                     await state.update_data(current_index=new_index)
-                    recommended = data_state.get("recommended_events", [])
-                    if new_index < len(recommended):
+                    if new_index < _recommended_count(data_state):
                         await show_event(callback, state)
                         logger.info(f"[button_handler] Переход к следующему рекомендованному событию (индекс {new_index})")
                     else:
@@ -703,7 +726,7 @@ async def friend_events(message: Message, bot, state: FSMContext):
     user_id = message.from_user.id
 
     try:
-        friends = db.get_friends(user_id)
+        friends = await db.get_friends(user_id)
         if not friends:
             await message.answer("У вас пока нет друзей в боте.")
             logger.info(f"[friend_events] У пользователя {user_id} нет друзей.")
@@ -757,7 +780,7 @@ async def handle_show_confirmed_events(callback: CallbackQuery, bot, state: FSMC
     user_id = callback.from_user.id
 
     # Проверка дружбы
-    if not db.are_friends(user_id, friend_id):
+    if not await db.are_friends(user_id, friend_id):
         logger.warning(f"[handle_show_confirmed_events] user_id={user_id} пытается посмотреть мероприятия недруга friend_id={friend_id}")
         await callback.answer("Этот пользователь не в списке ваших друзей.")
         await callback.message.edit_reply_markup(None)
@@ -767,7 +790,7 @@ async def handle_show_confirmed_events(callback: CallbackQuery, bot, state: FSMC
 
     # Получение событий
     try:
-        confirmed_events = db.get_confirmed_future_events(friend_id)
+        confirmed_events = await db.get_confirmed_future_events(friend_id)
         logger.info(f"[handle_show_confirmed_events] Найдено {len(confirmed_events)} будущих подтверждённых событий для friend_id={friend_id}")
     except Exception as e:
         logger.error(f"[handle_show_confirmed_events] Ошибка при получении событий для friend_id={friend_id}: {e}", exc_info=True)
@@ -824,7 +847,7 @@ async def my_friends(message: Message, bot):
     db = bot.db
     user_id = message.from_user.id
     
-    friends = db.get_friends(user_id)
+    friends = await db.get_friends(user_id)
     
     if not friends:
         response = "У вас пока нет друзей в системе."
@@ -862,14 +885,14 @@ async def handle_select_event_for_invite(callback: CallbackQuery, bot, state: FS
             return
 
         # Получаем данные мероприятия
-        event = db.get_event_by_id(event_id)
+        event = await db.get_event_by_id(event_id)
         if not event:
             logger.error(f"[handle_select_event_for_invite] Мероприятие не найдено: event_id={event_id}")
             await callback.answer("Мероприятие не найдено.")
             return
 
         # Получаем список друзей
-        friends = db.get_friends(user_id)
+        friends = await db.get_friends(user_id)
         if not friends:
             await callback.message.edit_text("У вас нет друзей в боте, с которыми можно поделиться мероприятием.")
             await callback.answer()
@@ -938,13 +961,13 @@ async def handle_invite_event(callback: CallbackQuery, bot, state: FSMContext):
         user_id = callback.from_user.id
 
         # Проверяем, что пользователь и друг — друзья
-        if not db.are_friends(user_id, friend_id):
+        if not await db.are_friends(user_id, friend_id):
             await callback.answer("Этот пользователь не в вашем списке друзей.")
             logger.warning(f"[handle_invite_event] user_id={user_id} пытается пригласить недруга friend_id={friend_id}")
             return
 
         # Проверяем существование мероприятия
-        event = db.get_event_by_id(event_id)
+        event = await db.get_event_by_id(event_id)
         if not event:
             await callback.answer("Мероприятие не найдено.")
             logger.error(f"[handle_invite_event] Мероприятие event_id={event_id} не найдено")
@@ -1013,15 +1036,16 @@ async def handle_accept_invite(callback: CallbackQuery, bot):
         user_id = callback.from_user.id
 
         # Проверяем существование мероприятия
-        event = db.get_event_by_id(event_id)
+        event = await db.get_event_by_id(event_id)
         if not event:
             await callback.answer("Мероприятие не найдено.")
             logger.error(f"[handle_accept_invite] Мероприятие event_id={event_id} не найдено")
             return
 
         # Подтверждаем участие
-        success = db.confirm_event(user_id, event_id)
+        success = await db.confirm_event(user_id, event_id)
         if success:
+            await rec_cache.invalidate(user_id)
             # Отправляем уведомление инициатору
             try:
                 invitation_accepted_text = (
@@ -1086,7 +1110,7 @@ async def handle_decline_invite(callback: CallbackQuery, bot):
         user_id = callback.from_user.id
 
         # Проверяем существование мероприятия
-        event = db.get_event_by_id(event_id)
+        event = await db.get_event_by_id(event_id)
         if not event:
             await callback.answer("Мероприятие не найдено.")
             logger.error(f"[handle_decline_invite] Мероприятие event_id={event_id} не найдено")
@@ -1227,7 +1251,7 @@ async def add_event_command(message: Message, bot, state: FSMContext):
     user_id = message.from_user.id
 
     # Проверяем, есть ли пользователь в БД (для логирования)
-    user = db.get_user(user_id)
+    user = await db.get_user(user_id)
     if not user:
         await message.answer(
             "Чтобы предложить мероприятие, сначала напишите /start."
@@ -1470,6 +1494,10 @@ async def process_url(message: Message, state: FSMContext):
 
 
 redis_client = redis.Redis(host=Config.REDIS_HOST, port=Config.REDIS_PORT, db=0, decode_responses=True)
+# Готовые списки рекомендаций пользователя (см. rec_cache.py)
+rec_cache = RecommendationCache(redis_client, Config.REC_CACHE_TTL)
+# Карточки событий для показа рекомендаций (см. event_cards.py)
+event_cards = EventCardCache(redis_client, Config.EVENT_CARD_TTL, Config.EVENT_CARD_LRU_SIZE)
 async def confirm_event(message: Message, bot, state: FSMContext):
     if message.text == "Отменить":
         await state.clear()
@@ -1645,7 +1673,7 @@ async def handle_moderation(callback: CallbackQuery, bot):
             await bot.send_message(user_id, "Ваше мероприятие одобрено и опубликовано! 🎉")
 
 
-            success = db.add_event(
+            success = await db.add_event(
                 table_name=table_name,
                 title=title,
                 description=description,
@@ -0,0 +1,84 @@
+import json
+import logging
+from typing import List, Optional, Tuple
+
+from redis.exceptions import RedisError
+
+logger = logging.getLogger(__name__)
+
+# Глобальное поколение рекомендаций: синхронизация KudaGo (kudago.EventManager) делает INCR,
+# после чего все сохранённые списки считаются устаревшими
+GENERATION_KEY = "rec:generation"
+
+
+class RecommendationCache:
+    """
+    Кеш готовых списков рекомендаций пользователя в Redis.
+
+    rec:user:{user_id} — hash с TTL, поле — вид списка (ml, interest), значение — JSON:
+        {"gen": поколение, "ranked": [[event_id, score], ...], "events": [кандидат, ...]}
+    Повторный запрос — один round trip (HGET + GET поколения в одном pipeline), без Postgres.
+    Список сбрасывается действиями пользователя (invalidate) и новым поколением.
+    """
+
+    def __init__(self, client, ttl: int):
+        # client — redis.asyncio.Redis с decode_responses=True
+        self.client = client
+        self.ttl = ttl
+
+    @staticmethod
+    def _key(user_id: int) -> str:
+        return f"rec:user:{user_id}"
+
+    async def lookup(self, user_id: int, kind: str) -> Tuple[Optional[List[dict]], int]:
+        """
+        Возвращает (события, поколение). События None — промах или устаревший список.
+        Поколение нужно передать в store: если синк пройдёт во время расчёта, список не сохранится как свежий.
+        """
+        try:
+            pipe = self.client.pipeline(transaction=False)
+            pipe.hget(self._key(user_id), kind)
+            pipe.get(GENERATION_KEY)
+            raw, generation = await pipe.execute()
+        except RedisError as e:
+            logger.warning(f"[rec_cache] Ошибка чтения кеша рекомендаций {user_id}: {e}")
+            return None, 0
+
+        generation = int(generation or 0)
+        if not raw:
+            return None, generation
+        try:
+            cached = json.loads(raw)
+        except ValueError:
+            return None, generation
+        if cached.get("gen") != generation:
+            return None, generation
+        return cached.get("events") or [], generation
+
+    async def store(
+        self,
+        user_id: int,
+        kind: str,
+        ranked: List[Tuple[dict, Optional[float]]],
+        generation: int
+    ) -> None:
+        """Сохраняет ранжированный список [(событие, score), ...] и продлевает TTL."""
+        value = json.dumps({
+            "gen": generation,
+            "ranked": [[event["id"], score] for event, score in ranked],
+            "events": [event for event, _ in ranked]
+        }, ensure_ascii=False, default=str)
+        try:
+            pipe = self.client.pipeline(transaction=False)
+            pipe.hset(self._key(user_id), kind, value)
+            pipe.expire(self._key(user_id), self.ttl)
+            await pipe.execute()
+        except RedisError as e:
+            logger.warning(f"[rec_cache] Ошибка записи кеша рекомендаций {user_id}: {e}")
+
+    async def invalidate(self, user_id: int) -> None:
+        """Сбрасывает все списки пользователя: лайк, дизлайк, подтверждение, новый status_ml, город."""
+        try:
+            await self.client.delete(self._key(user_id))
+        except RedisError as e:
+            logger.warning(f"[rec_cache] Ошибка сброса кеша рекомендаций {user_id}: {e}")
@@ -9,9 +9,13 @@
 
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from apscheduler.triggers.cron import CronTrigger
+from apscheduler.triggers.interval import IntervalTrigger
 from datetime import datetime, timezone, timedelta
+import asyncio
 import logging
 
+from config import Config
+
 logger = logging.getLogger(__name__)
 scheduler = AsyncIOScheduler()
 
@@ -30,7 +34,7 @@ async def send_reminder(bot, db):
     """
     try:
         # Получаем предстоящие подтверждённые мероприятия (за 1 день)
-        upcoming_events = db.get_upcoming_confirmed(days_ahead=1)
+        upcoming_events = await db.get_upcoming_confirmed(days_ahead=1)
         logger.info(f"Найдены мероприятия за 24 ч: {len(upcoming_events)}")
 
         for item in upcoming_events:
@@ -40,12 +44,10 @@ async def send_reminder(bot, db):
             event_url = item["event_url"]
 
             # Получаем полные данные мероприятия
-            # Предполагаем, что события могут быть в таблицах 'msk' или 'spb'
-            event = db.get_event_by_id(event_id, "msk")
-            if not event:
-                event = db.get_event_by_id(event_id, "spb")
+            # Город уже известен из get_upcoming_confirmed — один запрос к нужной секции
+            event = await db.get_event_by_id(event_id, item.get("city"))
             if not event:
-                logger.warning(f"Мероприятие {event_id} не найдено ни в msk, ни в spb")
+                logger.warning(f"Мероприятие {event_id} не найдено")
                 continue
 
             # Формируем сообщение
@@ -63,7 +65,7 @@ async def send_reminder(bot, db):
                 logger.info(f"Напоминание отправлено пользователю {user_id} для события {event_id}")
 
                 # Отмечаем, что напоминание отправлено
-                db.mark_reminder_sent(user_id, event_id)
+                await db.mark_reminder_sent(user_id, event_id)
 
             except Exception as e:
                 logger.error(f"Ошибка отправки напоминания {user_id} → {event_id}: {e}")
@@ -71,6 +73,42 @@ async def send_reminder(bot, db):
     except Exception as e:
         logger.error(f"[send_reminder] Неожиданная ошибка: {e}", exc_info=True)
 
+async def refresh_event_index(bot, db):
+    """
+    Задача: пересобрать индекс эмбеддингов кандидатов в MLService (bot.ml.index).
+    Векторы берутся из Redis одним MGET, сборка идёт в потоке, чтобы не блокировать бота.
+    """
+    try:
+        events = []
+        for city in ("msk", "spb"):
+            events.extend(await db.get_upcoming_event_texts(city))
+        indexed = await asyncio.to_thread(bot.ml.rebuild_index, events)
+        logger.info(f"Индекс эмбеддингов пересобран: {indexed} из {len(events)} событий")
+    except Exception as e:
+        logger.error(f"[refresh_event_index] Ошибка пересборки индекса: {e}", exc_info=True)
+
+async def refresh_upcoming_events(bot, db):
+    """
+    Задача: пересчитать материализованных кандидатов upcoming_events_<city>,
+    чтобы ближайший старт не устаревал между синхронизациями KudaGo,
+    и пересобрать по ним индекс эмбеддингов.
+    """
+    for city in ("msk", "spb"):
+        await db.refresh_upcoming_events(city)
+    logger.info("Кандидаты рекомендаций upcoming_events_* обновлены")
+    await refresh_event_index(bot, db)
+
+async def reload_rnn(bot):
+    """
+    Задача: подхватить веса RNN, обученные train_rnn_worker.py.
+    Чтение чекпоинта идёт в потоке — цикл событий вебхука не блокируется.
+    """
+    try:
+        if await asyncio.to_thread(bot.ml.reload_rnn):
+            logger.info("Веса RNN перезагружены из чекпоинта")
+    except Exception as e:
+        logger.error(f"[reload_rnn] Ошибка перезагрузки весов RNN: {e}", exc_info=True)
+
 def setup_scheduler(bot, db):
     """
     Инициализирует планировщик и добавляет задачу.
@@ -85,5 +123,36 @@ def setup_scheduler(bot, db):
         misfire_grace_time=3600,
         max_instances=1
     )
+    # Задача: периодически обновляем кандидатов рекомендаций
+    scheduler.add_job(
+        refresh_upcoming_events,
+        trigger=IntervalTrigger(minutes=Config.UPCOMING_REFRESH_MINUTES),
+        args=[bot, db],
+        id="refresh_upcoming_events",
+        misfire_grace_time=60,
+        max_instances=1,
+        coalesce=True
+    )
+    # Задача: проверять свежий чекпоинт RNN (первый раз — сразу при старте)
+    scheduler.add_job(
+        reload_rnn,
+        trigger=IntervalTrigger(minutes=Config.RNN_RELOAD_MINUTES),
+        args=[bot],
+        id="reload_rnn",
+        next_run_time=datetime.now(timezone.utc),
+        misfire_grace_time=60,
+        max_instances=1,
+        coalesce=True
+    )
+    # Задача: собрать индекс эмбеддингов сразу при старте, не дожидаясь первого интервала
+    scheduler.add_job(
+        refresh_event_index,
+        args=[bot, db],
+        id="event_index_startup",
+        max_instances=1
+    )
     scheduler.start()
-    logger.info("Планировщик запущен: ежедневные напоминания в 09:00 UTC")
\ No newline at end of file
+    logger.info(
+        f"Планировщик запущен: ежедневные напоминания в 09:00 UTC, "
+        f"кандидаты рекомендаций — каждые {Config.UPCOMING_REFRESH_MINUTES} мин"
+    )
\ No newline at end of file
@@ -0,0 +1,18 @@
+#!/bin/sh
+# Точка входа контейнера events-sync: cron по расписанию из cronjob.
+#   10:00 — get_all_main.py (синк KudaGo + пакетный расчёт рекомендаций)
+#   вс 05:00 — get_all_main.py с SYNC_MODE=full (полный проход по событиям)
+#   03:00 — train_rnn_worker.py (обучение RNN, бот подхватывает чекпоинт из ./data)
+# cron запускает задания с пустым окружением, поэтому переменные контейнера
+# (DB_*, REDIS_*, CLUSTERS_PATH, RNN_CHECKPOINT_PATH, PYTHONPATH, ...) сохраняются
+# в /etc/environment — оттуда их подхватывает pam_env для каждого задания.
+set -e
+
+printenv | grep -v -E '^(HOME|HOSTNAME|PWD|SHLVL|_)=' > /etc/environment
+
+# Синхронизация сразу при старте контейнера, как раньше делал CMD, — не ждать 10:00
+if [ "${SYNC_ON_START:-true}" = "true" ]; then
+    (cd /app && python get_all_main.py > /proc/1/fd/1 2>&1 &)
+fi
+
+exec cron -f
@@ -1,6 +1,8 @@
 import logging
 import os
+import sys
 from kudago import EventManager
+from recommendations_batch import run_batch
 from logging.handlers import RotatingFileHandler
 # Создаём два обработчика с разными файлами
 info_handler = RotatingFileHandler(
@@ -60,6 +62,12 @@ if __name__ == "__main__":
 
     CITIES = ["msk", "spb"]
 
+    # incremental — события, опубликованные после прошлого запуска, плюс перечитывание
+    # актуальных в ближайшие SYNC_REFRESH_DAYS дней (правки и новые даты);
+    # full — полный проход на год вперёд (по cron раз в неделю, см. cronjob)
+    SYNC_MODE = os.getenv("SYNC_MODE", "incremental")
+
+    failed = False
     try:
         # Получаем путь к clusters.json из .env
         clusters_path = os.getenv('CLUSTERS_PATH')
@@ -72,13 +80,35 @@ if __name__ == "__main__":
             api_base_url="https://kudago.com/public-api/v1.4",
             clusters_path=clusters_path  # используем переменную
         )
-        manager.sync_places(cities=CITIES, limit=2000)
-        manager.sync_events(cities=CITIES, limit=1000)
+        failed_places = manager.sync_places(cities=CITIES, limit=2000)
+        failed_events = manager.sync_events(cities=CITIES, limit=1000, incremental=(SYNC_MODE == "incremental"))
+        # Ошибки по городам логируются внутри синка; с неполными данными не пересчитываем
+        # upcoming_events_* и рекомендации — выходим с ненулевым кодом
+        if failed_places or failed_events:
+            raise RuntimeError(
+                f"Синхронизация не завершена: места {failed_places or '—'}, события {failed_events or '—'}"
+            )
+        manager.compact_periods(cities=CITIES)
+        manager.backfill_embeddings(cities=CITIES)
+        manager.refresh_upcoming_events(cities=CITIES)
         upcoming = manager.get_upcoming_events_periods(cities=CITIES)
         print(upcoming)
 
+        # Списки рекомендаций пересчитываются по свежим upcoming_events_<city>
+        try:
+            written = run_batch(DB_DSN, clusters_path)
+            logger.info(f"Пакетный расчёт рекомендаций: записано строк {written}")
+        except Exception as e:
+            logger.error(f"Ошибка пакетного расчёта рекомендаций: {e}", exc_info=True)
+            failed = True
+
     except Exception as e:
         logger.error(f"Execution error: {e}")
+        failed = True
     finally:
         if 'manager' in locals():
             manager.close()
+
+    # Ненулевой код — чтобы cron и цепочки команд видели сбой
+    if failed:
+        sys.exit(1)
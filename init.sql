@@ -1,3 +1,13 @@
+-- pgvector: эмбеддинги событий (events.embedding) и поиск похожих в SQL
+CREATE EXTENSION IF NOT EXISTS vector;
+
+-- Фильтры (город, окно дат, просмотренные) применяются поверх HNSW-скана:
+-- итеративный скан дочитывает индекс, пока не наберётся LIMIT строк (pgvector >= 0.8)
+DO $$
+BEGIN
+    EXECUTE format('ALTER DATABASE %I SET hnsw.iterative_scan = strict_order', current_database());
+END;
+$$;
 
 -- Создание таблицы places (места)
 CREATE TABLE IF NOT EXISTS places (
@@ -35,6 +45,9 @@ CREATE TABLE IF NOT EXISTS users (
     name VARCHAR(255),
     city INTEGER,
     status_ml JSONB DEFAULT '[]',
+    -- Плотный профиль интересов по порядку кластеров clusters.json (пишет бот при лайке);
+    -- пока NULL, профиль читается из status_ml
+    status_vec REAL[],
     event_history JSONB DEFAULT '[]',
     referral_code VARCHAR(50) UNIQUE,
     created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
@@ -81,6 +94,7 @@ CREATE TABLE IF NOT EXISTS user_event_actions (
 
 -- Индексы для user_event_actions
 CREATE INDEX IF NOT EXISTS idx_user_event ON user_event_actions(user_id, event_id);
+CREATE INDEX IF NOT EXISTS idx_user_event_actions_recent ON user_event_actions(user_id, timestamp DESC);
 
 -- Создание таблицы friends (друзья)
 CREATE TABLE IF NOT EXISTS friends (
@@ -109,7 +123,88 @@ CREATE INDEX IF NOT EXISTS idx_invitations_token ON invitations(token);
 CREATE INDEX IF NOT EXISTS idx_invitations_receiver ON invitations(receiver_id);
 CREATE INDEX IF NOT EXISTS idx_invitations_event ON invitations(event_id);
 
--- Функция для динамического создания таблиц событий для разных городов
+-- Курсор инкрементальной синхронизации событий по городам
+CREATE TABLE IF NOT EXISTS sync_state (
+    city VARCHAR(50) PRIMARY KEY,
+    last_publication_date BIGINT,
+    max_event_id BIGINT,
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+);
+
+-- Готовые рекомендации ночного пакетного расчёта (recommendations_batch.py):
+-- top-N событий пользователя по rank, бот читает их с запасным онлайн-расчётом
+CREATE TABLE IF NOT EXISTS user_recommendations (
+    user_id BIGINT NOT NULL,
+    rank SMALLINT NOT NULL,
+    event_id BIGINT NOT NULL,
+    city VARCHAR(50) NOT NULL,
+    score REAL NOT NULL,
+    generated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+    PRIMARY KEY (user_id, rank)
+);
+
+-- Единая таблица событий, секционированная по городу (LIST).
+-- Город без отдельной секции попадает в events_part_default — DDL для нового города не нужен.
+CREATE TABLE IF NOT EXISTS events (
+    city VARCHAR(50) NOT NULL,
+    id BIGINT NOT NULL,
+    title VARCHAR(255) NOT NULL,
+    description TEXT,
+    place_name VARCHAR(255),
+    address TEXT,
+    event_url VARCHAR(500),
+    image_url VARCHAR(500),
+    start_datetime BIGINT,
+    end_datetime BIGINT,
+    category VARCHAR(255),
+    status VARCHAR(20) DEFAULT 'upcoming',
+    status_ml JSONB,
+    embedding vector(384),
+    publication_date BIGINT,
+    slug VARCHAR(255),
+    age_restriction VARCHAR(10),
+    price VARCHAR(255),
+    is_free BOOLEAN,
+    tags TEXT[],
+    favorites_count INTEGER,
+    comments_count INTEGER,
+    short_title VARCHAR(255),
+    disable_comments BOOLEAN,
+    place_id BIGINT,
+    likes BIGINT DEFAULT 0,
+    added_by BIGINT,
+    PRIMARY KEY (city, id),
+    CONSTRAINT fk_place
+        FOREIGN KEY (place_id)
+        REFERENCES places (id)
+        ON DELETE SET NULL
+) PARTITION BY LIST (city);
+
+CREATE TABLE IF NOT EXISTS events_part_default PARTITION OF events DEFAULT;
+
+-- id событий KudaGo глобальны: поиск без города — один индекс на секцию
+CREATE INDEX IF NOT EXISTS idx_events_id ON events (id);
+
+-- Косинусная близость эмбеддингов: ORDER BY embedding <=> вектор пользователя
+CREATE INDEX IF NOT EXISTS idx_events_embedding ON events USING hnsw (embedding vector_cosine_ops);
+
+-- Даты событий, секционированные так же, как events
+CREATE TABLE IF NOT EXISTS event_dates (
+    city VARCHAR(50) NOT NULL,
+    id BIGSERIAL,
+    event_id BIGINT NOT NULL,
+    start_timestamp BIGINT NOT NULL,
+    end_timestamp BIGINT NOT NULL,
+    PRIMARY KEY (city, id),
+    UNIQUE (city, event_id, start_timestamp, end_timestamp),
+    FOREIGN KEY (city, event_id) REFERENCES events (city, id) ON DELETE CASCADE
+) PARTITION BY LIST (city);
+
+CREATE TABLE IF NOT EXISTS event_dates_part_default PARTITION OF event_dates DEFAULT;
+
+CREATE INDEX IF NOT EXISTS idx_event_dates_start ON event_dates (city, start_timestamp);
+
+-- Функция подготовки города: отдельные секции и представления совместимости <city>, event_dates_<city>
 CREATE OR REPLACE FUNCTION create_city_event_tables(city_name TEXT)
 RETURNS VOID AS $$
 DECLARE
@@ -120,59 +215,76 @@ BEGIN
         RAISE EXCEPTION 'Некорректное имя таблицы: %', table_name;
     END IF;
 
-    -- Создание таблицы событий города
-    EXECUTE format('
-        CREATE TABLE IF NOT EXISTS %I (
-            id BIGINT PRIMARY KEY,
-            title VARCHAR(255) NOT NULL,
-            description TEXT,
-            place_name VARCHAR(255),
-            address TEXT,
-            event_url VARCHAR(500),
-            image_url VARCHAR(500),
-            start_datetime BIGINT,
-            end_datetime BIGINT,
-            category VARCHAR(255),
-            status VARCHAR(20) DEFAULT ''upcoming'',
-            status_ml JSONB,
-            publication_date BIGINT,
-            slug VARCHAR(255),
-            age_restriction VARCHAR(10),
-            price VARCHAR(255),
-            is_free BOOLEAN,
-            tags TEXT[],
-            favorites_count INTEGER,
-            comments_count INTEGER,
-            short_title VARCHAR(255),
-            disable_comments BOOLEAN,
-            place_id BIGINT,
-            likes BIGINT DEFAULT 0,
-            added_by BIGINT,
-            CONSTRAINT fk_place
-                FOREIGN KEY (place_id)
-                REFERENCES places (id)
-                ON DELETE SET NULL
-        )', table_name);
-
-    -- Создание таблицы дат событий
-    EXECUTE format('
-        CREATE TABLE IF NOT EXISTS event_dates_%I (
-            id SERIAL PRIMARY KEY,
-            event_id BIGINT NOT NULL,
-            start_timestamp BIGINT NOT NULL,
-            end_timestamp BIGINT NOT NULL,
-            FOREIGN KEY (event_id) REFERENCES %I(id) ON DELETE CASCADE
-        )', table_name, table_name);
+    -- Отдельная секция необязательна; её нельзя создать, если в DEFAULT уже есть строки города
+    IF to_regclass(format('events_part_%s', table_name)) IS NULL THEN
+        IF EXISTS (SELECT 1 FROM events_part_default WHERE city = table_name) THEN
+            RAISE NOTICE 'В секции по умолчанию уже есть события %, отдельная секция не создаётся', table_name;
+        ELSE
+            EXECUTE format('CREATE TABLE %I PARTITION OF events FOR VALUES IN (%L)',
+                'events_part_' || table_name, table_name);
+            EXECUTE format('CREATE TABLE %I PARTITION OF event_dates FOR VALUES IN (%L)',
+                'event_dates_part_' || table_name, table_name);
+        END IF;
+    END IF;
+
+    -- Представления для старых запросов: FROM msk, INSERT INTO event_dates_msk и т.п.
+    EXECUTE format('CREATE OR REPLACE VIEW %I AS SELECT * FROM events WHERE city = %L',
+        table_name, table_name);
+    EXECUTE format('ALTER VIEW %I ALTER COLUMN city SET DEFAULT %L',
+        table_name, table_name);
+    EXECUTE format('CREATE OR REPLACE VIEW %I AS SELECT * FROM event_dates WHERE city = %L',
+        'event_dates_' || table_name, table_name);
+    EXECUTE format('ALTER VIEW %I ALTER COLUMN city SET DEFAULT %L',
+        'event_dates_' || table_name, table_name);
+
+    -- Материализованные кандидаты рекомендаций: ближайший старт, место (с сайтом), приоритет тега.
+    -- Обновляются REFRESH ... CONCURRENTLY после синхронизации и периодически ботом.
+    EXECUTE format($view$
+        CREATE MATERIALIZED VIEW IF NOT EXISTS %I AS
+        SELECT
+            e.id,
+            e.title,
+            e.description,
+            d.start_datetime,
+            e.event_url,
+            e.status_ml,
+            e.favorites_count,
+            p.address,
+            p.title AS place_title,
+            e.tags,
+            CASE
+                WHEN 'добавленное' = ANY(e.tags) THEN 1
+                WHEN 'интересное' = ANY(e.tags) THEN 2
+                ELSE 3
+            END AS priority,
+            p.site_url AS place_site_url
+        FROM events e
+        JOIN (
+            SELECT event_id, MIN(start_timestamp) AS start_datetime
+            FROM event_dates
+            WHERE city = %L
+            AND start_timestamp >= EXTRACT(EPOCH FROM NOW())::BIGINT
+            GROUP BY event_id
+        ) d ON d.event_id = e.id
+        LEFT JOIN places p ON p.id = e.place_id
+        WHERE e.city = %L
+    $view$, 'upcoming_events_' || table_name, table_name, table_name);
+    -- Уникальный индекс обязателен для REFRESH MATERIALIZED VIEW CONCURRENTLY
+    EXECUTE format('CREATE UNIQUE INDEX IF NOT EXISTS %I ON %I (id)',
+        'uq_upcoming_events_' || table_name || '_id', 'upcoming_events_' || table_name);
+    -- Порядок индекса повторяет ORDER BY кандидатов: тег, популярность, старт
+    EXECUTE format('CREATE INDEX IF NOT EXISTS %I ON %I (priority, favorites_count DESC, start_datetime)',
+        'idx_upcoming_events_' || table_name || '_rank', 'upcoming_events_' || table_name);
 END;
 $$ LANGUAGE plpgsql;
 
 -- Комментарий к функции
-COMMENT ON FUNCTION create_city_eventtables(TEXT) IS 'Создаёт таблицы для событий конкретного города: основную таблицу событий и таблицу дат событий';
+COMMENT ON FUNCTION create_city_event_tables(TEXT) IS 'Создаёт секции events/event_dates для города, представления совместимости <city>, event_dates_<city> и upcoming_events_<city>';
 
--- Пример вызова функции для создания таблиц для Москвы и Санкт‑Петербурга
--- Раскомментируйте следующие строки, если хотите сразу создать таблицы для этих городов:
-SELECT create_city_eventtables('msk');
-SELECT create_city_eventtables('spb');
+-- Секции и представления для Москвы и Санкт‑Петербурга.
+-- Базы со старыми таблицами msk/spb переводятся миграцией migrations/002_partition_events_by_city.sql
+SELECT create_city_event_tables('msk');
+SELECT create_city_event_tables('spb');
 
  
 GRANT ALL PRIVILEGES ON ALL TABLES IN SCHEMA public TO ${DB_USER};
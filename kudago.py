@@ -1,9 +1,12 @@
 import os
 import sys
+import asyncio
+import aiohttp
 import requests
 import psycopg2
-from psycopg2.extras import RealDictCursor
-from typing import List, Dict, Optional, Any, Tuple
+from psycopg2.extras import RealDictCursor, execute_values
+from redis.exceptions import RedisError
+from typing import List, Dict, Optional, Any, Tuple, Iterator
 import logging
 from dataclasses import dataclass, field
 from datetime import datetime, timezone
@@ -13,11 +16,27 @@ import time
 from ai.main_status import load_clusters_from_file
 from ai.schemas import Event_ML
 from ai.cluster_service import ClusterService
+from ai.vector_codec import to_pgvector
 from sentence_transformers import SentenceTransformer
 
 
 load_dotenv()
 
+# Параметры асинхронной загрузки деталей из KudaGo
+KUDAGO_CONCURRENCY = int(os.getenv("KUDAGO_CONCURRENCY", 8))      # число одновременных воркеров
+KUDAGO_RATE_LIMIT = float(os.getenv("KUDAGO_RATE_LIMIT", 10))     # запросов в секунду на весь пул
+KUDAGO_MAX_RETRIES = int(os.getenv("KUDAGO_MAX_RETRIES", 3))      # попыток на один ID (ошибки сети и 5xx)
+KUDAGO_MAX_THROTTLED = int(os.getenv("KUDAGO_MAX_THROTTLED", 20))  # ответов 429 на один ID, отдельно от попыток
+KUDAGO_MAX_BACKOFF = int(os.getenv("KUDAGO_MAX_BACKOFF", 60))      # потолок паузы после 429, сек
+
+# Размерность эмбеддингов событий в events.embedding (all-MiniLM-L6-v2)
+EMBEDDING_DIM = 384
+
+# Окно обновления инкрементальной синхронизации, дней: события, актуальные в ближайшие
+# N дней, перечитываются целиком — правки полей и новые даты уже опубликованных событий.
+# У KudaGo нет даты изменения события, поэтому курсор по publication_date их не видит.
+SYNC_REFRESH_DAYS = int(os.getenv("SYNC_REFRESH_DAYS", 14))
+
 @dataclass
 class Place:
     """Place model"""
@@ -75,13 +94,171 @@ class Event:
     disable_comments: bool           # from "disable_comments"
     place_id: Optional[int] = None  # новое поле
     likes: Optional[int]=0
+    embedding: Optional[str] = None  # литерал pgvector '[...]' для events.embedding
     periods: List[Dict[str, int]] = field(default_factory=list)  # [{"start": 123, "end": 456}, ...]
 
 
+class TokenBucket:
+    """
+    Общий ограничитель частоты запросов (token bucket) для всех воркеров.
+    При ответе 429 ставит на паузу весь пул, а не только один запрос.
+    """
+
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        self.rate = rate
+        self.capacity = capacity or rate
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+        self.paused_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def pause(self, seconds: float):
+        """Глобальная пауза: до её окончания токены не выдаются никому"""
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+        self.tokens = 0
+        self.updated_at = self.paused_until
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self.paused_until:
+                    await asyncio.sleep(self.paused_until - now)
+                    continue
+
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+                self.updated_at = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class AsyncKudaGoFetcher:
+    """
+    Асинхронная загрузка деталей по списку ID:
+    пул воркеров ограниченного размера, общий rate limiter и повторы на каждый запрос.
+    """
+
+    def __init__(
+        self,
+        concurrency: int = KUDAGO_CONCURRENCY,
+        rate_limit: float = KUDAGO_RATE_LIMIT,
+        max_retries: int = KUDAGO_MAX_RETRIES,
+        max_throttled: int = KUDAGO_MAX_THROTTLED,
+        timeout: int = 10
+    ):
+        self.concurrency = concurrency
+        self.rate_limit = rate_limit
+        self.max_retries = max_retries
+        self.max_throttled = max_throttled
+        self.timeout = timeout
+
+    async def _fetch_json(self, session: aiohttp.ClientSession, bucket: TokenBucket, url: str) -> Optional[Dict]:
+        # 429 — не ошибка запроса, а сигнал сбавить темп: у него свой бюджет,
+        # попытки max_retries тратят только сетевые ошибки и 5xx
+        attempt = 0
+        throttled = 0
+        while attempt < self.max_retries:
+            await bucket.acquire()
+            try:
+                async with session.get(url) as response:
+                    if response.status == 429:
+                        throttled += 1
+                        if throttled > self.max_throttled:
+                            logging.error(f"429 для {url} {throttled} раз подряд, ID пропущен")
+                            return None
+                        retry_after = response.headers.get("Retry-After", "")
+                        wait_time = int(retry_after) if retry_after.isdigit() else 5 * (2 ** min(throttled - 1, 4))
+                        wait_time = min(wait_time, KUDAGO_MAX_BACKOFF)
+                        logging.warning(f"429 для {url}: пауза всего пула {wait_time} сек...")
+                        bucket.pause(wait_time)
+                        continue
+
+                    if response.status == 404:
+                        logging.warning(f"Объект не найден: {url}")
+                        return None
+
+                    if response.status >= 500:
+                        logging.warning(f"Ошибка {response.status} для {url} (попытка {attempt + 1})")
+                        await asyncio.sleep(2 ** attempt)
+                        attempt += 1
+                        continue
+
+                    response.raise_for_status()
+                    body = await response.read()
+                    return json.loads(body.decode('utf-8', errors='replace'))
+
+            except (aiohttp.ClientError, asyncio.TimeoutError, json.JSONDecodeError) as e:
+                logging.warning(f"Ошибка запроса {url} (попытка {attempt + 1}): {e}")
+                await asyncio.sleep(2 ** attempt)
+                attempt += 1
+
+        logging.error(f"Превышено количество попыток ({self.max_retries}) для {url}")
+        return None
+
+    async def _worker(
+        self,
+        session: aiohttp.ClientSession,
+        bucket: TokenBucket,
+        queue: asyncio.Queue,
+        url_template: str,
+        results: Dict[int, Optional[Dict]]
+    ):
+        while True:
+            item_id = await queue.get()
+            try:
+                results[item_id] = await self._fetch_json(session, bucket, url_template.format(id=item_id))
+            except Exception as e:
+                logging.error(f"Необработанная ошибка при загрузке {item_id}: {e}")
+                results[item_id] = None
+            finally:
+                queue.task_done()
+
+    async def fetch_many(self, url_template: str, ids: List[int]) -> Dict[int, Optional[Dict]]:
+        """Загружает url_template.format(id=...) для всех ids, возвращает {id: данные или None}"""
+        results: Dict[int, Optional[Dict]] = {}
+        if not ids:
+            return results
+
+        queue: asyncio.Queue = asyncio.Queue()
+        for item_id in ids:
+            queue.put_nowait(item_id)
+
+        bucket = TokenBucket(self.rate_limit)
+        timeout = aiohttp.ClientTimeout(total=self.timeout)
+        connector = aiohttp.TCPConnector(limit=self.concurrency)
+
+        async with aiohttp.ClientSession(timeout=timeout, connector=connector) as session:
+            workers = [
+                asyncio.create_task(self._worker(session, bucket, queue, url_template, results))
+                for _ in range(min(self.concurrency, len(ids)))
+            ]
+            await queue.join()
+            for worker in workers:
+                worker.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+
+        return results
+
+
+# Поля события, которые нужны _create_event_from_item и классификации
+EVENT_LIST_FIELDS = ",".join([
+    "id", "publication_date", "dates", "title", "short_title", "slug", "place",
+    "description", "categories", "tags", "age_restriction", "price", "is_free",
+    "images", "favorites_count", "comments_count", "site_url", "disable_comments"
+])
+
+
+class KudaGoPagingError(RuntimeError):
+    """Постраничная выгрузка /events/ оборвалась: попытки для страницы исчерпаны."""
+
+
 class KudaGoAPI:
     def __init__(self, base_url: str = "https://kudago.com/public-api/v1.4"):
         self.base_url = base_url.rstrip('/')
         self.session = requests.Session()
+        self.fetcher = AsyncKudaGoFetcher()
    #     self.session.headers.update({
     #        "User-Agent": "EventAggregator/1.0"
      #   })
@@ -105,22 +282,60 @@ class KudaGoAPI:
             return None
     def get_event_ids(self, city: str, limit: int = 100, max_retries: int = 3) -> List[int]:
         all_ids = []  # only (ID events)
+
+        for events in self.iter_event_pages(city, fields="id", max_retries=max_retries):
+            # only ID событий (integer)
+            for event in events:
+                all_ids.append(event["id"])
+
+        return all_ids  # Возвращаем список чисел (ID)
+
+    def iter_event_pages(
+        self,
+        city: str,
+        fields: str = EVENT_LIST_FIELDS,
+        page_size: int = 100,
+        max_retries: int = 3,
+        published_after: Optional[int] = None,
+        actual_days: Optional[int] = None
+    ) -> Iterator[List[Dict]]:
+        """
+        Постранично отдаёт события из /events/ со всеми полями, нужными пайплайну.
+        Каждая страница отдаётся сразу после загрузки.
+
+        Если задан published_after (курсор инкрементальной синхронизации), события
+        запрашиваются от новых к старым по publication_date и выдача останавливается
+        на первом событии, опубликованном не позже курсора.
+
+        actual_days сужает выдачу до событий, актуальных в ближайшие N дней
+        (по умолчанию — год вперёд).
+
+        Raises:
+            KudaGoPagingError: попытки для очередной страницы исчерпаны — проход
+                неполный, уже отданные страницы остаются у вызывающего.
+        """
+        order_by = "id" if published_after is None else "-publication_date"
         page = 1
         retry_count = 0
+        total = 0
 
         # INterval: will 30 days
         now = int(datetime.now(timezone.utc).timestamp())
         actual_since = now #- 2628000  # 1 months before
-        actual_until = now + 2592000*12   # 30  forward
+        if actual_days is not None:
+            actual_until = now + actual_days * 86400
+        else:
+            actual_until = now + 2592000*12   # 30  forward
 
 
         while True:
             try:
                 params = {
-                    "fields": "id",
-                    "order_by": "id",
+                    "fields": fields,
+                    "order_by": order_by,
                     "location": city,
                     "page": page,
+                    "page_size": page_size,
                     "actual_since": actual_since,
                     "actual_until": actual_until
                 }
@@ -136,19 +351,28 @@ class KudaGoAPI:
                     events = data.get("results", [])
 
                     if not events:
-                        print(f"✓ Page {page}: haven't events. Stoppped.")
+                        logging.info(f"Страница {page}: событий нет. Завершаем.")
                         break
 
-                    # only ID событий (integer)
-                    for event in events:
-                        all_ids.append(event["id"])
+                    reached_cursor = False
+                    if published_after is not None:
+                        fresh = [e for e in events if (e.get("publication_date") or 0) > published_after]
+                        reached_cursor = len(fresh) < len(events)
+                        events = fresh
 
-                    print(f"✓ Page {page}: {len(events)} events. ALL: {len(all_ids)}")
+                    total += len(events)
+                    logging.info(f"Страница {page}: {len(events)} событий, всего {total}")
+                    if events:
+                        yield events
+
+                    if reached_cursor:
+                        logging.info("Дошли до курсора синхронизации. Завершаем.")
+                        break
 
                     # Step for new page
                     next_page = data.get("next")
                     if not next_page:
-                        print("Больше страниц нет. Завершаем.")
+                        logging.info("Больше страниц нет. Завершаем.")
                         break
 
                     page += 1
@@ -157,27 +381,27 @@ class KudaGoAPI:
 
                 elif response.status_code == 429:
                     wait_time = 5 * (2 ** retry_count)
-                    print(f"!429: слишком много запросов. Пауза {wait_time} сек...")
+                    logging.warning(f"429: слишком много запросов. Пауза {wait_time} сек...")
                     time.sleep(wait_time)
                     retry_count += 1
 
                 else:
-                    print(f"!Ошибка {response.status_code} на странице {page}: {response.text}")
+                    logging.warning(f"Ошибка {response.status_code} на странице {page}: {response.text}")
                     retry_count += 1
 
-            except Exception as e:
-                print(f"!Исключение на странице {page}: {e}")
+            except (requests.RequestException, ValueError) as e:
+                logging.warning(f"Исключение на странице {page}: {e}")
                 retry_count += 1
 
-            # Проверка на превышение попыток
+            # Проверка на превышение попыток: молча обрывать выдачу нельзя,
+            # иначе вызывающий примет неполный проход за полный
             if retry_count >= max_retries:
-                print(f"Превышено количество попыток ({max_retries}) для страницы {page}. Остановка.")
-                break
+                raise KudaGoPagingError(
+                    f"Превышено количество попыток ({max_retries}) для страницы {page} города {city}"
+                )
 
             time.sleep(0.5)  # Пауза между запросами
 
-        return all_ids  # Возвращаем список чисел (ID)
-
     def get_event_details(self, event_id: int) -> Optional[Dict]:
         """Получить подробную информацию о событии"""
         url = f"{self.base_url}/events/{event_id}/"
@@ -196,6 +420,78 @@ class KudaGoAPI:
             logging.error(f"Ошибка API для event_id {event_id}: {e}")
             return None
 
+    def _get_details_bulk(self, kind: str, ids: List[int]) -> List[Dict]:
+        """Параллельно загружает детали по списку ID, сохраняя исходный порядок"""
+        url_template = f"{self.base_url}/{kind}/{{id}}/"
+        results = asyncio.run(self.fetcher.fetch_many(url_template, ids))
+
+        details = []
+        for item_id in ids:
+            data = results.get(item_id)
+            if data:
+                details.append(data)
+            else:
+                logging.warning(f"Не удалось получить детали для {kind} {item_id}")
+        return details
+
+    def get_events_details(self, event_ids: List[int]) -> List[Dict]:
+        """Получить подробную информацию о событиях (асинхронно, пулом воркеров)"""
+        return self._get_details_bulk("events", event_ids)
+
+    def get_places_details(self, place_ids: List[int]) -> List[Dict]:
+        """Получить подробную информацию о местах (асинхронно, пулом воркеров)"""
+        return self._get_details_bulk("places", place_ids)
+
+# Ключ поколения рекомендаций в Redis (bot/rec_cache.py: GENERATION_KEY)
+RECOMMENDATION_GENERATION_KEY = "rec:generation"
+
+# Колонки событий без ключа секционирования city — общий список для переноса старых таблиц
+EVENT_COLUMNS = (
+    "id", "title", "description", "place_name", "address", "event_url", "image_url",
+    "start_datetime", "end_datetime", "category", "status", "status_ml", "publication_date",
+    "slug", "age_restriction", "price", "is_free", "tags", "favorites_count", "comments_count",
+    "short_title", "disable_comments", "place_id", "likes", "added_by"
+)
+
+# Кандидаты для рекомендаций: ближайший будущий старт, место и приоритет тега.
+# Индекс (priority, favorites_count DESC, start_datetime) повторяет ORDER BY запросов бота.
+# При изменении набора колонок обновить UPCOMING_EVENTS_LAST_COLUMN — старое представление пересоздаётся.
+UPCOMING_EVENTS_LAST_COLUMN = "place_site_url"
+UPCOMING_EVENTS_VIEW_SQL = """
+CREATE MATERIALIZED VIEW IF NOT EXISTS upcoming_events_{city} AS
+SELECT
+    e.id,
+    e.title,
+    e.description,
+    d.start_datetime,
+    e.event_url,
+    e.status_ml,
+    e.favorites_count,
+    p.address,
+    p.title AS place_title,
+    e.tags,
+    CASE
+        WHEN 'добавленное' = ANY(e.tags) THEN 1
+        WHEN 'интересное' = ANY(e.tags) THEN 2
+        ELSE 3
+    END AS priority,
+    p.site_url AS place_site_url
+FROM events e
+JOIN (
+    SELECT event_id, MIN(start_timestamp) AS start_datetime
+    FROM event_dates
+    WHERE city = %(city)s
+    AND start_timestamp >= EXTRACT(EPOCH FROM NOW())::BIGINT
+    GROUP BY event_id
+) d ON d.event_id = e.id
+LEFT JOIN places p ON p.id = e.place_id
+WHERE e.city = %(city)s;
+CREATE UNIQUE INDEX IF NOT EXISTS uq_upcoming_events_{city}_id ON upcoming_events_{city} (id);
+CREATE INDEX IF NOT EXISTS idx_upcoming_events_{city}_rank
+    ON upcoming_events_{city} (priority, favorites_count DESC, start_datetime);
+"""
+
+
 class Database:
     def __init__(self, dsn: str):
         self.dsn = dsn
@@ -246,10 +542,13 @@ class Database:
         );
         """
 
-        # 2. Таблица событий города (исправлено: FOREIGN KEY, удалены лишние кавычки)
+        # 2. Единая таблица событий, секционированная по городу.
+        # Новый город попадает в секцию по умолчанию, DDL для него не нужен.
         query1 = f"""
-        CREATE TABLE IF NOT EXISTS {table_name} (
-            id BIGINT PRIMARY KEY,
+        CREATE EXTENSION IF NOT EXISTS vector;
+        CREATE TABLE IF NOT EXISTS events (
+            city VARCHAR(50) NOT NULL,
+            id BIGINT NOT NULL,
             title VARCHAR(255) NOT NULL,
             description TEXT,
             place_name VARCHAR(255),
@@ -261,6 +560,7 @@ class Database:
             category VARCHAR(255),
             status VARCHAR(20) DEFAULT 'upcoming',
             status_ml JSONB,
+            embedding vector({EMBEDDING_DIM}),
             publication_date BIGINT,
             slug VARCHAR(255),
             age_restriction VARCHAR(10),
@@ -273,23 +573,35 @@ class Database:
             disable_comments BOOLEAN,
             place_id BIGINT,
             likes BIGINT DEFAULT 0,
-            added_by BIGINT, 
+            added_by BIGINT,
+            PRIMARY KEY (city, id),
             CONSTRAINT fk_place
                 FOREIGN KEY (place_id)
                 REFERENCES places (id)
                 ON DELETE SET NULL
-        );
+        ) PARTITION BY LIST (city);
+        CREATE TABLE IF NOT EXISTS events_part_default PARTITION OF events DEFAULT;
+        -- id событий KudaGo глобальны: поиск без города — один индекс на секцию
+        CREATE INDEX IF NOT EXISTS idx_events_id ON events (id);
+        -- Эмбеддинги для поиска похожих событий в SQL (pgvector); у старых баз колонки ещё нет
+        ALTER TABLE events ADD COLUMN IF NOT EXISTS embedding vector({EMBEDDING_DIM});
+        CREATE INDEX IF NOT EXISTS idx_events_embedding ON events USING hnsw (embedding vector_cosine_ops);
         """
 
-        # 3. Таблица дат событий (исправлено: FOREIGN KEY)
-        query2 = f"""
-        CREATE TABLE IF NOT EXISTS event_dates_{table_name} (
-            id SERIAL PRIMARY KEY,
+        # 3. Даты событий, секционированные так же, как events
+        query2 = """
+        CREATE TABLE IF NOT EXISTS event_dates (
+            city VARCHAR(50) NOT NULL,
+            id BIGSERIAL,
             event_id BIGINT NOT NULL,
             start_timestamp BIGINT NOT NULL,
             end_timestamp BIGINT NOT NULL,
-            FOREIGN KEY (event_id) REFERENCES {table_name}(id) ON DELETE CASCADE
-        );
+            PRIMARY KEY (city, id),
+            UNIQUE (city, event_id, start_timestamp, end_timestamp),
+            FOREIGN KEY (city, event_id) REFERENCES events (city, id) ON DELETE CASCADE
+        ) PARTITION BY LIST (city);
+        CREATE TABLE IF NOT EXISTS event_dates_part_default PARTITION OF event_dates DEFAULT;
+        CREATE INDEX IF NOT EXISTS idx_event_dates_start ON event_dates (city, start_timestamp);
         """
 
         # 4. Таблица пользователей (исправлено: лишние кавычки и форматирование)
@@ -299,10 +611,13 @@ class Database:
             name VARCHAR(255),
             city INTEGER,
             status_ml JSONB DEFAULT '[]',
+            status_vec REAL[],
             event_history JSONB DEFAULT '[]',
             referral_code VARCHAR(50) UNIQUE,
             created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
         );
+        -- Плотный профиль по порядку кластеров clusters.json; JSONB status_ml читается, пока он пуст
+        ALTER TABLE users ADD COLUMN IF NOT EXISTS status_vec REAL[];
         """
 
         # 5. Таблица referrals (исправлено: FOREIGN KEY, синтаксис)
@@ -348,6 +663,7 @@ class Database:
             PRIMARY KEY (user_id, event_id, action)
         );
         CREATE INDEX IF NOT EXISTS idx_user_event ON user_event_actions(user_id, event_id);
+        CREATE INDEX IF NOT EXISTS idx_user_event_actions_recent ON user_event_actions(user_id, timestamp DESC);
             """
 
             # сделать инвалидное кеширование с JSONB отсюда
@@ -379,14 +695,37 @@ class Database:
         CREATE INDEX IF NOT EXISTS idx_invitations_receiver ON invitations(receiver_id);
         CREATE INDEX IF NOT EXISTS idx_invitations_event ON invitations(event_id);
         """
+
+        # 10. Курсор инкрементальной синхронизации по городам
+        query10 = """
+        CREATE TABLE IF NOT EXISTS sync_state (
+            city VARCHAR(50) PRIMARY KEY,
+            last_publication_date BIGINT,
+            max_event_id BIGINT,
+            updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+        );
+        """
+
+        # 11. Готовые рекомендации ночного пакетного расчёта (recommendations_batch.py)
+        query11 = """
+        CREATE TABLE IF NOT EXISTS user_recommendations (
+            user_id BIGINT NOT NULL,
+            rank SMALLINT NOT NULL,
+            event_id BIGINT NOT NULL,
+            city VARCHAR(50) NOT NULL,
+            score REAL NOT NULL,
+            generated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+            PRIMARY KEY (user_id, rank)
+        );
+        """
         with self.connection.cursor() as cursor:
             # 1. Создаём таблицу places
             cursor.execute(query4)
 
-            # 2. Создаём таблицу событий города
+            # 2. Создаём секционированную таблицу событий
             cursor.execute(query1)
 
-            # 3. Создаём таблицу дат событий
+            # 3. Создаём секционированную таблицу дат событий
             cursor.execute(query2)
 
             # 4. Создаём таблицу users
@@ -396,8 +735,140 @@ class Database:
             cursor.execute(query7)
             cursor.execute(query8)
             cursor.execute(query9)
+            cursor.execute(query10)
+            cursor.execute(query11)
         self.connection.commit()
-        logging.info(f"Таблица {table_name} создана успешно")
+
+        # Секция и представления города; старые таблицы msk/spb переносятся в events
+        self.ensure_city_partition(table_name)
+        logging.info(f"Таблицы событий для города {table_name} готовы")
+
+    def _relkind(self, cursor, name: str) -> Optional[str]:
+        """Тип отношения в схеме public: 'r' — таблица, 'p' — секционированная, 'v' — представление"""
+        cursor.execute(
+            """
+            SELECT c.relkind
+            FROM pg_class c
+            JOIN pg_namespace n ON n.oid = c.relnamespace
+            WHERE n.nspname = 'public' AND c.relname = %s
+            """,
+            (name,)
+        )
+        row = cursor.fetchone()
+        return row[0] if row else None
+
+    def ensure_city_partition(self, table_name: str):
+        """
+        Готовит город в секционированной схеме:
+        1. переносит старые таблицы <city>/event_dates_<city> в events/event_dates;
+        2. создаёт отдельные секции events_part_<city>/event_dates_part_<city>;
+        3. создаёт представления <city> и event_dates_<city> для старых запросов.
+
+        Отдельная секция необязательна: без неё строки города лежат в секции по умолчанию.
+        Если там уже есть строки города, секцию создать нельзя — остаёмся в DEFAULT.
+        """
+        legacy_columns = ", ".join(EVENT_COLUMNS)
+
+        with self.connection.cursor() as cursor:
+            # 1. Миграция старой схемы: таблица города — обычная таблица, а не представление
+            legacy = self._relkind(cursor, table_name) == "r"
+            if legacy:
+                logging.info(f"Найдена старая таблица {table_name}: переносим события в events")
+                cursor.execute(f"ALTER TABLE {table_name} RENAME TO {table_name}_legacy")
+                if self._relkind(cursor, f"event_dates_{table_name}") == "r":
+                    cursor.execute(f"ALTER TABLE event_dates_{table_name} RENAME TO event_dates_{table_name}_legacy")
+
+            # 2. Отдельные секции города
+            if self._relkind(cursor, f"events_part_{table_name}") is None:
+                cursor.execute(
+                    "SELECT EXISTS (SELECT 1 FROM events_part_default WHERE city = %s)",
+                    (table_name,)
+                )
+                if cursor.fetchone()[0]:
+                    logging.warning(
+                        f"В секции по умолчанию уже есть события {table_name}: "
+                        f"отдельная секция не создаётся"
+                    )
+                else:
+                    cursor.execute(
+                        f"CREATE TABLE events_part_{table_name} PARTITION OF events FOR VALUES IN (%s)",
+                        (table_name,)
+                    )
+                    cursor.execute(
+                        f"CREATE TABLE event_dates_part_{table_name} PARTITION OF event_dates FOR VALUES IN (%s)",
+                        (table_name,)
+                    )
+
+            if legacy:
+                cursor.execute(
+                    f"""
+                    INSERT INTO events (city, {legacy_columns})
+                    SELECT %s, {legacy_columns} FROM {table_name}_legacy
+                    ON CONFLICT (city, id) DO NOTHING
+                    """,
+                    (table_name,)
+                )
+                moved_events = cursor.rowcount
+                moved_periods = 0
+                if self._relkind(cursor, f"event_dates_{table_name}_legacy") == "r":
+                    cursor.execute(
+                        f"""
+                        INSERT INTO event_dates (city, event_id, start_timestamp, end_timestamp)
+                        SELECT %s, event_id, start_timestamp, end_timestamp
+                        FROM event_dates_{table_name}_legacy
+                        ON CONFLICT (city, event_id, start_timestamp, end_timestamp) DO NOTHING
+                        """,
+                        (table_name,)
+                    )
+                    moved_periods = cursor.rowcount
+                logging.info(
+                    f"{table_name}: перенесено событий {moved_events}, периодов {moved_periods}; "
+                    f"старые таблицы сохранены как *_legacy"
+                )
+
+            # 3. Представления совместимости: чтение и INSERT без указания города
+            for view, base in ((table_name, "events"), (f"event_dates_{table_name}", "event_dates")):
+                if self._relkind(cursor, view) not in (None, "v"):
+                    logging.warning(f"{view} не является представлением, пропускаем")
+                    continue
+                cursor.execute(
+                    f"CREATE OR REPLACE VIEW {view} AS SELECT * FROM {base} WHERE city = %s",
+                    (table_name,)
+                )
+                cursor.execute(
+                    f"ALTER VIEW {view} ALTER COLUMN city SET DEFAULT %s",
+                    (table_name,)
+                )
+
+            # 4. Материализованные кандидаты для рекомендаций бота
+            view = f"upcoming_events_{table_name}"
+            if self._relkind(cursor, view) == "m":
+                cursor.execute(
+                    """
+                    SELECT 1 FROM pg_attribute
+                    WHERE attrelid = to_regclass(%s) AND attname = %s AND NOT attisdropped
+                    """,
+                    (view, UPCOMING_EVENTS_LAST_COLUMN)
+                )
+                if cursor.fetchone() is None:
+                    logging.info(f"{view} устарело: пересоздаём с новыми колонками")
+                    cursor.execute(f"DROP MATERIALIZED VIEW {view}")
+            cursor.execute(UPCOMING_EVENTS_VIEW_SQL.format(city=table_name), {"city": table_name})
+        self.connection.commit()
+
+    def refresh_upcoming_events(self, city: str):
+        """Пересчитывает upcoming_events_<city> без блокировки читателей (CONCURRENTLY)"""
+        table_name = city.lower().replace("-", "_")
+        started = time.monotonic()
+        try:
+            with self.connection.cursor() as cursor:
+                cursor.execute(f"REFRESH MATERIALIZED VIEW CONCURRENTLY upcoming_events_{table_name}")
+            self.connection.commit()
+        except psycopg2.Error as e:
+            self.connection.rollback()
+            logging.error(f"Ошибка обновления upcoming_events_{table_name}: {e}")
+            raise
+        logging.info(f"upcoming_events_{table_name} обновлена за {time.monotonic() - started:.2f} с")
 
     def save_places(self, places: List[Place]):
         """
@@ -470,12 +941,23 @@ class Database:
         self.connection.commit()
         logging.info(f"Сохранено {len(places)} мест в БД.")
 
-    def save_events(self, city: str, events: List[Event]):
+    def save_events(self, city: str, events: List[Event], page_size: int = 500):
+        """
+        Пакетно сохраняет события города: одна проверка place_id для всего пакета,
+        вставка через execute_values и один commit на пакет.
+
+        Уже сохранённые события обновляются (upsert), строки без изменений не переписываются.
+        status_ml = None / embedding = None оставляют сохранённые значения — так событие
+        без правок текста не классифицируется заново.
+        """
         table_name = city.lower().replace("-", "_")
-        
+        if not events:
+            return
+
         # SQL-запрос (без изменений, но лучше вынести константой)
-        query = f"""
-        INSERT INTO {table_name} (
+        query = """
+        INSERT INTO events (
+            city,
             id,
             title,
             description,
@@ -498,117 +980,305 @@ class Database:
             short_title,
             disable_comments,
             status_ml,
-            place_id
-        ) VALUES (
-            %s, %s, %s, %s, %s,
-            %s, %s, %s, %s, %s,
-            %s, %s, %s, %s, %s,
-            %s, %s, %s, %s, %s,
-            %s, %s, %s
+            place_id,
+            embedding
+        ) VALUES %s
+        ON CONFLICT (city, id) DO UPDATE SET
+            title = EXCLUDED.title,
+            description = EXCLUDED.description,
+            place_name = EXCLUDED.place_name,
+            address = EXCLUDED.address,
+            event_url = EXCLUDED.event_url,
+            image_url = EXCLUDED.image_url,
+            start_datetime = EXCLUDED.start_datetime,
+            end_datetime = EXCLUDED.end_datetime,
+            category = EXCLUDED.category,
+            status = EXCLUDED.status,
+            publication_date = EXCLUDED.publication_date,
+            slug = EXCLUDED.slug,
+            age_restriction = EXCLUDED.age_restriction,
+            price = EXCLUDED.price,
+            is_free = EXCLUDED.is_free,
+            tags = EXCLUDED.tags,
+            favorites_count = EXCLUDED.favorites_count,
+            comments_count = EXCLUDED.comments_count,
+            short_title = EXCLUDED.short_title,
+            disable_comments = EXCLUDED.disable_comments,
+            place_id = EXCLUDED.place_id,
+            status_ml = COALESCE(EXCLUDED.status_ml, events.status_ml),
+            embedding = COALESCE(EXCLUDED.embedding, events.embedding)
+        WHERE (
+            events.title, events.description, events.place_name, events.address,
+            events.event_url, events.image_url, events.start_datetime, events.end_datetime,
+            events.category, events.status, events.publication_date, events.slug,
+            events.age_restriction, events.price, events.is_free, events.tags,
+            events.favorites_count, events.comments_count, events.short_title,
+            events.disable_comments, events.place_id
+        ) IS DISTINCT FROM (
+            EXCLUDED.title, EXCLUDED.description, EXCLUDED.place_name, EXCLUDED.address,
+            EXCLUDED.event_url, EXCLUDED.image_url, EXCLUDED.start_datetime, EXCLUDED.end_datetime,
+            EXCLUDED.category, EXCLUDED.status, EXCLUDED.publication_date, EXCLUDED.slug,
+            EXCLUDED.age_restriction, EXCLUDED.price, EXCLUDED.is_free, EXCLUDED.tags,
+            EXCLUDED.favorites_count, EXCLUDED.comments_count, EXCLUDED.short_title,
+            EXCLUDED.disable_comments, EXCLUDED.place_id
         )
-        ON CONFLICT (id) DO NOTHING
+        OR EXCLUDED.status_ml IS NOT NULL
+        OR EXCLUDED.embedding IS NOT NULL
         """
 
-        with self.connection.cursor() as cursor:
-            for event in events:
-                # 1. Обрабатываем place_id: проверяем наличие в таблице places
-                place_id = event.place_id
-                if place_id is not None:
-                    cursor.execute("SELECT 1 FROM places WHERE id = %s", (place_id,))
-                    if not cursor.fetchone():
-                        place_id = None  # заменяем на NULL, если места нет
-
-                # 2. Выполняем INSERT с обработанным place_id
-                cursor.execute(query, (
-                    event.id,
-                    event.title,
-                    event.description,
-                    event.place_name,
-                    event.address,
-                    event.event_url,
-                    event.image_url,
-                    event.start_datetime,
-                    event.end_datetime,
-                    event.category,
-                    event.status,
-                    event.publication_date,
-                    event.slug,
-                    event.age_restriction,
-                    event.price,
-                    event.is_free,
-                    event.tags,  # PostgreSQL поддерживает массивы напрямую
-                    event.favorites_count,
-                    event.comments_count,
-                    event.short_title,
-                    event.disable_comments,
-                    event.status_ml,
-                    place_id  # используем обработанное значение!
-                ))
-        
-        self.connection.commit()  # commit после всех операций
+        try:
+            with self.connection.cursor() as cursor:
+                # 1. Проверяем наличие всех place_id пакета одним запросом
+                place_ids = list({event.place_id for event in events if event.place_id is not None})
+                known_places = set()
+                if place_ids:
+                    cursor.execute("SELECT id FROM places WHERE id = ANY(%s)", (place_ids,))
+                    known_places = {row[0] for row in cursor.fetchall()}
+
+                # 2. Собираем строки; неизвестный place_id заменяем на NULL
+                rows = [
+                    (
+                        table_name,
+                        event.id,
+                        event.title,
+                        event.description,
+                        event.place_name,
+                        event.address,
+                        event.event_url,
+                        event.image_url,
+                        event.start_datetime,
+                        event.end_datetime,
+                        event.category,
+                        event.status,
+                        event.publication_date,
+                        event.slug,
+                        event.age_restriction,
+                        event.price,
+                        event.is_free,
+                        event.tags,  # PostgreSQL поддерживает массивы напрямую
+                        event.favorites_count,
+                        event.comments_count,
+                        event.short_title,
+                        event.disable_comments,
+                        event.status_ml,
+                        event.place_id if event.place_id in known_places else None,
+                        event.embedding
+                    )
+                    for event in events
+                ]
+
+                # 3. Многострочный INSERT пачками по page_size
+                execute_values(cursor, query, rows, page_size=page_size)
+
+            self.connection.commit()  # один commit на весь пакет
+        except psycopg2.Error as e:
+            self.connection.rollback()
+            logging.error(f"Ошибка пакетного сохранения {len(events)} событий для города {city}: {e}")
+            raise
 
-    def get_all_events(self, city:str) -> List[Dict]:
+    def get_stored_event_texts(self, city: str, event_ids: List[int]) -> Dict[int, Tuple]:
+        """
+        Тексты уже сохранённых событий из event_ids: {id: (title, description, tags)}.
+        По ним решается, нужна ли событию повторная классификация и новый эмбеддинг.
+        """
         table_name = city.lower().replace("-", "_")
-        all_events = []
+        if not event_ids:
+            return {}
 
         with self.connection.cursor() as cursor:
-            cursor.execute(f"""
-                SELECT {table_name}
-                FROM information_schema.tables
-                WHERE table_schema = 'public'
-                AND table_name NOT LIKE 'pg_%'
-                AND table_name NOT IN ('schema_migrations')
-            """)
-            tables = cursor.fetchall()
-
-        for table in tables:
-            table_name = table[0]
-            query = f"""
-                SELECT
-                    '{table_name}' AS city,
-                    title,
-                    description,
-                    place_name,
-                    address,
-                    event_url,
-                    image_url,
-                    start_datetime,
-                    end_datetime,
-                    category,
-                    status
-                FROM {table_name}
-                ORDER BY start_datetime
-            """
+            cursor.execute(
+                "SELECT id, title, description, tags FROM events WHERE city = %s AND id = ANY(%s)",
+                (table_name, list(event_ids))
+            )
+            return {row[0]: (row[1] or "", row[2] or "", list(row[3] or [])) for row in cursor.fetchall()}
+
+    def get_events_without_embedding(self, city: str, limit: int) -> List[Dict]:
+        """Актуальные события города без events.embedding (id, title, description, tags)"""
+        table_name = city.lower().replace("-", "_")
+        now_ts = int(datetime.now(timezone.utc).timestamp())
+        with self.connection.cursor() as cursor:
+            cursor.execute(
+                """
+                SELECT e.id, e.title, e.description, e.tags
+                FROM events e
+                WHERE e.city = %s
+                AND e.embedding IS NULL
+                AND EXISTS (
+                    SELECT 1 FROM event_dates d
+                    WHERE d.city = e.city AND d.event_id = e.id AND d.end_timestamp >= %s
+                )
+                ORDER BY e.id
+                LIMIT %s
+                """,
+                (table_name, now_ts, limit)
+            )
+            return [
+                {"id": row[0], "title": row[1] or "", "description": row[2] or "", "tags": row[3] or []}
+                for row in cursor.fetchall()
+            ]
+
+    def save_event_embeddings(self, city: str, rows: List[Tuple[int, str]], page_size: int = 500) -> int:
+        """Пакетно записывает events.embedding: rows — (event_id, литерал pgvector)"""
+        table_name = city.lower().replace("-", "_")
+        if not rows:
+            return 0
+        try:
+            with self.connection.cursor() as cursor:
+                execute_values(
+                    cursor,
+                    """
+                    UPDATE events AS e
+                    SET embedding = v.embedding::vector
+                    FROM (VALUES %s) AS v(city, id, embedding)
+                    WHERE e.city = v.city AND e.id = v.id
+                    """,
+                    [(table_name, event_id, embedding) for event_id, embedding in rows],
+                    page_size=page_size
+                )
+            self.connection.commit()
+            return len(rows)
+        except psycopg2.Error as e:
+            self.connection.rollback()
+            logging.error(f"Ошибка сохранения эмбеддингов {len(rows)} событий для города {city}: {e}")
+            raise
+
+    def get_sync_cursor(self, city: str) -> Optional[Dict]:
+        """Возвращает курсор инкрементальной синхронизации города или None"""
+        with self.connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT last_publication_date, max_event_id FROM sync_state WHERE city = %s",
+                (city,)
+            )
+            row = cursor.fetchone()
+
+        if row is None:
+            return None
+
+        return {
+            "last_publication_date": row[0],
+            "max_event_id": row[1]
+        }
 
-            with self.connection.cursor(cursor_factory=RealDictCursor) as cursor:
-                cursor.execute(query)
-                events = cursor.fetchall()
-                all_events.extend(events)
+    def save_sync_cursor(self, city: str, last_publication_date: Optional[int], max_event_id: Optional[int]):
+        """Сохраняет курсор; значения только растут (GREATEST), NULL не затирает старый курсор"""
+        with self.connection.cursor() as cursor:
+            cursor.execute(
+                """
+                INSERT INTO sync_state (city, last_publication_date, max_event_id, updated_at)
+                VALUES (%s, %s, %s, NOW())
+                ON CONFLICT (city) DO UPDATE SET
+                    last_publication_date = GREATEST(sync_state.last_publication_date, EXCLUDED.last_publication_date),
+                    max_event_id = GREATEST(sync_state.max_event_id, EXCLUDED.max_event_id),
+                    updated_at = NOW()
+                """,
+                (city, last_publication_date, max_event_id)
+            )
+        self.connection.commit()
+
+    def get_all_events(self, city: Optional[str] = None) -> List[Dict]:
+        """События одного города или, если city не указан, всех городов одним запросом"""
+        query = """
+            SELECT
+                city,
+                title,
+                description,
+                place_name,
+                address,
+                event_url,
+                image_url,
+                start_datetime,
+                end_datetime,
+                category,
+                status
+            FROM events
+        """
+        params = ()
+        if city is not None:
+            query += " WHERE city = %s"
+            params = (city.lower().replace("-", "_"),)
+        query += " ORDER BY start_datetime"
 
-        return all_events
+        with self.connection.cursor(cursor_factory=RealDictCursor) as cursor:
+            cursor.execute(query, params)
+            return cursor.fetchall()
 
     def save_event_periods(self, event_id: int, periods: List[Dict[str, int]], city:str) -> None:
         """Сохраняет все периоды события в таблицу event_dates"""
+        self.save_event_periods_bulk(
+            city,
+            [(event_id, period["start"], period["end"]) for period in periods]
+        )
+
+    def save_event_periods_bulk(self, city: str, rows: List[Tuple[int, int, int]], page_size: int = 1000) -> None:
+        """
+        Пакетно сохраняет периоды [(event_id, start, end), ...] в event_dates.
+        Повторная синхронизация не создаёт дублей: ON CONFLICT по (city, event_id, start, end).
+        """
         table_name = city.lower().replace("-", "_")
-        if not periods:
+        if not rows:
             return
 
-        query = f"""
-            INSERT INTO event_dates_{table_name} (event_id, start_timestamp, end_timestamp)
-            VALUES (%s, %s, %s)
+        query = """
+            INSERT INTO event_dates (city, event_id, start_timestamp, end_timestamp)
+            VALUES %s
+            ON CONFLICT (city, event_id, start_timestamp, end_timestamp) DO NOTHING
         """
 
-        with self.connection.cursor() as cursor:
-            for period in periods:
-                cursor.execute(query, (
-                    event_id,
-                    period["start"],
-                    period["end"]
-                ))
-        self.connection.commit()
+        try:
+            with self.connection.cursor() as cursor:
+                execute_values(
+                    cursor, query,
+                    [(table_name, event_id, start, end) for event_id, start, end in rows],
+                    page_size=page_size
+                )
+            self.connection.commit()
+        except psycopg2.Error as e:
+            self.connection.rollback()
+            logging.error(f"Ошибка пакетного сохранения {len(rows)} периодов для города {city}: {e}")
+            raise
+
+    def compact_event_periods(self, city: str, remove_expired: bool = True) -> Tuple[int, int]:
+        """
+        Компактизация периодов города в event_dates: удаляет дубли (оставляя запись с меньшим id)
+        и, если remove_expired, уже завершившиеся периоды.
+        Дубли возможны только в данных, перенесённых без уникального ключа.
+
+        Returns:
+            Tuple[int, int]: (удалено дублей, удалено завершившихся)
+        """
+        table_name = city.lower().replace("-", "_")
+        now = int(time.time())
 
+        with self.connection.cursor() as cursor:
+            cursor.execute("""
+                DELETE FROM event_dates
+                WHERE city = %s AND id IN (
+                    SELECT id FROM (
+                        SELECT
+                            id,
+                            ROW_NUMBER() OVER (
+                                PARTITION BY event_id, start_timestamp, end_timestamp
+                                ORDER BY id
+                            ) AS rn
+                        FROM event_dates
+                        WHERE city = %s
+                    ) d
+                    WHERE d.rn > 1
+                )
+            """, (table_name, table_name))
+            duplicates = cursor.rowcount
 
+            expired = 0
+            if remove_expired:
+                cursor.execute(
+                    "DELETE FROM event_dates WHERE city = %s AND end_timestamp < %s",
+                    (table_name, now)
+                )
+                expired = cursor.rowcount
 
+        self.connection.commit()
+        logging.info(f"event_dates[{table_name}]: удалено дублей {duplicates}, завершившихся периодов {expired}")
+        return duplicates, expired
 
     def get_actual_periods(self, city: str) -> List[Dict]:
         """
@@ -631,14 +1301,15 @@ class Database:
         try:
             with self.connection.cursor() as cursor:
                 cursor.execute(
-                    f"""
+                    """
                     SELECT event_id, start_timestamp, end_timestamp
-                    FROM event_dates_{table_name}
-                    WHERE start_timestamp >= %s
+                    FROM event_dates
+                    WHERE city = %s
+                    AND start_timestamp >= %s
                     AND start_timestamp < %s
                     ORDER BY start_timestamp
                     """,
-                    (current_timestamp, one_month_later_timestamp)
+                    (table_name, current_timestamp, one_month_later_timestamp)
                 )
 
                 rows = cursor.fetchall()
@@ -781,6 +1452,36 @@ class EventManager:
             cleaned_result.append((cluster_id, float(score)))  # явное приведение
 
         return cleaned_result
+
+    def _status_ml_json(self, status_vector: List[Tuple[str, float]]) -> str:
+        """Преобразует [(cluster_id, score), ...] в JSON-строку для столбца status_ml (JSONB)"""
+        status_ml = []
+        for cluster_id, score in status_vector:
+            status_ml.append({
+                "category": cluster_id,
+                "score": float(score),  # гарантируем float
+                "description": ""  # описание пока пустое (можно дополнить позже)
+            })
+        return json.dumps(status_ml)
+
+    def _classify_items(self, items: List[Dict]) -> Dict[int, str]:
+        """
+        Пакетная классификация: все события кодируются вместе (чанками по BATCH_SIZE)
+        и сравниваются с матрицей кластеров одним умножением.
+
+        Returns:
+            Dict[int, str]: {event_id: status_ml (JSON-строка)}
+        """
+        if not items:
+            return {}
+
+        events_ml = [self.extract_event_fields(item) for item in items]
+        results = self.cluster_service.get_relevant_clusters_batch(events_ml, self.clusters)
+
+        return {
+            item["id"]: self._status_ml_json([(cluster_id, float(score)) for cluster_id, score in result])
+            for item, result in zip(items, results)
+        }
     
     def _create_place_from_item(self, item: Dict) -> Place:
         """Создаёт объект Place из JSON-ответа API"""
@@ -828,7 +1529,22 @@ class EventManager:
             has_parking_lot=item.get("has_parking_lot", False)
         )
     
-    def _create_event_from_item(self, item: Dict) -> Event:
+    def _embed_items(self, items: List[Dict]) -> Dict[int, str]:
+        """
+        Эмбеддинги событий для events.embedding: {event_id: литерал pgvector}.
+        После _classify_items векторы уже в Redis — это один MGET без повторного кодирования.
+        """
+        if not items:
+            return {}
+        try:
+            vectors = self.cluster_service.get_event_vectors([self.extract_event_fields(item) for item in items])
+        except Exception as e:
+            # Без эмбеддинга событие сохраняется, его догонит backfill_embeddings
+            logging.error(f"Ошибка расчёта эмбеддингов для {len(items)} событий: {e}")
+            return {}
+        return {item["id"]: to_pgvector(vector) for item, vector in zip(items, vectors)}
+
+    def _create_event_from_item(self, item: Dict, status_ml: Optional[str] = None, classify: bool = True) -> Event:
         # Извлекаем и преобразуем даты
         start_str = item.get("start")
         end_str = item.get("finish")
@@ -864,25 +1580,16 @@ class EventManager:
             else:
                 cleaned_tags.append(tag)            
 
-        #Сохраняем status_ml
+        #Сохраняем status_ml (если не посчитан заранее пакетно — считаем для одного события;
+        # classify=False — событие уже классифицировано, status_ml остаётся None и не перезаписывается)
+        if status_ml is None and classify:
+            event_ml = self.extract_event_fields(item)
 
-        event_ml = self.extract_event_fields(item)
+            # Получаем вектор статусов (список кортежей: [(cluster_id, score), ...])
+            status_vector = self._get_status_vector(event_ml)
 
-        # Получаем вектор статусов (список кортежей: [(cluster_id, score), ...])
-        status_vector = self._get_status_vector(event_ml)
-
-
-                # Преобразуем в список словарей для JSONB
-        status_ml = []
-        for cluster_id, score in status_vector:
-            status_ml.append({
-                "category": cluster_id,
-                "score": float(score),  # гарантируем float
-                "description": ""  # описание пока пустое (можно дополнить позже)
-            })
-
-        # Конвертируем в JSON-строку для столбца JSONB
-        status_ml = json.dumps(status_ml)
+            # Конвертируем в JSON-строку для столбца JSONB
+            status_ml = self._status_ml_json(status_vector)
 
 
             #ЭТО ЗАВТРА ПОМЕНЯТЬ
@@ -965,110 +1672,238 @@ class EventManager:
         return {k: v for k, v in data.items() if k in event_fields}
 
 
-    def sync_events(self, cities: List[str], limit: int = 100):
+    def _save_event_items(self, city: str, items: List[Dict]) -> int:
+        """
+        Создаёт или обновляет события (и их периоды) из JSON-ответов API. Возвращает число обработанных.
+        Классифицируются и кодируются только новые события и события с изменённым текстом
+        (title, description, tags); у остальных обновляются поля, status_ml и эмбеддинг сохраняются.
+        """
+        stored = self.db.get_stored_event_texts(city, [item["id"] for item in items])
+
+        changed_items = []
+        for item in items:
+            text = (item.get("title") or "", item.get("description") or "", list(item.get("tags") or []))
+            if stored.get(item["id"]) != text:
+                changed_items.append(item)
+            else:
+                logging.debug(f"Текст события {item['id']} не изменился, классификация пропущена")
+        changed_ids = {item["id"] for item in changed_items}
+
+        # а) Классифицируем новые и изменённые события пакета разом и создаём объекты Event
+        status_by_id = self._classify_items(changed_items)
+        embedding_by_id = self._embed_items(changed_items)
+        events = [
+            self._create_event_from_item(
+                item, status_by_id.get(item["id"]), classify=item["id"] in changed_ids
+            )
+            for item in items
+        ]
+        for event in events:
+            event.embedding = embedding_by_id.get(event.id)
+
+        # Сохраняем все события пакета одним запросом (upsert) и одним commit
+        self.db.save_events(city, events)
+        logging.debug(f"Сохранено событий: {len(events)}, из них новых или с новым текстом: {len(changed_items)}")
+
+        # б) Собираем периоды всех событий пакета и сохраняем одним запросом
+        period_rows = []
+        for item in items:
+            periods = item.get("dates", [])
+            if periods:
+                valid_periods = []
+                for period in periods:
+                    start = period.get("start")
+                    end = period.get("end")
+
+                    if start is None or end is None:
+                        logging.warning(f"Пропущен период без start/end: {period}")
+                        continue
+
+                    if start > end:
+                        logging.warning(f"Пропущен некорректный период (start >= end): {period}")
+                        continue
+
+                    valid_periods.append({
+                        "start": start,
+                        "end": end
+                    })
+
+                if valid_periods:
+                    period_rows.extend(
+                        (item["id"], period["start"], period["end"]) for period in valid_periods
+                    )
+                    logging.debug(f"Подготовлено {len(valid_periods)} периодов для события {item['id']}")
+                else:
+                    logging.warning(f"Нет валидных периодов для события {item['id']}")
+            else:
+                logging.info(f"У события {item['id']} нет периодов")
+
+        self.db.save_event_periods_bulk(city, period_rows)
+        logging.debug(f"Сохранено периодов: {len(period_rows)}")
+
+        return len(items)
+
+    def sync_events(self, cities: List[str], limit: int = 100, mode: str = "list", incremental: bool = False) -> List[str]:
+        """
+        Синхронизирует события для указанных городов.
+
+        Args:
+            cities (List[str]): Список городов (например, ["spb", "msk"]).
+            limit (int): Лимит для режима "details".
+            mode (str): "list" — события берутся целиком из списка /events/ (page_size=100)
+                        и сохраняются постранично; "details" — сначала ID, затем детали по каждому.
+            incremental (bool): Загружать только события, опубликованные после курсора
+                        из sync_state (только для режима "list"). Без курсора — полный проход.
+
+        Returns:
+            List[str]: Города, синхронизация которых оборвалась ошибкой (в т.ч. KudaGoPagingError):
+                данные по ним неполные, курсор не сдвинут.
+        """
+        if mode not in ("list", "details"):
+            raise ValueError(f"Неизвестный режим синхронизации: {mode}")
+
         self.db.connect()
 
+        failed = []
         for city in cities:
-            logging.info(f"Обработка города: {city}")
+            logging.info(f"Обработка города: {city} (режим {mode})")
             self.db.create_city_table(city)
 
             try:
-                # 1. Получаем ID событий
-                event_ids = self.api.get_event_ids(city, limit)
-                if not event_ids:
-                    logging.warning(f"Нет событий для города {city}")
-                    continue
+                if mode == "list":
+                    published_after = None
+                    if incremental:
+                        cursor = self.db.get_sync_cursor(city)
+                        if cursor:
+                            published_after = cursor["last_publication_date"]
+                        logging.info(f"Инкрементальная синхронизация {city}, курсор: {published_after}")
+
+                    # Страницы сразу уходят в обработку, без N+1 запросов деталей
+                    total = 0
+                    max_publication_date = None
+                    max_event_id = None
+                    for page in self.api.iter_event_pages(city, published_after=published_after):
+                        total += self._save_event_items(city, page)
+                        for item in page:
+                            max_publication_date = max(max_publication_date or 0, item.get("publication_date") or 0)
+                            max_event_id = max(max_event_id or 0, item["id"])
+
+                    # Курсор видит только новые публикации: события, актуальные в ближайшие
+                    # SYNC_REFRESH_DAYS дней, перечитываются целиком — правки полей и новые даты
+                    # (в т.ч. регулярных событий, чьи прошедшие периоды удаляет compact_periods)
+                    if incremental and SYNC_REFRESH_DAYS > 0:
+                        refreshed = 0
+                        for page in self.api.iter_event_pages(city, actual_days=SYNC_REFRESH_DAYS):
+                            refreshed += self._save_event_items(city, page)
+                        logging.info(f"Окно обновления {city} ({SYNC_REFRESH_DAYS} дн.): {refreshed} событий")
+                        total += refreshed
+
+                    # Курсор двигаем только после полного прохода по всем страницам:
+                    # при исчерпании попыток iter_event_pages бросает KudaGoPagingError
+                    # и управление уходит в except ниже, мимо save_sync_cursor
+                    if total:
+                        self.db.save_sync_cursor(city, max_publication_date or None, max_event_id)
+                else:
+                    # 1. Получаем ID событий
+                    event_ids = self.api.get_event_ids(city, limit)
+                    if not event_ids:
+                        logging.warning(f"Нет событий для города {city}")
+                        continue
 
-                full_events = []
-                for event_id in event_ids:
-                    details = self.api.get_event_details(event_id)
-                    if details:
-                        full_events.append(details)
-                    else:
-                        logging.warning(f"Не удалось получить детали для события {event_id}")
+                    full_events = self.api.get_events_details(event_ids)
+                    total = self._save_event_items(city, full_events)
 
-                if not full_events:
+                if not total:
                     logging.info(f"Нет данных для сохранения по городу {city}")
                     continue
 
-                # 2. Обрабатываем каждое событие
-                for item in full_events:
-                    #а) Создаём событие (даты и статус извлекаются внутри метода)
-                    event = self._create_event_from_item(item)
-
-                    # Сохраняем основное событие
-                    self.db.save_events(city, [event])  # save_events принимает список
-                    logging.debug(f"Сохранено основное событие: {event.id}")
-
-                    # query_ml = f"""
-                    # INSERT INTO {city} (
-                    #     status_ml
-                    # ) VALUES (
-                    #     %s)
-                    # """
-
-                    # with self.connection.cursor() as cursor:
-                    #         cursor.execute(query_ml, (
-                    #         status_ml   
-                    #         ))
-                    # self.connection.commit()
-
-                    # logging.debug(f"Сохранен Cтатус Мероприятия по Рекомендациям для кластеров: {event.id}")
-
-
-                    # 3. Сохраняем периоды (если есть)
-                    periods = item.get("dates", [])
-                    if periods:
-                        valid_periods = []
-                        for period in periods:
-                            start = period.get("start")
-                            end = period.get("end")
-
-                            if start is None or end is None:
-                                logging.warning(f"Пропущен период без start/end: {period}")
-                                continue
-
-                            if start > end:
-                                logging.warning(f"Пропущен некорректный период (start >= end): {period}")
-                                continue
-
-                            valid_periods.append({
-                                "start": start,
-                                "end": end
-                            })
-
-                        if valid_periods:
-                            self.db.save_event_periods(event.id, valid_periods, city)
-                    
-                            logging.debug(f"Сохранено {len(valid_periods)} периодов для события {event.id}")
-                        else:
-                            logging.warning(f"Нет валидных периодов для события {event.id}")
-                    else:
-                        logging.info(f"У события {event.id} нет периодов")
-
                 self.db.get_actual_periods(city)
 
-                logging.info(f"Завершена обработка города {city}. Сохранены данные по {len(full_events)} событиям.")
+                logging.info(f"Завершена обработка города {city}. Сохранены данные по {total} событиям.")
 
             except Exception as e:
                 logging.error(f"Ошибка при обработке города {city}: {e}", exc_info=True)
+                failed.append(city)
+
+        return failed
 
 
-    def sync_places(self, cities: List[str], limit: int=2000):
+    def compact_periods(self, cities: List[str]) -> Dict[str, Tuple[int, int]]:
+        """Удаляет дубли и завершившиеся периоды событий для списка городов"""
+        self.db.connect()
+
+        result = {}
+        for city in cities:
+            try:
+                result[city] = self.db.compact_event_periods(city)
+            except Exception as e:
+                logging.error(f"Ошибка компактизации периодов для города {city}: {e}", exc_info=True)
+                self.db.connection.rollback()
+        return result
+
+    def backfill_embeddings(self, cities: List[str], batch_size: int = 500) -> Dict[str, int]:
+        """
+        Заполняет events.embedding у актуальных событий, сохранённых без него
+        (до появления колонки или при ошибке расчёта). Векторы берутся из Redis,
+        промахи кодируются моделью. Возвращает {город: число обновлённых событий}.
+        """
+        result = {}
+        for city in cities:
+            total = 0
+            try:
+                while True:
+                    events = self.db.get_events_without_embedding(city, batch_size)
+                    if not events:
+                        break
+                    vectors = self.cluster_service.get_event_vectors(events)
+                    total += self.db.save_event_embeddings(
+                        city,
+                        [(event["id"], to_pgvector(vector)) for event, vector in zip(events, vectors)]
+                    )
+                    if len(events) < batch_size:
+                        break
+                logging.info(f"Город {city}: эмбеддинги записаны для {total} событий")
+            except Exception as e:
+                logging.error(f"Ошибка заполнения эмбеддингов для города {city}: {e}")
+                self.db.connection.rollback()
+            result[city] = total
+        return result
+
+    def refresh_upcoming_events(self, cities: List[str]):
+        """Обновляет материализованные кандидаты рекомендаций после синхронизации"""
+        self.db.connect()
+
+        for city in cities:
+            try:
+                self.db.refresh_upcoming_events(city)
+            except Exception as e:
+                logging.error(f"Ошибка обновления кандидатов для города {city}: {e}", exc_info=True)
+
+        # Новое поколение: бот перестаёт отдавать сохранённые списки рекомендаций (bot/rec_cache.py)
+        try:
+            generation = self.cluster_service.cache.client.incr(RECOMMENDATION_GENERATION_KEY)
+            logging.info(f"Поколение рекомендаций: {generation}")
+        except RedisError as e:
+            logging.error(f"Не удалось обновить поколение рекомендаций: {e}")
+
+    def sync_places(self, cities: List[str], limit: int=2000) -> List[str]:
         """
         Синхронизирует места (places) для указанных городов:
         - получает ID мест через API;
-        - загружает детали по каждому месту;
+        - загружает детали по всем местам (асинхронно, пулом воркеров);
         - сохраняет в БД (с обновлением при конфликте по ID).
 
 
         Args:
             cities (List[str]): Список городов (например, ["spb", "msk"]).
             limit (int): Лимит мест на город (по умолчанию 100).
+
+        Returns:
+            List[str]: Города, синхронизация которых оборвалась ошибкой.
         """
         self.db.connect()
 
-
+        failed = []
         for city in cities:
 
             logging.info(f"Places Обработка города: {city}")
@@ -1083,14 +1918,8 @@ class EventManager:
 
                 logging.info(f"Получено {len(place_ids)} ID мест для {city}")
 
-                # 2. Загружаем детали по каждому месту
-                full_places = []
-                for place_id in place_ids:
-                    details = self.api.get_place_details(place_id)
-                    if details:
-                        full_places.append(details)
-                    else:
-                        logging.warning(f"Не удалось получить детали для места {place_id}")
+                # 2. Загружаем детали по всем местам (параллельно)
+                full_places = self.api.get_places_details(place_ids)
 
                 if not full_places:
                     logging.info(f"Нет данных для сохранения по городу {city}")
@@ -1117,6 +1946,9 @@ class EventManager:
 
             except Exception as e:
                 logging.error(f"Ошибка при синхронизации мест для города {city}: {e}", exc_info=True)
+                failed.append(city)
+
+        return failed
 
 
     def _get_place_ids(self, city: str, limit: int) -> List[int]:
@@ -0,0 +1,35 @@
+-- Перенос истории действий из users.event_history (JSONB) в user_event_actions.
+-- Идемпотентна: повторный запуск не создаёт дублей и не откатывает более свежие действия.
+--
+-- Запуск:  psql "$POSTGRES_URI" -f migrations/001_backfill_user_event_actions.sql
+--
+-- После переноса бот читает историю только из user_event_actions;
+-- колонка users.event_history больше не пишется и может быть удалена отдельной миграцией.
+
+BEGIN;
+
+CREATE INDEX IF NOT EXISTS idx_user_event_actions_recent ON user_event_actions(user_id, timestamp DESC);
+
+INSERT INTO user_event_actions (user_id, event_id, action, timestamp)
+SELECT user_id, event_id, action, MAX(ts)
+FROM (
+    SELECT
+        u.id AS user_id,
+        (h->>'event_id')::BIGINT AS event_id,
+        h->>'rating' AS action,
+        CASE
+            WHEN h->>'timestamp' ~ '^[0-9]+$' THEN to_timestamp((h->>'timestamp')::BIGINT)
+            ELSE NOW()
+        END AS ts
+    FROM users u
+    CROSS JOIN LATERAL jsonb_array_elements(
+        CASE WHEN jsonb_typeof(u.event_history) = 'array' THEN u.event_history ELSE '[]'::jsonb END
+    ) AS h
+    WHERE h->>'event_id' ~ '^[0-9]+$'
+      AND h->>'rating' IN ('like', 'dislike', 'confirmed')
+) history
+GROUP BY user_id, event_id, action
+ON CONFLICT (user_id, event_id, action)
+DO UPDATE SET timestamp = GREATEST(user_event_actions.timestamp, EXCLUDED.timestamp);
+
+COMMIT;
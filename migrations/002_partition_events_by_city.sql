@@ -0,0 +1,153 @@
+-- Переход с таблиц событий по городам (msk, spb, event_dates_msk, ...) на единые
+-- секционированные таблицы events / event_dates.
+-- Идемпотентна: уже переведённый город (msk — представление) пропускается.
+--
+-- Запуск:  psql "$POSTGRES_URI" -f migrations/002_partition_events_by_city.sql
+--
+-- Старые таблицы сохраняются как <city>_legacy / event_dates_<city>_legacy и удаляются
+-- вручную после проверки. Вместо них остаются представления <city> и event_dates_<city>,
+-- поэтому старые запросы на чтение продолжают работать.
+-- То же самое делает kudago.Database.create_city_table при первом запуске синхронизации.
+
+BEGIN;
+
+-- Единая таблица событий, секционированная по городу (LIST).
+-- Город без отдельной секции попадает в events_part_default — DDL для нового города не нужен.
+CREATE TABLE IF NOT EXISTS events (
+    city VARCHAR(50) NOT NULL,
+    id BIGINT NOT NULL,
+    title VARCHAR(255) NOT NULL,
+    description TEXT,
+    place_name VARCHAR(255),
+    address TEXT,
+    event_url VARCHAR(500),
+    image_url VARCHAR(500),
+    start_datetime BIGINT,
+    end_datetime BIGINT,
+    category VARCHAR(255),
+    status VARCHAR(20) DEFAULT 'upcoming',
+    status_ml JSONB,
+    publication_date BIGINT,
+    slug VARCHAR(255),
+    age_restriction VARCHAR(10),
+    price VARCHAR(255),
+    is_free BOOLEAN,
+    tags TEXT[],
+    favorites_count INTEGER,
+    comments_count INTEGER,
+    short_title VARCHAR(255),
+    disable_comments BOOLEAN,
+    place_id BIGINT,
+    likes BIGINT DEFAULT 0,
+    added_by BIGINT,
+    PRIMARY KEY (city, id),
+    CONSTRAINT fk_place
+        FOREIGN KEY (place_id)
+        REFERENCES places (id)
+        ON DELETE SET NULL
+) PARTITION BY LIST (city);
+
+CREATE TABLE IF NOT EXISTS events_part_default PARTITION OF events DEFAULT;
+
+-- id событий KudaGo глобальны: поиск без города — один индекс на секцию
+CREATE INDEX IF NOT EXISTS idx_events_id ON events (id);
+
+-- Даты событий, секционированные так же, как events
+CREATE TABLE IF NOT EXISTS event_dates (
+    city VARCHAR(50) NOT NULL,
+    id BIGSERIAL,
+    event_id BIGINT NOT NULL,
+    start_timestamp BIGINT NOT NULL,
+    end_timestamp BIGINT NOT NULL,
+    PRIMARY KEY (city, id),
+    UNIQUE (city, event_id, start_timestamp, end_timestamp),
+    FOREIGN KEY (city, event_id) REFERENCES events (city, id) ON DELETE CASCADE
+) PARTITION BY LIST (city);
+
+CREATE TABLE IF NOT EXISTS event_dates_part_default PARTITION OF event_dates DEFAULT;
+
+CREATE INDEX IF NOT EXISTS idx_event_dates_start ON event_dates (city, start_timestamp);
+
+-- Функция подготовки города: отдельные секции и представления совместимости <city>, event_dates_<city>
+CREATE OR REPLACE FUNCTION create_city_event_tables(city_name TEXT)
+RETURNS VOID AS $$
+DECLARE
+    table_name TEXT := LOWER(REPLACE(city_name, '-', '_'));
+BEGIN
+    -- Проверка корректности имени таблицы
+    IF NOT table_name ~ '^[a-z][a-z0-9_]*$' THEN
+        RAISE EXCEPTION 'Некорректное имя таблицы: %', table_name;
+    END IF;
+
+    -- Отдельная секция необязательна; её нельзя создать, если в DEFAULT уже есть строки города
+    IF to_regclass(format('events_part_%s', table_name)) IS NULL THEN
+        IF EXISTS (SELECT 1 FROM events_part_default WHERE city = table_name) THEN
+            RAISE NOTICE 'В секции по умолчанию уже есть события %, отдельная секция не создаётся', table_name;
+        ELSE
+            EXECUTE format('CREATE TABLE %I PARTITION OF events FOR VALUES IN (%L)',
+                'events_part_' || table_name, table_name);
+            EXECUTE format('CREATE TABLE %I PARTITION OF event_dates FOR VALUES IN (%L)',
+                'event_dates_part_' || table_name, table_name);
+        END IF;
+    END IF;
+
+    -- Представления для старых запросов: FROM msk, INSERT INTO event_dates_msk и т.п.
+    EXECUTE format('CREATE OR REPLACE VIEW %I AS SELECT * FROM events WHERE city = %L',
+        table_name, table_name);
+    EXECUTE format('ALTER VIEW %I ALTER COLUMN city SET DEFAULT %L',
+        table_name, table_name);
+    EXECUTE format('CREATE OR REPLACE VIEW %I AS SELECT * FROM event_dates WHERE city = %L',
+        'event_dates_' || table_name, table_name);
+    EXECUTE format('ALTER VIEW %I ALTER COLUMN city SET DEFAULT %L',
+        'event_dates_' || table_name, table_name);
+END;
+$$ LANGUAGE plpgsql;
+
+-- Комментарий к функции
+COMMENT ON FUNCTION create_city_event_tables(TEXT) IS 'Создаёт секции events/event_dates для города и представления совместимости <city>, event_dates_<city>';
+
+DO $$
+DECLARE
+    city_name TEXT;
+    column_list TEXT := 'id, title, description, place_name, address, event_url, image_url, '
+        'start_datetime, end_datetime, category, status, status_ml, publication_date, '
+        'slug, age_restriction, price, is_free, tags, favorites_count, comments_count, '
+        'short_title, disable_comments, place_id, likes, added_by';
+BEGIN
+    FOREACH city_name IN ARRAY ARRAY['msk', 'spb'] LOOP
+        -- Уже переведённый город: на месте таблицы стоит представление
+        IF NOT EXISTS (
+            SELECT 1 FROM pg_class c JOIN pg_namespace n ON n.oid = c.relnamespace
+            WHERE n.nspname = 'public' AND c.relname = city_name AND c.relkind = 'r'
+        ) THEN
+            PERFORM create_city_event_tables(city_name);
+            CONTINUE;
+        END IF;
+
+        EXECUTE format('ALTER TABLE %I RENAME TO %I', city_name, city_name || '_legacy');
+        IF to_regclass('event_dates_' || city_name) IS NOT NULL THEN
+            EXECUTE format('ALTER TABLE %I RENAME TO %I',
+                'event_dates_' || city_name, 'event_dates_' || city_name || '_legacy');
+        END IF;
+
+        -- Секции создаются до переноса, чтобы строки города не попали в DEFAULT
+        PERFORM create_city_event_tables(city_name);
+
+        EXECUTE format(
+            'INSERT INTO events (city, %s) SELECT %L, %s FROM %I ON CONFLICT (city, id) DO NOTHING',
+            column_list, city_name, column_list, city_name || '_legacy');
+
+        IF to_regclass('event_dates_' || city_name || '_legacy') IS NOT NULL THEN
+            EXECUTE format(
+                'INSERT INTO event_dates (city, event_id, start_timestamp, end_timestamp)
+                 SELECT %L, event_id, start_timestamp, end_timestamp FROM %I
+                 ON CONFLICT (city, event_id, start_timestamp, end_timestamp) DO NOTHING',
+                city_name, 'event_dates_' || city_name || '_legacy');
+        END IF;
+
+        RAISE NOTICE 'Город % переведён на секционированные таблицы', city_name;
+    END LOOP;
+END;
+$$;
+
+COMMIT;
@@ -0,0 +1,58 @@
+-- Материализованные кандидаты рекомендаций upcoming_events_<city>:
+-- ближайший будущий старт, название и адрес места, теги, популярность и приоритет тега.
+-- Идемпотентна. Требует секционированных events/event_dates (002_partition_events_by_city.sql).
+--
+-- Запуск:  psql "$POSTGRES_URI" -f migrations/003_upcoming_events_views.sql
+--
+-- Обновление: REFRESH MATERIALIZED VIEW CONCURRENTLY upcoming_events_<city>
+-- (get_all_main.py после синхронизации и периодическая задача бота).
+
+BEGIN;
+
+DO $$
+DECLARE
+    city_name TEXT;
+    view_name TEXT;
+BEGIN
+    FOREACH city_name IN ARRAY ARRAY['msk', 'spb'] LOOP
+        view_name := 'upcoming_events_' || city_name;
+
+        EXECUTE format($view$
+            CREATE MATERIALIZED VIEW IF NOT EXISTS %I AS
+            SELECT
+                e.id,
+                e.title,
+                e.description,
+                d.start_datetime,
+                e.event_url,
+                e.status_ml,
+                e.favorites_count,
+                p.address,
+                p.title AS place_title,
+                e.tags,
+                CASE
+                    WHEN 'добавленное' = ANY(e.tags) THEN 1
+                    WHEN 'интересное' = ANY(e.tags) THEN 2
+                    ELSE 3
+                END AS priority
+            FROM events e
+            JOIN (
+                SELECT event_id, MIN(start_timestamp) AS start_datetime
+                FROM event_dates
+                WHERE city = %L
+                AND start_timestamp >= EXTRACT(EPOCH FROM NOW())::BIGINT
+                GROUP BY event_id
+            ) d ON d.event_id = e.id
+            LEFT JOIN places p ON p.id = e.place_id
+            WHERE e.city = %L
+        $view$, view_name, city_name, city_name);
+
+        EXECUTE format('CREATE UNIQUE INDEX IF NOT EXISTS %I ON %I (id)',
+            'uq_' || view_name || '_id', view_name);
+        EXECUTE format('CREATE INDEX IF NOT EXISTS %I ON %I (priority, favorites_count DESC, start_datetime)',
+            'idx_' || view_name || '_rank', view_name);
+    END LOOP;
+END;
+$$;
+
+COMMIT;
@@ -0,0 +1,59 @@
+-- Добавляет сайт места (place_site_url) в upcoming_events_<city>, чтобы кандидаты рекомендаций
+-- приходили вместе с полными данными места одним запросом.
+-- Материализованное представление нельзя изменить через ALTER, поэтому оно пересоздаётся.
+-- Требует 003_upcoming_events_views.sql.
+--
+-- Запуск:  psql "$POSTGRES_URI" -f migrations/004_upcoming_events_place_site.sql
+
+BEGIN;
+
+DO $$
+DECLARE
+    city_name TEXT;
+    view_name TEXT;
+BEGIN
+    FOREACH city_name IN ARRAY ARRAY['msk', 'spb'] LOOP
+        view_name := 'upcoming_events_' || city_name;
+
+        EXECUTE format('DROP MATERIALIZED VIEW IF EXISTS %I', view_name);
+
+        EXECUTE format($view$
+            CREATE MATERIALIZED VIEW %I AS
+            SELECT
+                e.id,
+                e.title,
+                e.description,
+                d.start_datetime,
+                e.event_url,
+                e.status_ml,
+                e.favorites_count,
+                p.address,
+                p.title AS place_title,
+                e.tags,
+                CASE
+                    WHEN 'добавленное' = ANY(e.tags) THEN 1
+                    WHEN 'интересное' = ANY(e.tags) THEN 2
+                    ELSE 3
+                END AS priority,
+                p.site_url AS place_site_url
+            FROM events e
+            JOIN (
+                SELECT event_id, MIN(start_timestamp) AS start_datetime
+                FROM event_dates
+                WHERE city = %L
+                AND start_timestamp >= EXTRACT(EPOCH FROM NOW())::BIGINT
+                GROUP BY event_id
+            ) d ON d.event_id = e.id
+            LEFT JOIN places p ON p.id = e.place_id
+            WHERE e.city = %L
+        $view$, view_name, city_name, city_name);
+
+        EXECUTE format('CREATE UNIQUE INDEX IF NOT EXISTS %I ON %I (id)',
+            'uq_' || view_name || '_id', view_name);
+        EXECUTE format('CREATE INDEX IF NOT EXISTS %I ON %I (priority, favorites_count DESC, start_datetime)',
+            'idx_' || view_name || '_rank', view_name);
+    END LOOP;
+END;
+$$;
+
+COMMIT;
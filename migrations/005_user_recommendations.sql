@@ -0,0 +1,18 @@
+-- Таблица готовых рекомендаций для ночного пакетного расчёта (recommendations_batch.py).
+-- Идемпотентна.
+--
+-- Запуск:  psql "$POSTGRES_URI" -f migrations/005_user_recommendations.sql
+
+BEGIN;
+
+CREATE TABLE IF NOT EXISTS user_recommendations (
+    user_id BIGINT NOT NULL,
+    rank SMALLINT NOT NULL,
+    event_id BIGINT NOT NULL,
+    city VARCHAR(50) NOT NULL,
+    score REAL NOT NULL,
+    generated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+    PRIMARY KEY (user_id, rank)
+);
+
+COMMIT;
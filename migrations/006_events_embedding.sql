@@ -0,0 +1,26 @@
+-- Колонка эмбеддингов событий events.embedding (pgvector) и HNSW-индекс для поиска похожих в SQL.
+-- Векторы больше не живут только в Redis с TTL: синк пишет их в events при сохранении,
+-- а уже сохранённые актуальные события дозаполняет EventManager.backfill_embeddings
+-- (шаг get_all_main.py).
+-- Требует образ с расширением pgvector (pgvector/pgvector:pg15, см. docker-compose.yml).
+--
+-- Запуск:  psql "$POSTGRES_URI" -f migrations/006_events_embedding.sql
+
+CREATE EXTENSION IF NOT EXISTS vector;
+
+BEGIN;
+
+ALTER TABLE events ADD COLUMN IF NOT EXISTS embedding vector(384);
+
+-- Индекс на секционированной таблице создаётся на каждой секции, включая будущие
+CREATE INDEX IF NOT EXISTS idx_events_embedding ON events USING hnsw (embedding vector_cosine_ops);
+
+COMMIT;
+
+-- Фильтры поверх HNSW-скана не урезают выдачу ниже LIMIT (pgvector >= 0.8);
+-- действует для новых подключений
+DO $$
+BEGIN
+    EXECUTE format('ALTER DATABASE %I SET hnsw.iterative_scan = strict_order', current_database());
+END;
+$$;
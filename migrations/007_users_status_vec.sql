@@ -0,0 +1,7 @@
+-- Плотный профиль интересов пользователя users.status_vec (REAL[]) по порядку кластеров clusters.json.
+-- Бот обновляет его при лайке сложением векторов; пока колонка NULL, профиль читается из JSONB status_ml.
+-- Перенос существующих профилей не нужен: первый лайк пишет status_vec из status_ml + событие.
+--
+-- Запуск:  psql "$POSTGRES_URI" -f migrations/007_users_status_vec.sql
+
+ALTER TABLE users ADD COLUMN IF NOT EXISTS status_vec REAL[];
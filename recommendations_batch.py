@@ -0,0 +1,274 @@
+"""
+Ночной пакетный расчёт рекомендаций для активных пользователей.
+
+Запускается из get_all_main.py сразу после синхронизации и обновления upcoming_events_<city>
+(run_batch), отдельно — python recommendations_batch.py. Берёт кандидатов из upcoming_events_<city>,
+строит матрицы status_ml пользователей и событий по категориям и считает все оценки
+одним умножением матриц на пачку пользователей. Top-N пишется в user_recommendations,
+бот отдаёт их без расчёта на пути запроса и считает онлайн только при отсутствии списка.
+
+Оценка та же, что в MLService._recommend_by_status_ml — сумма по общим категориям
+score события × вес категории пользователя (скалярное произведение векторов), профиль
+пользователя — накопленный users.status_vec (до первой записи — JSONB status_ml).
+Столбцы матриц — каталог кластеров clusters.json (ai.status_profile.CategoryCatalogue).
+
+После прохода удаляются списки, которые этот запуск не перегенерировал (пользователь
+выпал из активных или для него не осталось кандидатов): бот их больше не отдаст.
+"""
+import logging
+import os
+import time
+from collections import defaultdict
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import psycopg2
+import redis
+from psycopg2.extras import execute_values
+from dotenv import load_dotenv
+
+from ai.status_profile import CategoryCatalogue
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+CITY_TABLES = {1: ["msk"], 2: ["spb"]}
+ALL_CITIES = ["msk", "spb"]
+
+TOP_N = int(os.getenv("BATCH_TOP_N", 50))
+ACTIVE_DAYS = int(os.getenv("BATCH_ACTIVE_DAYS", 30))           # активен = действие за последние N дней
+USER_CHUNK = int(os.getenv("BATCH_USER_CHUNK", 1024))           # пользователей на одно умножение матриц
+WINDOW_DAYS = int(os.getenv("BATCH_WINDOW_DAYS", 45))           # горизонт кандидатов, как months_ahead=1.5 у бота
+
+# Ключ поколения рекомендаций в Redis (bot/rec_cache.py: GENERATION_KEY)
+RECOMMENDATION_GENERATION_KEY = "rec:generation"
+
+
+def top_n_scores(
+    user_matrix: np.ndarray,
+    event_matrix: np.ndarray,
+    seen_mask: np.ndarray,
+    n: int
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Оценки пачки пользователей по всем событиям одним умножением и top-n по каждой строке.
+
+    :param seen_mask: bool (users, events) — уже оценённые события, исключаются
+    :return: (индексы событий, оценки), обе формы (users, k), по убыванию оценки
+    """
+    scores = user_matrix @ event_matrix.T
+    scores[seen_mask] = -np.inf
+
+    k = min(n, scores.shape[1])
+    if k == 0:
+        empty = np.empty((scores.shape[0], 0))
+        return empty.astype(np.int64), empty.astype(np.float32)
+
+    # argpartition — O(events) на строку, сортируется только top-k
+    part = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    part_scores = np.take_along_axis(scores, part, axis=1)
+    order = np.argsort(-part_scores, axis=1, kind="stable")
+    return np.take_along_axis(part, order, axis=1), np.take_along_axis(part_scores, order, axis=1)
+
+
+class RecommendationBatch:
+    def __init__(self, dsn: str, catalogue: CategoryCatalogue):
+        self.dsn = dsn
+        self.catalogue = catalogue
+        self.connection = None
+
+    def connect(self):
+        self.connection = psycopg2.connect(self.dsn)
+
+    def close(self):
+        if self.connection:
+            self.connection.close()
+
+    def load_active_users(self) -> List[Tuple[int, Optional[int], np.ndarray]]:
+        """(id, city, профиль) пользователей с действиями за ACTIVE_DAYS и непустым профилем."""
+        with self.connection.cursor() as cursor:
+            cursor.execute(
+                """
+                SELECT u.id, u.city, u.status_vec, u.status_ml
+                FROM users u
+                WHERE (
+                    u.status_vec IS NOT NULL
+                    OR (jsonb_typeof(u.status_ml) = 'array' AND jsonb_array_length(u.status_ml) > 0)
+                )
+                AND EXISTS (
+                    SELECT 1 FROM user_event_actions a
+                    WHERE a.user_id = u.id
+                    AND a.timestamp > NOW() - make_interval(days => %s)
+                )
+                """,
+                (ACTIVE_DAYS,)
+            )
+            rows = cursor.fetchall()
+        return [(user_id, city, self.catalogue.profile(status_vec, status_ml)) for user_id, city, status_vec, status_ml in rows]
+
+    def load_event_pool(self, city: str) -> List[Tuple[int, list]]:
+        """(id, status_ml) кандидатов города в горизонте WINDOW_DAYS."""
+        now_ts = int(time.time())
+        with self.connection.cursor() as cursor:
+            cursor.execute(
+                f"""
+                SELECT id, status_ml
+                FROM upcoming_events_{city}
+                WHERE start_datetime >= %s AND start_datetime <= %s
+                """,
+                (now_ts, now_ts + WINDOW_DAYS * 24 * 3600)
+            )
+            return cursor.fetchall()
+
+    def load_seen(self, user_ids: List[int]) -> Dict[int, set]:
+        """Все события, с которыми пользователи уже взаимодействовали."""
+        seen = defaultdict(set)
+        with self.connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT user_id, event_id FROM user_event_actions WHERE user_id = ANY(%s)",
+                (user_ids,)
+            )
+            for user_id, event_id in cursor.fetchall():
+                seen[user_id].add(event_id)
+        return seen
+
+    def save(self, user_ids: List[int], rows: List[Tuple[int, int, int, str, float]]):
+        """Заменяет списки пользователей пачки: старые строки удаляются в той же транзакции."""
+        with self.connection.cursor() as cursor:
+            cursor.execute("DELETE FROM user_recommendations WHERE user_id = ANY(%s)", (user_ids,))
+            execute_values(
+                cursor,
+                """
+                INSERT INTO user_recommendations (user_id, rank, event_id, city, score)
+                VALUES %s
+                """,
+                rows,
+                page_size=5000
+            )
+        self.connection.commit()
+
+    def run_started_at(self):
+        """Время начала запуска по часам БД — с ним сравнивается generated_at (DEFAULT NOW())."""
+        with self.connection.cursor() as cursor:
+            cursor.execute("SELECT NOW()")
+            started_at = cursor.fetchone()[0]
+        self.connection.commit()
+        return started_at
+
+    def purge_stale(self, started_at) -> int:
+        """Удаляет строки, записанные до начала запуска: их пользователи в этот раз не пересчитывались."""
+        with self.connection.cursor() as cursor:
+            cursor.execute("DELETE FROM user_recommendations WHERE generated_at < %s", (started_at,))
+            deleted = cursor.rowcount
+        self.connection.commit()
+        logger.info(f"Удалено устаревших строк рекомендаций: {deleted}")
+        return deleted
+
+    def run(self) -> int:
+        started = time.monotonic()
+        # NOW() в каждой транзакции save() не раньше этой отметки
+        started_at = self.run_started_at()
+        users = self.load_active_users()
+        if not users:
+            logger.info("Нет активных пользователей для пакетного расчёта")
+            self.purge_stale(started_at)
+            return 0
+
+        # Пул событий: все города одной матрицей, столбец city — для фильтра по городу пользователя
+        event_ids, event_cities, event_statuses = [], [], []
+        for city in ALL_CITIES:
+            for event_id, status in self.load_event_pool(city):
+                event_ids.append(event_id)
+                event_cities.append(city)
+                event_statuses.append(status)
+        if not event_ids:
+            logger.info("Нет кандидатов в upcoming_events_*: пакетный расчёт пропущен")
+            self.purge_stale(started_at)
+            return 0
+
+        event_matrix = np.vstack([self.catalogue.to_vector(status) for status in event_statuses])
+        event_index = {event_id: i for i, event_id in enumerate(event_ids)}
+        event_cities = np.array(event_cities)
+        city_masks = {city: event_cities == city for city in ALL_CITIES}
+
+        written = 0
+        for start in range(0, len(users), USER_CHUNK):
+            chunk = users[start:start + USER_CHUNK]
+            user_ids = [u[0] for u in chunk]
+            user_matrix = np.vstack([u[2] for u in chunk])
+
+            # Исключаем оценённые события и чужие города
+            seen = self.load_seen(user_ids)
+            seen_mask = np.zeros((len(chunk), len(event_ids)), dtype=bool)
+            for row, (user_id, city, _) in enumerate(chunk):
+                cities = CITY_TABLES.get(city, ALL_CITIES)
+                if len(cities) == 1:
+                    seen_mask[row] = ~city_masks[cities[0]]
+                cols = [event_index[e] for e in seen.get(user_id, ()) if e in event_index]
+                seen_mask[row, cols] = True
+
+            top_idx, top_scores = top_n_scores(user_matrix, event_matrix, seen_mask, TOP_N)
+
+            rows = []
+            for row, user_id in enumerate(user_ids):
+                rank = 0
+                for idx, score in zip(top_idx[row], top_scores[row]):
+                    if not np.isfinite(score):
+                        break  # дальше только исключённые события
+                    rows.append((user_id, rank, event_ids[idx], str(event_cities[idx]), float(score)))
+                    rank += 1
+            self.save(user_ids, rows)
+            written += len(rows)
+
+        self.purge_stale(started_at)
+
+        logger.info(
+            f"Пакетный расчёт: пользователей {len(users)}, событий {len(event_ids)}, "
+            f"категорий {len(self.catalogue)}, строк {written}, {time.monotonic() - started:.1f} с"
+        )
+        return written
+
+
+def bump_generation():
+    """Новое поколение: бот перестаёт отдавать списки, сохранённые до пакетного расчёта."""
+    try:
+        client = redis.Redis(
+            host=os.getenv("REDIS_HOST", "localhost"),
+            port=int(os.getenv("REDIS_PORT", 6379)),
+            socket_connect_timeout=5
+        )
+        client.incr(RECOMMENDATION_GENERATION_KEY)
+    except Exception as e:
+        logger.error(f"Не удалось обновить поколение рекомендаций: {e}")
+
+
+def run_batch(dsn: str, clusters_path: str) -> int:
+    """Полный пакетный расчёт со сменой поколения в Redis; ошибки пробрасываются вызывающему."""
+    batch = RecommendationBatch(dsn, CategoryCatalogue.from_file(clusters_path))
+    try:
+        batch.connect()
+        written = batch.run()
+    finally:
+        batch.close()
+    bump_generation()
+    return written
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s | %(levelname)s | %(message)s')
+
+    DB_DSN = (
+        f"dbname={os.getenv('DB_NAME')} "
+        f"user={os.getenv('DB_USER')} "
+        f"password={os.getenv('DB_PASSWORD')} "
+        f"host={os.getenv('DB_HOST')} "
+        f"port={os.getenv('DB_PORT')} "
+        f"options='-c client_encoding=UTF8'"
+    )
+
+    try:
+        run_batch(DB_DSN, os.getenv("CLUSTERS_PATH", "ai/clusters.json"))
+    except Exception as e:
+        logger.error(f"Ошибка пакетного расчёта рекомендаций: {e}", exc_info=True)
+        raise SystemExit(1)
@@ -0,0 +1,61 @@
+"""
+Паритет ThreadedDatabase_Users с AsyncDatabase_Users на живой БД.
+
+Нужна Postgres со схемой init.sql: TEST_POSTGRES_URI=postgresql://... python -m pytest tests
+Без TEST_POSTGRES_URI тесты пропускаются.
+"""
+import asyncio
+import os
+import secrets
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "bot"))
+
+TEST_DSN = os.getenv("TEST_POSTGRES_URI")
+
+
+@unittest.skipUnless(TEST_DSN, "TEST_POSTGRES_URI не задан")
+class ThreadedInvitationTest(unittest.TestCase):
+    def setUp(self):
+        import psycopg2
+
+        self.token = secrets.token_hex(8)
+        self.conn = psycopg2.connect(TEST_DSN)
+        with self.conn.cursor() as cur:
+            cur.execute(
+                """
+                INSERT INTO invitations (event_id, sender_id, receiver_id, token, status)
+                VALUES (%s, %s, %s, %s, 'sent')
+                """,
+                (1, -1, -2, self.token)
+            )
+        self.conn.commit()
+
+    def tearDown(self):
+        with self.conn.cursor() as cur:
+            cur.execute("DELETE FROM invitations WHERE token = %s", (self.token,))
+        self.conn.commit()
+        self.conn.close()
+
+    def test_get_invitation_by_token_returns_dict(self):
+        from db import ThreadedDatabase_Users
+
+        async def run():
+            # ml_service не нужен для приглашений — MLService не загружается
+            db = ThreadedDatabase_Users(TEST_DSN, ml_service=object(), max_workers=1)
+            try:
+                return await db.get_invitation_by_token(self.token), await db.get_invitation_by_token("missing")
+            finally:
+                await db.close()
+
+        invitation, missing = asyncio.run(run())
+        self.assertIsInstance(invitation, dict)
+        self.assertEqual(invitation["token"], self.token)
+        self.assertEqual(invitation["status"], "sent")
+        self.assertEqual((invitation["sender_id"], invitation["receiver_id"]), (-1, -2))
+        self.assertIsNone(missing)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,203 @@
+"""
+Фоновое обучение RNN рекомендаций вне процесса бота.
+
+Запускается по cron в контейнере events-sync (cronjob, cron-entrypoint.sh): берёт историю like/dislike/confirmed всех пользователей
+из user_event_actions и эмбеддинги событий из events.embedding (pgvector), строит обучающие
+окна так же, как бот собирает вход RNN в MLService.recommend_scored — предыдущие события
+с весом действия, цель: следующее, — и учит RNNModel мини-батчами с паддингом (окна собираются на лету).
+Веса пишутся атомарно в RNN_CHECKPOINT_PATH, бот подхватывает их по mtime (MLService.reload_rnn).
+Что чекпоинт действительно меняет ранжирование, проверяет benchmarks/rnn_ranking.py.
+"""
+import logging
+import os
+import time
+from datetime import datetime, timezone
+from typing import Dict, List, Tuple
+
+import numpy as np
+import psycopg2
+import torch
+import torch.nn as nn
+from dotenv import load_dotenv
+
+from ai.rnn_model import ACTION_WEIGHTS, RNNModel, load_checkpoint, save_checkpoint
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+CHECKPOINT_PATH = os.getenv("RNN_CHECKPOINT_PATH", "/app/data/rnn.pt")
+SEQ_LEN = int(os.getenv("RNN_SEQ_LEN", 15))                   # как Config.RNN_SEQ_LEN у бота
+EPOCHS = int(os.getenv("RNN_TRAIN_EPOCHS", 3))
+BATCH = int(os.getenv("RNN_TRAIN_BATCH", 256))                # окон в мини-батче
+LR = float(os.getenv("RNN_TRAIN_LR", 0.001))
+# Потоки intra-op torch: по умолчанию половина ядер, чтобы не отнимать CPU у бота и синка
+THREADS = int(os.getenv("RNN_TRAIN_THREADS", max(1, (os.cpu_count() or 2) // 2)))
+
+EMBEDDING_DIM = 384
+
+
+def build_sequences(
+    histories: Dict[int, List[Tuple[int, str]]],
+    embeddings: Dict[int, np.ndarray]
+) -> List[np.ndarray]:
+    """Взвешенные векторы событий каждого пользователя (len, dim); события без эмбеддинга пропускаются."""
+    sequences = []
+    for history in histories.values():
+        vectors = [
+            embeddings[event_id] * ACTION_WEIGHTS[action]
+            for event_id, action in history
+            if event_id in embeddings and action in ACTION_WEIGHTS
+        ]
+        if len(vectors) >= 2:
+            sequences.append(np.vstack(vectors).astype(np.float32, copy=False))
+    return sequences
+
+
+def window_index(sequences: List[np.ndarray]) -> np.ndarray:
+    """Все обучающие окна как пары (номер последовательности, позиция цели t ≥ 1)."""
+    pairs = [(s, t) for s, seq in enumerate(sequences) for t in range(1, len(seq))]
+    return np.asarray(pairs, dtype=np.int64).reshape(-1, 2)
+
+
+def make_batch(
+    sequences: List[np.ndarray],
+    pairs: np.ndarray,
+    seq_len: int
+) -> Tuple[torch.Tensor, torch.Tensor, torch.Tensor]:
+    """
+    Мини-батч окон: вход — до seq_len - 1 векторов перед позицией t (паддинг нулями справа),
+    цель — вектор на позиции t. Окна собираются на лету, весь датасет в памяти не раскрывается.
+
+    :return: X (batch, seq_len - 1, dim), lengths (batch,), y (batch, dim)
+    """
+    X = np.zeros((len(pairs), seq_len - 1, EMBEDDING_DIM), dtype=np.float32)
+    lengths = np.zeros(len(pairs), dtype=np.int64)
+    y = np.zeros((len(pairs), EMBEDDING_DIM), dtype=np.float32)
+    for i, (s, t) in enumerate(pairs):
+        window = sequences[s][max(0, t - (seq_len - 1)):t]
+        X[i, :len(window)] = window
+        lengths[i] = len(window)
+        y[i] = sequences[s][t]
+    return torch.from_numpy(X), torch.from_numpy(lengths), torch.from_numpy(y)
+
+
+class RNNTrainer:
+    def __init__(self, dsn: str):
+        self.dsn = dsn
+        self.connection = None
+
+    def connect(self):
+        self.connection = psycopg2.connect(self.dsn)
+
+    def close(self):
+        if self.connection:
+            self.connection.close()
+
+    def load_histories(self) -> Dict[int, List[Tuple[int, str]]]:
+        """Действия всех пользователей в хронологическом порядке: {user_id: [(event_id, action), ...]}."""
+        histories: Dict[int, List[Tuple[int, str]]] = {}
+        with self.connection.cursor(name="rnn_history") as cursor:
+            cursor.itersize = 10000
+            cursor.execute(
+                """
+                SELECT user_id, event_id, action
+                FROM user_event_actions
+                WHERE action = ANY(%s)
+                ORDER BY user_id, timestamp
+                """,
+                (list(ACTION_WEIGHTS),)
+            )
+            for user_id, event_id, action in cursor:
+                histories.setdefault(user_id, []).append((event_id, action))
+        return histories
+
+    def load_embeddings(self, event_ids: List[int]) -> Dict[int, np.ndarray]:
+        """Эмбеддинги событий из events.embedding; события без эмбеддинга пропускаются."""
+        embeddings = {}
+        with self.connection.cursor() as cursor:
+            cursor.execute(
+                """
+                SELECT DISTINCT ON (id) id, embedding::real[]
+                FROM events
+                WHERE id = ANY(%s) AND embedding IS NOT NULL
+                """,
+                (event_ids,)
+            )
+            for event_id, vector in cursor.fetchall():
+                embeddings[event_id] = np.asarray(vector, dtype=np.float32)
+        return embeddings
+
+    def run(self) -> int:
+        started = time.monotonic()
+        torch.set_num_threads(THREADS)
+
+        histories = self.load_histories()
+        event_ids = sorted({event_id for history in histories.values() for event_id, _ in history})
+        embeddings = self.load_embeddings(event_ids) if event_ids else {}
+        sequences = build_sequences(histories, embeddings)
+        pairs = window_index(sequences)
+        if not len(pairs):
+            logger.info("Нет обучающих окон для RNN: чекпоинт не обновлён")
+            return 0
+
+        # Дообучаем прошлые веса, если чекпоинт уже есть
+        if os.path.exists(CHECKPOINT_PATH):
+            model = load_checkpoint(CHECKPOINT_PATH)
+        else:
+            model = RNNModel(input_size=EMBEDDING_DIM)
+        model.train()
+        optimizer = torch.optim.Adam(model.parameters(), lr=LR)
+        criterion = nn.MSELoss()
+
+        generator = torch.Generator().manual_seed(0)
+
+        loss_value = 0.0
+        for epoch in range(EPOCHS):
+            order = torch.randperm(len(pairs), generator=generator).numpy()
+            total, batches = 0.0, 0
+            for start in range(0, len(order), BATCH):
+                X, lengths, y = make_batch(sequences, pairs[order[start:start + BATCH]], SEQ_LEN)
+                optimizer.zero_grad()
+                loss = criterion(model(X, lengths), y)
+                loss.backward()
+                optimizer.step()
+                total += loss.item()
+                batches += 1
+            loss_value = total / batches
+            logger.info(f"RNN: эпоха {epoch + 1}/{EPOCHS}, loss {loss_value:.5f}")
+
+        save_checkpoint(
+            model,
+            CHECKPOINT_PATH,
+            trained_at=datetime.now(timezone.utc).isoformat(),
+            samples=int(len(pairs)),
+            loss=float(loss_value)
+        )
+        logger.info(
+            f"RNN обучена: пользователей {len(sequences)}, окон {len(pairs)}, потоков {THREADS}, "
+            f"{time.monotonic() - started:.1f} с → {CHECKPOINT_PATH}"
+        )
+        return len(pairs)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s | %(levelname)s | %(message)s')
+
+    DB_DSN = (
+        f"dbname={os.getenv('DB_NAME')} "
+        f"user={os.getenv('DB_USER')} "
+        f"password={os.getenv('DB_PASSWORD')} "
+        f"host={os.getenv('DB_HOST')} "
+        f"port={os.getenv('DB_PORT')} "
+        f"options='-c client_encoding=UTF8'"
+    )
+
+    trainer = RNNTrainer(DB_DSN)
+    try:
+        trainer.connect()
+        trainer.run()
+    except Exception as e:
+        logger.error(f"Ошибка обучения RNN: {e}", exc_info=True)
+    finally:
+        trainer.close()